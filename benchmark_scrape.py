@@ -0,0 +1,754 @@
+#!/usr/bin/env python3
+
+# Import modules
+import argparse
+import configparser
+import contextlib
+import csv
+import inspect
+import io
+import json
+import logging
+import os
+import resource
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from re import compile, sub
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from redcap_diff import *
+from regex_target_dir_entries import *
+from neuropsych_summary_scrape_helpers import *
+
+
+# Folders above each synthetic summary sheet, below the root folder, matching the config's `subdirs_regex`
+BENCHMARK_UMMAP_DIRS = ["Clinical Core", "Scoring & Report Materials", "Active Neuropsych Summaries"]
+BENCHMARK_ELECTRA_DIRS = ["ELECTRA", "Have been printed by Data Core"]
+# Folder next to the summary sheet folders that the crawl must skip
+BENCHMARK_SKIPPED_DIR = "Archive"
+BENCHMARK_BOX_ITEM_FIELDS = ("type", "id", "sequence_id", "etag", "name", "path_collection")
+BENCHMARK_MANIFEST_NAME = "benchmark_manifest.json"
+BENCHMARK_REDCAP_TOKENS = {"ummap": "BENCHMARK_UMMAP_TOKEN", "electra": "BENCHMARK_ELECTRA_TOKEN"}
+
+
+def get_anchor_sample_text(anchor):
+    """
+    Get a cell value that a parse map anchor regex matches, e.g., "HVLT Recog Discrim Index" for
+    "(HVLT )?Recog Discrim Index"
+
+    :param anchor: Parse map anchor regex
+    :type anchor: str
+    :rtype: str
+    """
+    anchor_text = anchor.split("|")[0].lstrip("^").rstrip("$")
+    anchor_text = sub(r"\(([^()]*)\)\??", r"\1", anchor_text)
+    anchor_text = anchor_text.replace(".*", "").replace(".", "/")
+    if not compile(anchor).match(anchor_text):
+        raise ValueError(f"Can't build sample text for anchor \"{anchor}\"")
+    return anchor_text
+
+
+def plan_synthetic_sheets(n_sheets, electra_fraction, max_visits, seed):
+    """
+    Plan synthetic summary sheets: participants with up to `max_visits` visits each, some of them ELECTRA participants
+    whose sheets sit in the ELECTRA folder layout
+
+    :param n_sheets: Number of summary sheets
+    :type n_sheets: int
+    :param electra_fraction: Fraction of participants in ELECTRA
+    :type electra_fraction: float
+    :param max_visits: Most visits per participant
+    :type max_visits: int
+    :param seed: Random seed
+    :type seed: int
+    :return: list of dicts with each sheet's `index`, `study`, `ummap_id`, `kg_id`, `visit`, `year`, and `dirs` and
+        `name` below the root folder
+    :rtype: list[dict]
+    """
+    rng = np.random.default_rng(seed)
+    ummap_ids = rng.permutation(np.arange(1000, 10000))
+
+    sheets = []
+    for ummap_id in ummap_ids:
+        ummap_id = int(ummap_id)
+        study = "electra" if rng.random() < electra_fraction else "ummap"
+        kg_id = int(rng.integers(100000, 1000000))
+        first_year = int(rng.integers(2015, 2020))
+        for visit in range(1, int(rng.integers(1, max_visits + 1)) + 1):
+            if len(sheets) >= n_sheets:
+                return sheets
+            year = first_year + visit - 1
+            if study == "ummap":
+                dirs = BENCHMARK_UMMAP_DIRS + [f"Visit {visit}"]
+                name = f"{ummap_id} Score Summary {year}.xlsx"
+            else:
+                dirs = BENCHMARK_ELECTRA_DIRS + [f"ELECTRA Visit {visit}", f"KG{kg_id:06d} - {ummap_id:04d}"]
+                name = f"KG{kg_id:06d}_{ummap_id:04d}_Score_Summary_{year}.xlsx"
+            sheets.append({'index': len(sheets), 'study': study, 'ummap_id': ummap_id, 'kg_id': kg_id,
+                           'visit': visit, 'year': year, 'dirs': dirs, 'name': name})
+    raise ValueError(f"Only {len(ummap_ids)} synthetic participants; lower --n_sheets or raise --max_visits")
+
+
+def get_synthetic_sheet_values(sheet, parse_map, missing_fraction, seed):
+    """
+    Get the raw cell values written for each parse map field of a synthetic summary sheet; the same sheet and seed
+    always give the same values
+
+    :param sheet: Synthetic sheet from `plan_synthetic_sheets`
+    :type sheet: dict
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param missing_fraction: Fraction of score cells left blank or marked "N/A"
+    :type missing_fraction: float
+    :param seed: Random seed
+    :type seed: int
+    :return: dict of field names to cell values; `None` for blank cells
+    :rtype: dict
+    """
+    rng = np.random.default_rng([seed, sheet['index']])
+    sheet_values = {}
+    for field_plan in parse_map.field_plans:
+        if field_plan.dtype == "str":
+            sheet_values[field_plan.field] = str(sheet['ummap_id'])
+        elif rng.random() < missing_fraction:
+            sheet_values[field_plan.field] = "N/A" if rng.random() < 0.5 else None
+        elif field_plan.dtype == "int":
+            sheet_values[field_plan.field] = int(rng.integers(0, 60))
+        else:
+            sheet_values[field_plan.field] = round(float(rng.normal()), 2)
+    return sheet_values
+
+
+def write_synthetic_workbook(sheet_path, parse_map, sheet_values):
+    """
+    Write a summary sheet workbook with each parse map anchor on its own row and the anchor's field values at their
+    row and column offsets
+
+    :param sheet_path: Path of .xlsx file
+    :type sheet_path: str
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param sheet_values: Cell values from `get_synthetic_sheet_values`
+    :type sheet_values: dict
+    """
+    anchor_cells = {}
+    row_idx = 2  # title rows above the first anchor
+    for anchor_plan in parse_map.anchor_plans:
+        row_idx -= min(min(field_plan.row_diff for field_plan in anchor_plan.field_plans), 0)
+        anchor_cells[anchor_plan.anchor] = (row_idx, 0)
+        row_idx += anchor_plan.max_row_diff + 1
+    n_rows = row_idx
+    n_cols = 1 + max(max(field_plan.col_diff for field_plan in parse_map.field_plans), 0)
+
+    sheet_rows = [[None] * n_cols for _ in range(n_rows)]
+    sheet_rows[0][0] = "Neuropsychological Evaluation Score Summary"
+    sheet_rows[1][:3] = ["Test", "Raw Score", "Standard Score"]
+    for anchor_plan in parse_map.anchor_plans:
+        anchor_row_idx, anchor_col_idx = anchor_cells[anchor_plan.anchor]
+        sheet_rows[anchor_row_idx][anchor_col_idx] = get_anchor_sample_text(anchor_plan.anchor)
+        for field_plan in anchor_plan.field_plans:
+            sheet_rows[anchor_row_idx + field_plan.row_diff][anchor_col_idx + field_plan.col_diff] = \
+                sheet_values[field_plan.field]
+
+    workbook = openpyxl.Workbook(write_only=True)
+    worksheet = workbook.create_sheet("Summary")
+    for sheet_row in sheet_rows:
+        worksheet.append(sheet_row)
+    workbook.save(sheet_path)
+
+
+def generate_synthetic_tree(work_dir, parse_map, sheets, missing_fraction, seed):
+    """
+    Write synthetic summary sheets below `work_dir`/root, with a README file next to each and a skipped folder of
+    copies that the crawl must not pick up
+
+    :param work_dir: Benchmark working directory
+    :type work_dir: str
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param sheets: Synthetic sheets from `plan_synthetic_sheets`
+    :type sheets: list[dict]
+    :param missing_fraction: Fraction of score cells left blank or marked "N/A"
+    :type missing_fraction: float
+    :param seed: Random seed
+    :type seed: int
+    :return: path of root directory
+    :rtype: str
+    """
+    root_path = os.path.join(work_dir, "root")
+    for sheet in sheets:
+        sheet_dir_path = os.path.join(root_path, *sheet['dirs'])
+        os.makedirs(sheet_dir_path, exist_ok=True)
+        write_synthetic_workbook(os.path.join(sheet_dir_path, sheet['name']), parse_map,
+                                 get_synthetic_sheet_values(sheet, parse_map, missing_fraction, seed))
+        readme_path = os.path.join(sheet_dir_path, "README.txt")
+        if not os.path.exists(readme_path):
+            with open(readme_path, "w") as readme_file:
+                readme_file.write("Not a summary sheet\n")
+
+    skipped_dir_path = os.path.join(root_path, BENCHMARK_UMMAP_DIRS[0], BENCHMARK_SKIPPED_DIR)
+    os.makedirs(skipped_dir_path, exist_ok=True)
+    for sheet in sheets[:max(len(sheets) // 100, 1)]:
+        shutil.copy(os.path.join(root_path, *sheet['dirs'], sheet['name']), skipped_dir_path)
+
+    return root_path
+
+
+def load_or_generate_synthetic_tree(work_dir, parse_map, generation_args):
+    """
+    Generate synthetic summary sheets in `work_dir`, or reuse the ones already there if they were generated from the
+    same parse map and arguments
+
+    :param work_dir: Benchmark working directory
+    :type work_dir: str
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param generation_args: dict of `n_sheets`, `electra_fraction`, `max_visits`, `missing_fraction`, and `seed`
+    :type generation_args: dict
+    :return: path of root directory, synthetic sheets, and seconds spent generating them (0 if reused)
+    :rtype: (str, list[dict], float)
+    """
+    manifest_path = os.path.join(work_dir, BENCHMARK_MANIFEST_NAME)
+    manifest_key = {'parse_map_digest': get_parse_map_digest(parse_map.parse_dict), **generation_args}
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, "r") as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest['key'] == manifest_key:
+            return os.path.join(work_dir, "root"), manifest['sheets'], 0.0
+        shutil.rmtree(os.path.join(work_dir, "root"), ignore_errors=True)
+
+    start = time.perf_counter()
+    sheets = plan_synthetic_sheets(generation_args['n_sheets'], generation_args['electra_fraction'],
+                                   generation_args['max_visits'], generation_args['seed'])
+    root_path = generate_synthetic_tree(work_dir, parse_map, sheets, generation_args['missing_fraction'],
+                                        generation_args['seed'])
+    generation_seconds = time.perf_counter() - start
+
+    with open(manifest_path, "w") as manifest_file:
+        json.dump({'key': manifest_key, 'sheets': sheets}, manifest_file)
+    return root_path, sheets, generation_seconds
+
+
+def build_expected_raw_dataframe(sheets, parse_map, missing_fraction, seed):
+    """
+    Build the raw dataframe the scrape should get from the synthetic summary sheets, sorted by ptid and event
+
+    :rtype: pandas.DataFrame
+    """
+    accum_rows = RowAccumulator(get_parse_map_column_dtypes(parse_map.parse_dict, {'redcap_event_name': "string"}),
+                                len(sheets))
+    for sheet in sheets:
+        sheet_values = get_synthetic_sheet_values(sheet, parse_map, missing_fraction, seed)
+        raw_values = {field: None if value is None else str(value) for field, value in sheet_values.items()}
+        row_dict = parse_map.convert_raw_field_values(raw_values, sheet['name'], logging.getLogger(__name__))
+        row_dict['redcap_event_name'] = f"visit_{sheet['visit']}_arm_1"
+        accum_rows.append(row_dict)
+    return sort_raw_dataframe(accum_rows.to_dataframe())
+
+
+def sort_raw_dataframe(raw_df):
+    """
+    Sort raw dataframe by ptid and event so dataframes built from different crawl orders can be compared
+    """
+    return raw_df.sort_values(['ptid', 'redcap_event_name']).reset_index(drop=True)
+
+
+############################
+# Fake Box and REDCap APIs #
+
+class FakeBoxItem:
+    """
+    Box file or folder backed by the synthetic tree on disk, with the attributes and methods the scrape uses
+
+    Each folder listing page and each download sleeps `latency` seconds and is recorded in the run metrics as a Box
+    API call.
+    """
+
+    def __init__(self, item_type, item_id, name, local_path, parent_items, latency):
+        self.type = item_type
+        self.id = item_id
+        self.name = name
+        self.sequence_id = "0"
+        self.local_path = local_path
+        self.path_collection = {'entries': list(parent_items)}
+        self.latency = latency
+        if item_type == "file":
+            stat = os.stat(local_path)
+            self.etag = f"{stat.st_mtime_ns}-{stat.st_size}"
+        else:
+            self.etag = None
+
+    @property
+    def response_object(self):
+        return {'type': self.type, 'id': self.id, 'name': self.name, 'sequence_id': self.sequence_id,
+                'etag': self.etag,
+                'path_collection': {'entries': [{'type': path_item.type, 'id': path_item.id, 'name': path_item.name}
+                                                for path_item in self.path_collection['entries']]}}
+
+    def get_items(self, limit=1000, offset=0, marker=None, use_marker=False, fields=None):
+        parent_items = self.path_collection['entries'] + [self]
+        dir_entries = sorted(os.scandir(self.local_path), key=lambda dir_entry: dir_entry.name)
+        for page_start in range(0, max(len(dir_entries), 1), limit):
+            with get_run_metrics().time_operation("box.api"):
+                time.sleep(self.latency)
+            for dir_entry in dir_entries[page_start:page_start + limit]:
+                yield FakeBoxItem("folder" if dir_entry.is_dir() else "file",
+                                  os.path.relpath(dir_entry.path, parent_items[0].local_path),
+                                  dir_entry.name, dir_entry.path, parent_items, self.latency)
+
+    def content(self):
+        with get_run_metrics().time_operation("box.api"):
+            time.sleep(self.latency)
+            with open(self.local_path, "rb") as sheet_file:
+                return sheet_file.read()
+
+
+def get_fake_box_root(root_path, latency):
+    """
+    Get fake root Box folder of the synthetic tree
+
+    :param root_path: Path of root directory of synthetic summary sheets
+    :type root_path: str
+    :param latency: Seconds each fake Box API call takes
+    :type latency: float
+    :rtype: FakeBoxItem
+    """
+    return FakeBoxItem("folder", "0", "root", root_path, [], latency)
+
+
+def build_fake_redcap_records(sheets, incomplete_fraction, seed):
+    """
+    Build fake UMMAP and ELECTRA REDCap records for the synthetic sheets' visits
+
+    UMMAP visit 1 is an in-person initial visit; later visits are in-person or tele-visit follow-ups. Some visits have
+    a form left incomplete, so the completion filter has rows to drop. ELECTRA visits map to the UMMAP visit with the
+    same number.
+
+    :return: dict of "ummap" and "electra" to lists of record dicts with every field in `redcap_fields.json`
+    :rtype: dict[str, list[dict]]
+    """
+    rng = np.random.default_rng([seed, len(sheets)])
+    redcap_records = {'ummap': [], 'electra': []}
+    for sheet in sheets:
+        ptid = normalize_ummap_id(sheet['ummap_id'])
+        packet = "ivp" if sheet['visit'] == 1 else ("fvp" if rng.random() < 0.8 else "tvp")
+        ummap_record = {'ptid': ptid, 'redcap_event_name': f"visit_{sheet['visit']}_arm_1",
+                        'form_date': f"{sheet['year']}-06-01", 'header_complete': "2", 'packet': packet,
+                        'is_complete': rng.random() >= incomplete_fraction}
+        redcap_records['ummap'].append(ummap_record)
+        if sheet['study'] == "electra":
+            redcap_records['electra'].append({'ptid': ptid, 'redcap_event_name': f"sv{sheet['visit']}_arm_1",
+                                              'form_date': f"{sheet['year']}-06-01",
+                                              'ummap_visit_number': str(sheet['visit'])})
+    return redcap_records
+
+
+def get_fake_redcap_field_value(record, field):
+    """
+    Get a fake REDCap record's value of a field; `*_complete` fields of the record's packet are complete ("2") unless
+    the record is marked incomplete, and every other field not set on the record is blank
+    """
+    if field in record:
+        return record[field]
+    if field.endswith("_complete") and field.startswith(record.get('packet', "-") + "_"):
+        return "2" if record['is_complete'] else "0"
+    return ""
+
+
+class FakeRedcapServer:
+    """
+    Local HTTP server answering REDCap API record exports and imports for fake UMMAP and ELECTRA projects
+
+    Each request sleeps `latency` seconds before it's answered. Imported rows are counted but not stored.
+    """
+
+    def __init__(self, redcap_records, latency):
+        self.redcap_records = redcap_records
+        self.latency = latency
+        self.imported_rows = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._get_request_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def api_uri(self):
+        return f"http://127.0.0.1:{self._server.server_port}/api/"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _get_request_handler(self):
+        fake_redcap_server = self
+
+        class FakeRedcapRequestHandler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                request_body = self.rfile.read(int(self.headers['Content-Length'])).decode()
+                request_dict = {key: values[0] for key, values in urllib.parse.parse_qs(request_body).items()}
+                time.sleep(fake_redcap_server.latency)
+                status_code, response_data = fake_redcap_server.handle_request(request_dict)
+                response_body = json.dumps(response_data).encode()
+                self.send_response(status_code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response_body)))
+                self.end_headers()
+                self.wfile.write(response_body)
+
+        return FakeRedcapRequestHandler
+
+    def handle_request(self, request_dict):
+        """
+        Answer a REDCap API request
+
+        :param request_dict: Decoded form fields of request
+        :type request_dict: dict[str, str]
+        :return: HTTP status code and JSON response data
+        :rtype: (int, object)
+        """
+        projects = {token: project for project, token in BENCHMARK_REDCAP_TOKENS.items()}
+        if request_dict.get('token') not in projects or request_dict.get('content') != "record":
+            return 400, {'error': "Unsupported request"}
+
+        if 'data' in request_dict:
+            import_rows = list(csv.DictReader(io.StringIO(request_dict['data'])))
+            with self._lock:
+                self.imported_rows += len(import_rows)
+            return 200, {'count': len({import_row['ptid'] for import_row in import_rows})}
+
+        fields = [field for field in request_dict.get('fields', "").split(",") if field]
+        record_ids = {value for key, value in request_dict.items() if key.startswith("records[")}
+        records = self.redcap_records[projects[request_dict['token']]]
+        return 200, [{field: get_fake_redcap_field_value(record, field)
+                      for field in dict.fromkeys(['ptid', 'redcap_event_name'] + fields)}
+                     for record in records if not record_ids or record['ptid'] in record_ids]
+
+
+##############
+# Benchmarks #
+
+def get_peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Get peak resident set size of this process, or of its largest finished child process, in MB
+
+    :param who: `resource.RUSAGE_SELF` or `resource.RUSAGE_CHILDREN`
+    :rtype: float
+    """
+    max_rss = resource.getrusage(who).ru_maxrss
+    # bytes on macOS, kilobytes elsewhere
+    return max_rss / 2 ** 20 if sys.platform == "darwin" else max_rss / 2 ** 10
+
+
+def build_routed_raw_dataframe(study_registry, build_accum_df, items_list, parse_map, study_visit_indexes,
+                               benchmark_logger, *args):
+    """
+    Route summary sheets to their studies and build each study's raw dataframe in turn, as `main()` does
+
+    :param study_registry: Studies from the config
+    :type study_registry: StudyRegistry
+    :param build_accum_df: `box_build_accum_df` or `local_build_accum_df`
+    :param items_list: Box File objects or DirEntry objects of summary sheets
+    :type items_list: list
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param study_visit_indexes: dict of study name to visit index, for studies mapped by visit index
+    :type study_visit_indexes: dict[str, FrozenDict]
+    :param args: Arguments of `build_accum_df` after `nss_logger`
+    :rtype: pandas.DataFrame
+    """
+    study_items = study_registry.route_items(items_list, benchmark_logger)
+    return pd.concat([build_accum_df(study_items[study.name], parse_map, study_visit_indexes.get(study.name),
+                                     benchmark_logger, *args, study=study)
+                      for study in study_registry], ignore_index=True)
+
+
+def run_benchmark(benchmark_results, benchmark_name, count_items, benchmark_function, *args, **kwargs):
+    """
+    Time one call of `benchmark_function`, recording its throughput and the peak RSS so far
+
+    Peak RSS only ever grows, so it's that of the costliest benchmark run up to and including this one. The function's
+    stdout is discarded.
+
+    :param benchmark_results: list that the benchmark's result dict is appended to
+    :type benchmark_results: list[dict]
+    :param benchmark_name: Name of benchmark
+    :type benchmark_name: str
+    :param count_items: Number of items processed, or function of the benchmark function's return value giving it
+    :return: return value of `benchmark_function`
+    """
+    print(f"Benchmarking {benchmark_name}...")
+    start = time.perf_counter()
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        result = benchmark_function(*args, **kwargs)
+    seconds = time.perf_counter() - start
+    n_items = count_items(result) if callable(count_items) else count_items
+    benchmark_results.append({
+        'name': benchmark_name,
+        'items': n_items,
+        'seconds': round(seconds, 3),
+        'items_per_second': round(n_items / seconds, 1) if seconds else None,
+        'peak_rss_mb': round(get_peak_rss_mb(), 1),
+        'peak_children_rss_mb': round(get_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+    })
+    return result
+
+
+def run_transform_benchmarks(benchmark_results, raw_df, ummap_df, completion_rules, nacc_fields_dict):
+    """
+    Time the cleaning, visit lookup, transforming, and filtering steps that `main()` runs on the raw dataframe
+
+    :return: DataFrame of importable records
+    :rtype: pandas.DataFrame
+    """
+    def clean_raw_df():
+        clean_df = raw_df.copy().dropna(subset=['redcap_event_name'])
+        clean_df['ptid'] = normalize_ummap_ids(clean_df['ptid'])
+        front_cols = ['ptid', 'redcap_event_name']
+        return clean_df[front_cols + [col for col in clean_df.columns if col not in front_cols]]
+
+    def get_visit_types():
+        clean_df['visit_type'] = ummap_visit_index.get_visit_types(ummap_visit_positions)
+        return clean_df
+
+    clean_df = run_benchmark(benchmark_results, "transform.clean", len, clean_raw_df)
+    ummap_visit_index = run_benchmark(benchmark_results, "transform.visit_index", len, RedcapVisitIndex, ummap_df,
+                                      completion_rules)
+    ummap_visit_positions = run_benchmark(benchmark_results, "transform.visit_lookup", len,
+                                          ummap_visit_index.get_positions, clean_df['ptid'],
+                                          clean_df['redcap_event_name'])
+    clean_df = run_benchmark(benchmark_results, "transform.visit_type", len, get_visit_types)
+    transformed_df = run_benchmark(benchmark_results, "transform.add_prefixes", len, add_prefixes_to_fu_visits,
+                                   clean_df, nacc_fields_dict['nacc_fvp_cols'], nacc_fields_dict['nacc_tvp_cols'])
+
+    def filter_completed_forms():
+        importable_df = ummap_visit_index.filter_completed(transformed_df, ummap_visit_positions)
+        return importable_df.drop(columns=["visit_type"] + NON_TVP_TELE_VISIT_COLUMNS)
+
+    return run_benchmark(benchmark_results, "transform.filter_completed", len, filter_completed_forms)
+
+
+def format_benchmark_table(benchmark_results):
+    """
+    Format benchmark results as a plain text table
+
+    :param benchmark_results: list of result dicts from `run_benchmark`
+    :type benchmark_results: list[dict]
+    :rtype: str
+    """
+    lines = [f"{'Benchmark':<32}{'Items':>9}{'Seconds':>10}{'Items/s':>12}{'Peak MB':>10}{'Child MB':>10}"]
+    for result in benchmark_results:
+        items_per_second = f"{result['items_per_second']:>12.1f}" if result['items_per_second'] is not None \
+            else f"{'-':>12}"
+        lines.append(f"{result['name']:<32}{result['items']:>9}{result['seconds']:>10.2f}{items_per_second}"
+                     f"{result['peak_rss_mb']:>10.1f}{result['peak_children_rss_mb']:>10.1f}")
+    return "\n".join(lines)
+
+
+def main():
+
+    # Get app path from where this file sits
+    filename = inspect.getframeinfo(inspect.currentframe()).filename
+    app_path = os.path.dirname(os.path.abspath(filename))
+
+    # Parse args
+    def str2bool(val):
+        if isinstance(val, bool):
+            return val
+        elif val.lower() in ('yes', 'true', 't', 'y', '1'):
+            return True
+        elif val.lower() in ('no', 'false', 'f', 'n', '0'):
+            return False
+        else:
+            raise argparse.ArgumentTypeError('Boolean value expected.')
+
+    parser = argparse.ArgumentParser(description="Benchmark the Neuropsych Summary Scrape on synthetic summary "
+                                                 "sheets with fake Box and REDCap backends.")
+    parser.add_argument('-a', '--app_path', required=False,
+                        help=f"absolute path to local directory containing app")
+    parser.add_argument('-n', '--n_sheets', type=int, default=500,
+                        help=f"number of synthetic summary sheets")
+    parser.add_argument('--electra_fraction', type=float, default=0.2,
+                        help=f"fraction of participants whose sheets use the ELECTRA naming and folder layout")
+    parser.add_argument('--max_visits', type=int, default=5,
+                        help=f"most visits per participant")
+    parser.add_argument('--missing_fraction', type=float, default=0.05,
+                        help=f"fraction of score cells left blank or marked N/A")
+    parser.add_argument('--incomplete_fraction', type=float, default=0.1,
+                        help=f"fraction of REDCap visits with an incomplete form")
+    parser.add_argument('--seed', type=int, default=0,
+                        help=f"random seed")
+    parser.add_argument('-w', '--work_dir', required=False,
+                        help=f"directory for synthetic sheets and extracts; sheets already generated there with the "
+                             f"same arguments are reused (default: a temporary directory)")
+    parser.add_argument('--keep_files',
+                        type=str2bool, nargs='?', const=True, default=False,
+                        help=f"keep the temporary directory")
+    parser.add_argument('--box_latency', type=float, default=0.02,
+                        help=f"seconds each fake Box API call takes")
+    parser.add_argument('--redcap_latency', type=float, default=0.05,
+                        help=f"seconds each fake REDCap API call takes")
+    parser.add_argument('--box_crawl_workers', type=int, default=1)
+    parser.add_argument('--box_page_size', type=int, default=1000)
+    parser.add_argument('--box_download_workers', type=int, default=1)
+    parser.add_argument('--sheet_parse_workers', type=int, default=1)
+    parser.add_argument('--sheet_reader', choices=sorted(SUMM_SHEET_READERS), default="openpyxl")
+    parser.add_argument('--redcap_export_batch_size', type=int, default=0)
+    parser.add_argument('--redcap_export_workers', type=int, default=1)
+    parser.add_argument('--redcap_compact_dtypes',
+                        type=str2bool, nargs='?', const=True, default=False,
+                        help=f"load REDCap data with categorical PTIDs and event names and int8 completion codes")
+    parser.add_argument('--redcap_import_chunk_size', type=int, default=200)
+    parser.add_argument('--redcap_import_workers', type=int, default=1)
+    parser.add_argument('--verify',
+                        type=str2bool, nargs='?', const=True, default=True,
+                        help=f"check that the scraped raw dataframes match the synthetic sheets")
+    parser.add_argument('-o', '--output', required=False,
+                        help=f"path of JSON file to write benchmark results to")
+    args = parser.parse_args()
+    if args.app_path:
+        app_path = args.app_path
+
+    # Read studies from config, or from the config template if there's no config
+    config = configparser.ConfigParser()
+    config_path = f"{app_path}/resources/config/config.cfg"
+    config.read(config_path if os.path.isfile(config_path) else f"{config_path}.template")
+    with open(f"{app_path}/resources/json/redcap_fields.json", "r") as redcap_fields_file:
+        redcap_fields_dict = json.load(redcap_fields_file)
+    study_registry = load_study_registry(config, redcap_fields_dict)
+    subdirs_regex = study_registry.subdirs_regex
+    xlsx_regex = study_registry.xlsx_regex
+
+    parse_map = load_parse_map(f"{app_path}/resources/json/parse_map.json")
+    completion_rules = load_completion_rules(f"{app_path}/resources/json/completion_rules.json")
+    with open(f"{app_path}/resources/json/nacc_fields.json", "r") as nacc_fields_file:
+        nacc_fields_dict = json.load(nacc_fields_file)
+
+    is_temp_work_dir = not args.work_dir
+    work_dir = tempfile.mkdtemp(prefix="nss_benchmark_") if is_temp_work_dir else args.work_dir
+    os.makedirs(work_dir, exist_ok=True)
+
+    benchmark_logger = logging.getLogger("neuropsych_summary_scrape_benchmark")
+    benchmark_logger.setLevel(logging.INFO)
+    benchmark_logger.addHandler(logging.FileHandler(os.path.join(work_dir, "benchmark.log")))
+
+    try:
+        # Generate synthetic summary sheets and fake REDCap records
+        print(f"Generating {args.n_sheets} synthetic summary sheets in {work_dir}...")
+        generation_args = {'n_sheets': args.n_sheets, 'electra_fraction': args.electra_fraction,
+                           'max_visits': args.max_visits, 'missing_fraction': args.missing_fraction,
+                           'seed': args.seed}
+        root_path, sheets, generation_seconds = load_or_generate_synthetic_tree(work_dir, parse_map, generation_args)
+        redcap_records = build_fake_redcap_records(sheets, args.incomplete_fraction, args.seed)
+
+        benchmark_results = []
+        with FakeRedcapServer(redcap_records, args.redcap_latency) as redcap_server:
+
+            # REDCap exports
+            redcap_dfs = {}
+            for study in study_registry:
+                if study.redcap_api_uri is not None:
+                    redcap_dfs[study.name] = run_benchmark(benchmark_results, f"redcap.export_{study.name}", len,
+                                                           retrieve_redcap_dataframe, redcap_server.api_uri,
+                                                           BENCHMARK_REDCAP_TOKENS[study.name], study.redcap_fields,
+                                                           vp=False, batch_size=args.redcap_export_batch_size,
+                                                           max_workers=args.redcap_export_workers,
+                                                           typed=args.redcap_compact_dtypes)
+            ummap_df = redcap_dfs[study_registry.target_study.name]
+            study_visit_indexes = {study.name: build_electra_visit_index(redcap_dfs[study.name],
+                                                                         study.visit_index_field)
+                                   for study in study_registry if study.event_mapping == "visit_index"}
+
+            # Box crawl and scrape
+            box_items_list = run_benchmark(benchmark_results, "box.crawl", len, extract_regexed_box_subitems,
+                                           get_fake_box_root(root_path, args.box_latency), subdirs_regex,
+                                           xlsx_regex, BENCHMARK_BOX_ITEM_FIELDS, args.box_crawl_workers,
+                                           args.box_page_size)
+            box_raw_df = run_benchmark(benchmark_results, "box.build_accum_df", len(box_items_list),
+                                       build_routed_raw_dataframe, study_registry, box_build_accum_df,
+                                       box_items_list, parse_map, study_visit_indexes, benchmark_logger, None,
+                                       args.box_download_workers, args.sheet_parse_workers, args.sheet_reader)
+
+            # Local crawl and scrape
+            dir_entries_list = run_benchmark(benchmark_results, "local.crawl", len, extract_regexed_dir_entries,
+                                             root_path, subdirs_regex, xlsx_regex)
+            local_raw_df = run_benchmark(benchmark_results, "local.build_accum_df", len(dir_entries_list),
+                                         build_routed_raw_dataframe, study_registry, local_build_accum_df,
+                                         dir_entries_list, parse_map, study_visit_indexes, benchmark_logger, None,
+                                         args.sheet_parse_workers, args.sheet_reader)
+
+            if args.verify:
+                print("Verifying raw dataframes...")
+                expected_raw_df = build_expected_raw_dataframe(sheets, parse_map, args.missing_fraction, args.seed)
+                for raw_df_name, raw_df in (("box", box_raw_df), ("local", local_raw_df)):
+                    try:
+                        pd.testing.assert_frame_equal(sort_raw_dataframe(raw_df), expected_raw_df)
+                    except AssertionError as e:
+                        raise AssertionError(f"Raw dataframe from {raw_df_name} doesn't match synthetic sheets; {e}")
+
+            # Transform steps of `main()`
+            importable_df = run_transform_benchmarks(benchmark_results, box_raw_df, ummap_df, completion_rules,
+                                                     nacc_fields_dict)
+
+            # Extract write
+            extract_csv_path = os.path.join(work_dir, "neuropsych_scrape_data.csv")
+
+            def write_extract():
+                with ExtractWriter(extract_csv_path,
+                                   get_extract_column_dtypes(parse_map.parse_dict, importable_df.columns.tolist()),
+                                   chunk_size=EXTRACT_DEFAULT_CHUNK_SIZE) as importable_extract_writer:
+                    importable_extract_writer.write_dataframe(importable_df)
+
+            run_benchmark(benchmark_results, "extract.write_csv", len(importable_df), write_extract)
+
+            # REDCap round trips: diff against current values, then import
+            baseline_df = run_benchmark(benchmark_results, "redcap.export_baseline", len,
+                                        export_redcap_baseline_dataframe, redcap_server.api_uri,
+                                        BENCHMARK_REDCAP_TOKENS['ummap'], importable_df, vp=False,
+                                        batch_size=args.redcap_export_batch_size or REDCAP_DEFAULT_BATCH_SIZE,
+                                        max_workers=args.redcap_export_workers)
+            run_benchmark(benchmark_results, "redcap.diff", len(importable_df), diff_redcap_records, importable_df,
+                          baseline_df)
+            run_benchmark(benchmark_results, "redcap.import", len(importable_df), import_redcap_dataframe,
+                          redcap_server.api_uri, BENCHMARK_REDCAP_TOKENS['ummap'], importable_df, benchmark_logger,
+                          vp=False, chunk_size=args.redcap_import_chunk_size, max_workers=args.redcap_import_workers)
+            if redcap_server.imported_rows != len(importable_df):
+                raise AssertionError(f"Fake REDCap got {redcap_server.imported_rows} rows; "
+                                     f"expected {len(importable_df)}")
+
+        # Print and save results
+        print(f"Generated {len(sheets)} sheets in {generation_seconds:.1f} s" if generation_seconds
+              else f"Reused {len(sheets)} sheets from {work_dir}")
+        print(format_benchmark_table(benchmark_results))
+        if args.output:
+            with open(args.output, "w") as output_file:
+                json.dump({'args': vars(args), 'generation_seconds': round(generation_seconds, 3),
+                           'benchmarks': benchmark_results, 'run_report': get_run_metrics().to_report()},
+                          output_file, indent=2)
+
+    finally:
+        for handler in list(benchmark_logger.handlers):
+            benchmark_logger.removeHandler(handler)
+            handler.close()
+        if is_temp_work_dir and not args.keep_files:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    print("Done.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+import json
+import os
+from re import match
+
+from regex_target_dir_entries import box_object_from_json, box_object_to_json
+
+
+# Box event types that remove a file from view; any other file event may have created, changed, moved, or renamed it
+BOX_FILE_REMOVED_EVENT_TYPES = frozenset(["ITEM_TRASH"])
+
+
+def load_box_events_state(state_path, box_folder_id, subdirs_rgx, file_rgx):
+    """
+    Load Box events stream position and summary sheet manifest saved by the previous run
+
+    An empty state is returned if there's no state file, if it can't be read, or if it was saved for a different root
+    folder or different regular expressions.
+
+    :param state_path: Path of Box events state JSON file
+    :type state_path: str
+    :param box_folder_id: ID of root Box folder
+    :type box_folder_id: str
+    :param subdirs_rgx: regular expression to match subdirectories
+    :param file_rgx: regular expression to match leaf files
+    :return: Box events state
+    :rtype: dict
+    """
+    empty_state = {
+        'box_folder_id': box_folder_id,
+        'subdirs_regex': getattr(subdirs_rgx, 'pattern', subdirs_rgx),
+        'file_regex': getattr(file_rgx, 'pattern', file_rgx),
+        'stream_position': None,
+        'items': {},
+    }
+    if not os.path.isfile(state_path):
+        return empty_state
+
+    try:
+        with open(state_path, "r") as state_file:
+            events_state = json.load(state_file)
+    except (OSError, ValueError):
+        return empty_state
+
+    if any(events_state.get(key) != empty_state[key] for key in ('box_folder_id', 'subdirs_regex', 'file_regex')):
+        return empty_state
+
+    return events_state
+
+
+def save_box_events_state(state_path, events_state):
+    """
+    Save Box events state to JSON file, replacing the old file only once the new one is fully written
+
+    :param state_path: Path of Box events state JSON file
+    :type state_path: str
+    :param events_state: Box events state
+    :type events_state: dict
+    """
+    tmp_state_path = f"{state_path}.tmp"
+    with open(tmp_state_path, "w") as state_file:
+        json.dump(events_state, state_file)
+    os.replace(tmp_state_path, state_path)
+
+
+def set_box_events_state_items(events_state, stream_position, box_items_list):
+    """
+    Replace the summary sheet manifest of a Box events state, e.g., after a full crawl
+
+    :param events_state: Box events state
+    :type events_state: dict
+    :param stream_position: Box events stream position taken before the crawl started
+    :param box_items_list: Box File objects of every summary sheet
+    """
+    events_state['stream_position'] = stream_position
+    events_state['items'] = {box_item.id: box_object_to_json(box_item) for box_item in box_items_list}
+
+
+def iter_box_events(box_client, stream_position, limit=500):
+    """
+    Generate Box events since `stream_position`, paging until the stream is exhausted
+
+    Box can return a page with fewer events than `limit` while more events remain, so paging only stops at an empty
+    page. The stream position to resume from next time is the `next_stream_position` of the last page; it's returned
+    as the generator's return value.
+
+    :param box_client: Authenticated Box client
+    :param stream_position: Box events stream position to start from
+    :param limit: Number of events to request per page
+    :type limit: int
+    :return: generator of Box Event objects
+    """
+    while True:
+        events_page = box_client.events().get_events(limit=limit, stream_position=stream_position)
+        stream_position = events_page['next_stream_position']
+        if not events_page['entries']:
+            return stream_position
+        for event in events_page['entries']:
+            yield event
+
+
+def is_regexed_box_file(box_file, box_folder_id, subdirs_rgx, file_rgx):
+    """
+    Check whether a Box file sits below `box_folder_id` in subdirectories whose names match `subdirs_rgx`, and
+    whether its name matches `file_rgx`
+
+    :param box_file: Box File object with `name` and `path_collection` fields
+    :param box_folder_id: ID of root Box folder
+    :type box_folder_id: str
+    :param subdirs_rgx: regular expression to match subdirectories
+    :param file_rgx: regular expression to match leaf files
+    :rtype: bool
+    """
+    if not match(file_rgx, box_file.name):
+        return False
+    path_entries = box_file.path_collection['entries']
+    path_folder_ids = [path_entry.id for path_entry in path_entries]
+    if box_folder_id not in path_folder_ids:
+        return False
+    subdir_entries = path_entries[path_folder_ids.index(box_folder_id) + 1:]
+    return all(match(subdirs_rgx, subdir_entry.name) for subdir_entry in subdir_entries)
+
+
+def discover_box_events_changes(box_client, events_state, box_folder_id, subdirs_rgx, file_rgx, fields, limit=500):
+    """
+    Apply Box events since the saved stream position to the saved summary sheet manifest
+
+    Summary sheets that were created, modified, or deleted are worked out from file events alone. Folder events can
+    move or rename many sheets at once, so a folder event means a full crawl is needed if the folder is above a known
+    sheet, or if it now sits below the root folder or a folder above a known sheet; in that case `None` is returned
+    and `events_state` is left unchanged.
+
+    :param box_client: Authenticated Box client
+    :param events_state: Box events state loaded with `load_box_events_state`; must have a stream position
+    :type events_state: dict
+    :param box_folder_id: ID of root Box folder
+    :type box_folder_id: str
+    :param subdirs_rgx: regular expression to match subdirectories
+    :param file_rgx: regular expression to match leaf files
+    :param fields: Box item fields to request for files and folders whose event doesn't include their path
+    :param limit: Number of events to request per page
+    :type limit: int
+    :return: dict of "created", "modified", and "deleted" lists of Box item IDs, or `None` if a full crawl is needed
+    :rtype: dict[str, list[str]]
+    """
+    # the root folder and the folders between it and known sheets; folders above the root don't bound the tree
+    known_folder_ids = {box_folder_id}
+    for item_json in events_state['items'].values():
+        path_folder_ids = [path_entry['id'] for path_entry in item_json['path_collection']['entries']]
+        if box_folder_id in path_folder_ids:
+            known_folder_ids.update(path_folder_ids[path_folder_ids.index(box_folder_id):])
+
+    items = dict(events_state['items'])
+    created_ids, modified_ids, deleted_ids = set(), set(), set()
+    events_iter = iter_box_events(box_client, events_state['stream_position'], limit)
+    while True:
+        try:
+            event = next(events_iter)
+        except StopIteration as stop:
+            stream_position = stop.value
+            break
+        source = event['source']
+        if source is None or source.type not in ("file", "folder"):
+            continue
+
+        is_removed = event['event_type'] in BOX_FILE_REMOVED_EVENT_TYPES
+
+        if source.type == "folder":
+            if source.id in known_folder_ids:
+                return None
+            if is_removed:
+                continue
+            # a folder moved or renamed into the tree can bring sheets that have no file events of their own
+            if getattr(source, 'path_collection', None) is None:
+                try:
+                    source = box_client.folder(folder_id=source.id).get(fields=fields)
+                except Exception:
+                    continue
+            if any(path_entry.id in known_folder_ids for path_entry in source.path_collection['entries']):
+                return None
+            continue
+
+        # event sources aren't guaranteed to carry `path_collection`, so fetch the file's fields when it's missing
+        if not is_removed and getattr(source, 'path_collection', None) is None:
+            try:
+                source = box_client.file(file_id=source.id).get(fields=fields)
+            except Exception:
+                is_removed = True
+
+        if not is_removed and is_regexed_box_file(source, box_folder_id, subdirs_rgx, file_rgx):
+            if source.id in events_state['items'] or source.id in modified_ids:
+                modified_ids.add(source.id)
+            else:
+                created_ids.add(source.id)
+            deleted_ids.discard(source.id)
+            items[source.id] = box_object_to_json(source)
+        elif source.id in items:
+            if source.id in created_ids:
+                created_ids.discard(source.id)
+            else:
+                deleted_ids.add(source.id)
+            modified_ids.discard(source.id)
+            del items[source.id]
+
+    events_state['stream_position'] = stream_position
+    events_state['items'] = items
+
+    return {'created': sorted(created_ids), 'modified': sorted(modified_ids), 'deleted': sorted(deleted_ids)}
+
+
+def get_box_events_state_items(box_client, events_state):
+    """
+    Get Box File objects of every summary sheet in a Box events state's manifest
+
+    :param box_client: Authenticated Box client
+    :param events_state: Box events state
+    :type events_state: dict
+    :return: list Box File objects
+    """
+    return [box_object_from_json(box_client, item_json) for item_json in events_state['items'].values()]
@@ -0,0 +1,56 @@
+import hashlib
+
+
+# Bytes read at a time when hashing a file
+CONTENT_HASH_CHUNK_SIZE = 2 ** 20
+
+
+def hash_file_sha1(file_path):
+    """
+    Get the SHA-1 hex digest of a file's contents, the same digest Box gives in a file's `sha1` field
+
+    :param file_path: Path of file
+    :type file_path: str
+    :rtype: str
+    """
+    sha1 = hashlib.sha1()
+    with open(file_path, "rb") as content_file:
+        for chunk in iter(lambda: content_file.read(CONTENT_HASH_CHUNK_SIZE), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def dedupe_by_content(items, content_hashes, preference_keys):
+    """
+    Keep one item of each group of items with the same contents
+
+    Which copy is kept doesn't depend on the order of `items`: it's the copy with the smallest preference key. Items
+    without a content hash are always kept.
+
+    :param items: Items, e.g., Box File objects or DirEntry objects
+    :type items: list
+    :param content_hashes: Content hash of each item, or `None` if unknown
+    :type content_hashes: list[str]
+    :param preference_keys: Sortable key of each item; the copy with the smallest key is kept
+    :type preference_keys: list
+    :return: kept items in their original order, and a list of dicts of each duplicated `sha1` with the index of the
+        `kept` item and the indices of its `duplicates` in `items`, in order of the kept items
+    :rtype: (list, list[dict])
+    """
+    item_idxs_by_hash = {}
+    for item_idx, content_hash in enumerate(content_hashes):
+        if content_hash:
+            item_idxs_by_hash.setdefault(content_hash, []).append(item_idx)
+
+    dropped_item_idxs = set()
+    duplicate_groups = []
+    for content_hash, item_idxs in item_idxs_by_hash.items():
+        if len(item_idxs) < 2:
+            continue
+        item_idxs = sorted(item_idxs, key=lambda item_idx: preference_keys[item_idx])
+        dropped_item_idxs.update(item_idxs[1:])
+        duplicate_groups.append({'sha1': content_hash, 'kept': item_idxs[0], 'duplicates': item_idxs[1:]})
+
+    duplicate_groups.sort(key=lambda duplicate_group: duplicate_group['kept'])
+    kept_items = [item for item_idx, item in enumerate(items) if item_idx not in dropped_item_idxs]
+    return kept_items, duplicate_groups
@@ -0,0 +1,175 @@
+import os
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from row_accumulator import *
+
+
+EXTRACT_DEFAULT_CHUNK_SIZE = 1000
+
+# Arrow types for the nullable pandas dtypes of extract columns; any other column is written as strings
+PANDAS_DTYPE_ARROW_TYPES = {
+    "Int64": "int64",
+    "Float64": "float64",
+    "string": "string",
+}
+
+
+def is_parquet_available():
+    """
+    Check whether `pyarrow` is installed, so extracts can be written to Parquet files
+
+    :rtype: bool
+    """
+    return pyarrow is not None
+
+
+def get_extract_column_dtypes(parse_dict, columns, prefixes=("fu_", "tele_")):
+    """
+    Get nullable pandas dtypes for extract columns, giving prefixed NACC columns the dtype of their parse map field
+
+    :param parse_dict: Parse map loaded from `parse_map.json`
+    :type parse_dict: dict
+    :param columns: Extract columns
+    :type columns: list[str]
+    :param prefixes: Prefixes added to parse map fields by `add_prefixes_to_fu_visits`
+    :type prefixes: tuple[str]
+    :return: dict of column names to pandas dtypes; columns not in the parse map are "string"
+    :rtype: dict[str, str]
+    """
+    parse_map_dtypes = get_parse_map_column_dtypes(parse_dict)
+    column_dtypes = {}
+    for column in columns:
+        field = column
+        for prefix in prefixes:
+            if column.startswith(prefix) and column[len(prefix):] in parse_map_dtypes:
+                field = column[len(prefix):]
+                break
+        column_dtypes[column] = parse_map_dtypes.get(field, "string")
+    return column_dtypes
+
+
+def get_arrow_schema(column_dtypes):
+    """
+    Get Arrow schema for extract columns
+
+    :param column_dtypes: dict of column names to pandas dtypes
+    :type column_dtypes: dict[str, str]
+    :rtype: pyarrow.Schema
+    """
+    return pyarrow.schema([(column, getattr(pyarrow, PANDAS_DTYPE_ARROW_TYPES.get(dtype, "string"))())
+                           for column, dtype in column_dtypes.items()])
+
+
+class ExtractWriter:
+    """
+    Write extract rows to a CSV file, and optionally a Parquet file, one chunk at a time
+
+    Rows can be appended one by one as they're built or written as whole DataFrames; either way only `chunk_size`
+    rows are buffered before being written out. Each file is written under a temporary name and only replaces the old
+    file once `close` is called without error, so a failed run never leaves a half-written extract behind.
+    """
+
+    def __init__(self, csv_path, column_dtypes, parquet_path=None, chunk_size=EXTRACT_DEFAULT_CHUNK_SIZE):
+        """
+        :param csv_path: Path of extract CSV file
+        :type csv_path: str
+        :param column_dtypes: dict of extract column names to pandas dtypes, in output order
+        :type column_dtypes: dict[str, str]
+        :param parquet_path: Path of extract Parquet file; if not passed, no Parquet file is written
+        :type parquet_path: str
+        :param chunk_size: Number of rows buffered per chunk
+        :type chunk_size: int
+        """
+        if parquet_path and not is_parquet_available():
+            raise ImportError("pyarrow is needed to write Parquet extracts")
+
+        self.csv_path = csv_path
+        self.parquet_path = parquet_path
+        self.column_dtypes = dict(column_dtypes)
+        self.chunk_size = max(chunk_size, 1)
+        self.n_rows = 0
+        self._accum_rows = RowAccumulator(self.column_dtypes, self.chunk_size)
+        self._csv_file = open(f"{csv_path}.tmp", "w", newline="")
+        self._is_csv_header_written = False
+        self._parquet_writer = None
+        if parquet_path:
+            self._parquet_schema = get_arrow_schema(self.column_dtypes)
+            self._parquet_writer = pyarrow.parquet.ParquetWriter(f"{parquet_path}.tmp", self._parquet_schema)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def append(self, row_dict):
+        """
+        Append an extract row, writing out the buffered chunk once it's full
+
+        :param row_dict: dict of column names to values
+        :type row_dict: dict
+        """
+        self._accum_rows.append(row_dict)
+        if len(self._accum_rows) >= self.chunk_size:
+            self.flush()
+
+    def write_dataframe(self, df):
+        """
+        Write a DataFrame of extract rows in chunks of `chunk_size` rows
+
+        :param df: DataFrame with the writer's columns
+        :type df: pandas.DataFrame
+        """
+        self.flush()
+        for chunk_start in range(0, len(df), self.chunk_size):
+            self._write_chunk(df.iloc[chunk_start:chunk_start + self.chunk_size])
+
+    def flush(self):
+        """
+        Write out buffered rows
+        """
+        if len(self._accum_rows):
+            self._write_chunk(self._accum_rows.to_dataframe())
+            self._accum_rows = RowAccumulator(self.column_dtypes, self.chunk_size)
+
+    def _write_chunk(self, chunk_df):
+        chunk_df = chunk_df[list(self.column_dtypes)].astype(self.column_dtypes)
+        chunk_df.to_csv(self._csv_file, header=not self._is_csv_header_written, index=False)
+        self._is_csv_header_written = True
+        if self._parquet_writer is not None:
+            self._parquet_writer.write_table(
+                pyarrow.Table.from_pandas(chunk_df, schema=self._parquet_schema, preserve_index=False))
+        self.n_rows += len(chunk_df)
+
+    def close(self):
+        """
+        Write out buffered rows and move the finished files into place
+        """
+        self.flush()
+        if not self._is_csv_header_written:
+            pd.DataFrame(columns=list(self.column_dtypes)).to_csv(self._csv_file, index=False)
+        self._csv_file.close()
+        os.replace(f"{self.csv_path}.tmp", self.csv_path)
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            os.replace(f"{self.parquet_path}.tmp", self.parquet_path)
+
+    def abort(self):
+        """
+        Discard the partly written files
+        """
+        self._csv_file.close()
+        os.remove(f"{self.csv_path}.tmp")
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+            os.remove(f"{self.parquet_path}.tmp")
+
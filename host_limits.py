@@ -0,0 +1,147 @@
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
+
+from run_metrics import get_run_metrics
+
+
+# Longest wait taken from a `Retry-After` header, so a bad header can't stall a run
+HOST_MAX_RETRY_AFTER_SECONDS = 300
+HOST_DEFAULT_RETRY_AFTER_SECONDS = 1.0
+
+
+class HostLimiter:
+    """
+    Cap the number of concurrent requests to one host, and hold back every request to the host while it's rate
+    limiting us
+
+    Shared by every thread and session talking to the host, so one 429 response pauses all of them, not just the
+    request that got it.
+    """
+
+    def __init__(self, max_concurrent_requests=0):
+        """
+        :param max_concurrent_requests: Most requests in flight at once; 0 for no limit
+        :type max_concurrent_requests: int
+        """
+        self.max_concurrent_requests = max_concurrent_requests
+        self._semaphore = threading.BoundedSemaphore(max_concurrent_requests) if max_concurrent_requests > 0 \
+            else None
+        self._resume_time = 0.0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def limit(self):
+        """
+        Wait out any pause and for a free request slot, and hold the slot for the duration of the block
+        """
+        while True:
+            with self._lock:
+                wait_seconds = self._resume_time - time.monotonic()
+            if wait_seconds <= 0:
+                break
+            time.sleep(wait_seconds)
+        if self._semaphore is None:
+            yield
+            return
+        with self._semaphore:
+            yield
+
+    def pause(self, seconds):
+        """
+        Hold back requests to the host for `seconds`, unless they're already held back longer
+
+        :param seconds: Seconds to pause
+        :type seconds: float
+        """
+        with self._lock:
+            self._resume_time = max(self._resume_time, time.monotonic() + seconds)
+
+
+_host_limiters = {}
+_host_limiters_lock = threading.Lock()
+_max_concurrent_requests_per_host = 0
+
+
+def set_max_concurrent_requests_per_host(max_concurrent_requests):
+    """
+    Set the most concurrent requests to any one host, for hosts whose limiters haven't been created yet
+
+    :param max_concurrent_requests: Most requests in flight at once; 0 for no limit
+    :type max_concurrent_requests: int
+    """
+    global _max_concurrent_requests_per_host
+    _max_concurrent_requests_per_host = max_concurrent_requests
+
+
+def get_host_limiter(url):
+    """
+    Get the limiter of a URL's host, shared across the running process
+
+    :param url: URL of request
+    :type url: str
+    :rtype: HostLimiter
+    """
+    host = urlparse(url).netloc
+    with _host_limiters_lock:
+        if host not in _host_limiters:
+            _host_limiters[host] = HostLimiter(_max_concurrent_requests_per_host)
+        return _host_limiters[host]
+
+
+def get_retry_after_seconds(headers, default_seconds=HOST_DEFAULT_RETRY_AFTER_SECONDS):
+    """
+    Get the wait a rate limited response asks for in its `Retry-After` header, as seconds or an HTTP date
+
+    :param headers: Response headers
+    :param default_seconds: Wait if the header is missing or can't be read
+    :type default_seconds: float
+    :return: seconds to wait, at most `HOST_MAX_RETRY_AFTER_SECONDS`
+    :rtype: float
+    """
+    retry_after = headers.get('Retry-After')
+    if retry_after is None:
+        return default_seconds
+    try:
+        seconds = float(retry_after)
+    except ValueError:
+        try:
+            seconds = (parsedate_to_datetime(retry_after) - datetime.now(timezone.utc)).total_seconds()
+        except (TypeError, ValueError):
+            return default_seconds
+    return min(max(seconds, 0.0), HOST_MAX_RETRY_AFTER_SECONDS)
+
+
+class RateLimitedHTTPAdapter(HTTPAdapter):
+    """
+    `requests` transport adapter that sends each request through its host's limiter, and retries 429 responses after
+    pausing the host for the response's `Retry-After`
+    """
+
+    def __init__(self, operation_name, max_rate_limit_retries=5, **kwargs):
+        """
+        :param operation_name: Name of operation whose rate limited responses are counted, e.g., "redcap.api"
+        :type operation_name: str
+        :param max_rate_limit_retries: Number of retries of a rate limited request
+        :type max_rate_limit_retries: int
+        :param kwargs: Keyword arguments of `HTTPAdapter`
+        """
+        self.operation_name = operation_name
+        self.max_rate_limit_retries = max_rate_limit_retries
+        super(RateLimitedHTTPAdapter, self).__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        host_limiter = get_host_limiter(request.url)
+        for attempt in range(self.max_rate_limit_retries + 1):
+            with host_limiter.limit():
+                response = super(RateLimitedHTTPAdapter, self).send(request, **kwargs)
+            if response.status_code != 429 or attempt == self.max_rate_limit_retries:
+                return response
+            get_run_metrics().increment(f"{self.operation_name}.rate_limited")
+            host_limiter.pause(get_retry_after_seconds(response.headers,
+                                                       HOST_DEFAULT_RETRY_AFTER_SECONDS * 2 ** attempt))
+            response.close()
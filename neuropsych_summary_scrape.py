@@ -6,10 +6,12 @@ import inspect
 import configparser
 import json
 import os
-from re import compile
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
 
+from box_event_discovery import *
+from redcap_diff import *
 from regex_target_dir_entries import *
 from neuropsych_summary_scrape_helpers import *
 
@@ -40,10 +42,42 @@ def main():
     parser.add_argument('-v', '--verbose',
                         type=str2bool, nargs='?', const=True, default=False,
                         help=f"print actions to stdout")
+    parser.add_argument('-c', '--use_cache',
+                        type=str2bool, nargs='?', const=True, default=True,
+                        help=f"skip downloading Box summary sheets unchanged since the last run")
+    parser.add_argument('-s', '--since_last_run',
+                        type=str2bool, nargs='?', const=True, default=False,
+                        help=f"find changed summary sheets from Box events since the last run instead of crawling Box")
+    parser.add_argument('--refresh_redcap',
+                        type=str2bool, nargs='?', const=True, default=False,
+                        help=f"export every REDCap record instead of only those changed since the last snapshot")
+    parser.add_argument('-i', '--import_redcap',
+                        type=str2bool, nargs='?', const=True, default=False,
+                        help=f"import the scraped records into the UMMAP REDCap project")
+    parser.add_argument('-d', '--dry_run',
+                        type=str2bool, nargs='?', const=True, default=False,
+                        help=f"report which records and fields an import would send without importing them")
+    parser.add_argument('--resume',
+                        type=str2bool, nargs='?', const=True, default=False,
+                        help=f"reuse summary sheets parsed by the last run if it didn't finish")
+    parser.add_argument('--source', choices=["box", "local"], default="box",
+                        help=f"read summary sheets from Box, or from a local directory such as a synced Box Drive")
+    parser.add_argument('--root', required=False,
+                        help=f"local directory corresponding to the root Box folder; required with `--source local`")
     args = parser.parse_args()
+    if args.source == "local" and not args.root:
+        parser.error("--root is required with --source local")
     if args.app_path:
         app_path = args.app_path
     is_verbose = args.verbose
+    use_cache = args.use_cache
+    since_last_run = args.since_last_run
+    refresh_redcap = args.refresh_redcap
+    import_redcap = args.import_redcap
+    dry_run = args.dry_run
+    resume = args.resume
+    source = args.source
+    local_root = args.root
 
     # Read config
     print("Parsing config file...")
@@ -51,40 +85,144 @@ def main():
     config.read(f"{app_path}/resources/config/config.cfg")
     box_jwt_json_config_path = config.get('base', 'box_jwt_json_config_path')
     box_folder_id = config.get('base', 'box_folder_id')
-    config_iter_sections = [section for section in config.sections() if section != 'base']
-    subdirs_regex_list = [config.get(section, 'subdirs_regex') for section in config_iter_sections]
-    xlsx_regex_list = [config.get(section, 'xlsx_regex') for section in config_iter_sections]
+    sheet_reader = config.get('base', 'sheet_reader', fallback="openpyxl")
+    box_crawl_workers = config.getint('base', 'box_crawl_workers', fallback=1)
+    box_page_size = config.getint('base', 'box_page_size', fallback=1000)
+    redcap_export_batch_size = config.getint('base', 'redcap_export_batch_size', fallback=0)
+    redcap_export_workers = config.getint('base', 'redcap_export_workers', fallback=1)
+    redcap_export_snapshot = config.getboolean('base', 'redcap_export_snapshot', fallback=False)
+    redcap_import_chunk_size = config.getint('base', 'redcap_import_chunk_size', fallback=200)
+    redcap_import_workers = config.getint('base', 'redcap_import_workers', fallback=1)
+    encode_redcap_complete = config.getboolean('base', 'encode_redcap_complete', fallback=False)
+    redcap_compact_dtypes = config.getboolean('base', 'redcap_compact_dtypes', fallback=False)
+    extract_chunk_size = config.getint('base', 'extract_chunk_size', fallback=EXTRACT_DEFAULT_CHUNK_SIZE)
+    write_parquet = config.getboolean('base', 'write_parquet', fallback=False)
+    write_raw_extract = config.getboolean('base', 'write_raw_extract', fallback=False)
+    redcap_import_diff = config.get('base', 'redcap_import_diff', fallback="none")
+    max_requests_per_host = config.getint('base', 'max_requests_per_host', fallback=0)
+    dedupe_summary_sheets = config.getboolean('base', 'dedupe_summary_sheets', fallback=True)
+    if redcap_import_diff not in REDCAP_DIFF_BASELINES:
+        raise ValueError(f"Unexpected redcap_import_diff \"{redcap_import_diff}\"; "
+                         f"expected one of {list(REDCAP_DIFF_BASELINES)}")
 
     # Get logger
     print("Retrieving logger...")
     nss_logger = get_logger(app_path)
 
-    # Join and compile config regexes
-    print("Processing regexes...")
-    subdirs_regex_str = "|".join(subdirs_regex_list)
-    xlsx_regex_str = "|".join(xlsx_regex_list)
-    subdirs_regex = compile(subdirs_regex_str)
-    xlsx_regex = compile(xlsx_regex_str)
+    # Time each stage of the run
+    run_metrics = get_run_metrics()
+
+    def start_stage(stage_message):
+        print(stage_message)
+        run_metrics.start_stage(stage_message.rstrip("."))
+
+    # Hold concurrent Box and REDCap requests to each host's limit
+    set_max_concurrent_requests_per_host(max_requests_per_host)
 
-    # Preload DataFrames from REDCap for studies
-    print("Retrieving REDCap data...")
+    # Load and compile parse map json file; an invalid parse map fails here, before any data is retrieved
+    parse_map = load_parse_map(f"{app_path}/resources/json/parse_map.json")
+    parse_map_dict = parse_map.parse_dict
+
+    # Load studies from config sections; their regexes are joined so one crawl finds every study's summary sheets
+    print("Processing regexes...")
     with open(f"{app_path}/resources/json/redcap_fields.json", "r") as redcap_fields_file:
         redcap_fields_data = redcap_fields_file.read()
     redcap_fields_dict = json.loads(redcap_fields_data)
-    ummap_redcap_fields = redcap_fields_dict['ummap']
-    electra_redcap_fields = redcap_fields_dict['electra']
-    ummap_df = retrieve_redcap_dataframe(config.get('ummap', 'redcap_api_uri'),
-                                         config.get('ummap', 'redcap_project_token'),
-                                         ummap_redcap_fields, vp=False)
-    electra_df = retrieve_redcap_dataframe(config.get('electra', 'redcap_api_uri'),
-                                           config.get('electra', 'redcap_project_token'),
-                                           electra_redcap_fields)
-
-    # Add `visit_type` to `ummap_df`
-    ummap_df.loc[:, 'visit_type'] = pd.NA
-    ummap_df.loc[ummap_df['ivp_a1_complete'].eq("2"), 'visit_type'] = "II"  # In-Person Initial
-    ummap_df.loc[ummap_df['fvp_a1_complete'].eq("2"), 'visit_type'] = "IF"  # In-Person Follow-up
-    ummap_df.loc[ummap_df['tvp_a1_complete'].eq("2"), 'visit_type'] = "TF"  # Tele-visit Follow-up
+    study_registry = load_study_registry(config, redcap_fields_dict)
+    target_study = study_registry.target_study
+    subdirs_regex = study_registry.subdirs_regex
+    xlsx_regex = study_registry.xlsx_regex
+
+    # Start retrieving DataFrames from REDCap for studies, all at once; the exports run in the background while summary
+    # sheets are found below
+    print("Retrieving REDCap data in the background...")
+
+    def get_redcap_snapshot_path(section):
+        return f"{app_path}/data/cache/redcap_{section}_snapshot.json" if redcap_export_snapshot else None
+
+    redcap_studies = [study for study in study_registry if study.redcap_api_uri is not None]
+    redcap_pool = ThreadPoolExecutor(max_workers=len(redcap_studies))
+    redcap_df_futures = {study.name: redcap_pool.submit(retrieve_redcap_dataframe,
+                                                        study.redcap_api_uri,
+                                                        study.redcap_project_token,
+                                                        study.redcap_fields, vp=study.redcap_verify_peer,
+                                                        batch_size=redcap_export_batch_size,
+                                                        max_workers=redcap_export_workers,
+                                                        snapshot_path=get_redcap_snapshot_path(study.name),
+                                                        full_refresh=refresh_redcap,
+                                                        typed=redcap_compact_dtypes)
+                         for study in redcap_studies}
+    redcap_pool.shutdown(wait=False)
+
+    if source == "local":
+        # Get list of summary sheet DirEntries below local root directory
+        start_stage("Retrieving Neuropsych Summary Sheets from local directory...")
+        summ_sheet_dir_entries_list = extract_regexed_dir_entries(local_root, subdirs_regex, xlsx_regex)
+    else:
+        # Get authenticated Box client; get root Box folder
+        start_stage("Authenticating Box client...")
+        box_client = get_box_authenticated_client(box_jwt_json_config_path)
+        root_box_dir = box_client.folder(folder_id=box_folder_id).get()
+
+        # Get list of summary sheet Box subitems
+        box_item_fields = ("type", "id", "sequence_id", "etag", "sha1", "name", "path_collection")
+        box_events_state_path = f"{app_path}/data/cache/box_events_state.json"
+        box_events_state = load_box_events_state(box_events_state_path, box_folder_id, subdirs_regex, xlsx_regex)
+        box_events_changes = None
+        if since_last_run and box_events_state['stream_position'] is not None:
+            start_stage("Retrieving changed Neuropsych Summary Sheets from Box events...")
+            box_events_changes = discover_box_events_changes(box_client, box_events_state, box_folder_id,
+                                                             subdirs_regex, xlsx_regex, box_item_fields)
+            if box_events_changes is None:
+                nss_logger.info("Box folder events since last run need a full crawl")
+        if box_events_changes is not None:
+            for change, box_item_ids in box_events_changes.items():
+                nss_logger.info(f"Box events since last run - {len(box_item_ids)} summary sheets {change}")
+            summ_sheet_box_items_list = get_box_events_state_items(box_client, box_events_state)
+        else:
+            start_stage("Retrieving Neuropsych Summary Sheets from Box...")
+            box_events_stream_position = box_client.events().get_latest_stream_position()
+            summ_sheet_box_items_list = \
+                extract_regexed_box_subitems(root_box_dir,
+                                             subdirs_regex,
+                                             xlsx_regex,
+                                             box_item_fields,
+                                             box_crawl_workers,
+                                             box_page_size)
+            set_box_events_state_items(box_events_state, box_events_stream_position, summ_sheet_box_items_list)
+        save_box_events_state(box_events_state_path, box_events_state)
+
+    # Load scrape cache of previously parsed summary sheets, and of local files' content hashes
+    scrape_cache_path = f"{app_path}/data/cache/scrape_cache.json" if source == "box" \
+        else f"{app_path}/data/cache/scrape_cache_local.json"
+    scrape_cache = load_scrape_cache(scrape_cache_path, parse_map_dict, nss_logger) if use_cache else None
+    found_summ_sheet_item_ids = [summ_sheet_dir_entry.path for summ_sheet_dir_entry in summ_sheet_dir_entries_list] \
+        if source == "local" else [summ_sheet_box_item.id for summ_sheet_box_item in summ_sheet_box_items_list]
+
+    # Keep one copy of each summary sheet whose contents were found in several folders
+    if dedupe_summary_sheets:
+        print("Skipping duplicate summary sheets...")
+        if source == "local":
+            summ_sheet_dir_entries_list = dedupe_local_dir_entries(summ_sheet_dir_entries_list, nss_logger,
+                                                                   scrape_cache)
+        else:
+            summ_sheet_box_items_list = dedupe_box_items(summ_sheet_box_items_list, nss_logger)
+
+    # Wait for the REDCap DataFrames, which the summary sheets' rows are built and filtered against
+    start_stage("Waiting for REDCap data...")
+    redcap_dfs = {study_name: redcap_df_future.result() for study_name, redcap_df_future in redcap_df_futures.items()}
+    ummap_df = redcap_dfs[target_study.name]
+    study_visit_indexes = {study.name: build_electra_visit_index(redcap_dfs[study.name], study.visit_index_field)
+                           for study in study_registry if study.event_mapping == "visit_index"}
+
+    # Load form completion rules; optionally encode `ummap_df` completion columns as compact int8 codes, unless they
+    # already were when it was loaded
+    completion_rules = load_completion_rules(f"{app_path}/resources/json/completion_rules.json")
+    if encode_redcap_complete and not redcap_compact_dtypes:
+        ummap_df = encode_redcap_complete_columns(ummap_df)
+
+    # Index `ummap_df` visits by (ptid, event) with their `visit_type` and whether their forms are complete
+    ummap_visit_index = RedcapVisitIndex(ummap_df, completion_rules)
 
     # # Add `visit_type` to `electra_df` --- LIKELY UNNECESSARY
     # electra_df.loc[:, 'visit_type'] = pd.NA
@@ -92,32 +230,71 @@ def main():
     # electra_df.loc[electra_df['fvp_a1_complete'].eq("2"), 'visit_type'] = "IF"  # In-Person Follow-up
     # electra_df.loc[electra_df['tvp_a1_complete'].eq("2"), 'visit_type'] = "TF"  # Tele-visit Follow-up
 
-    # Load parse map json file as dict
-    with open(f"{app_path}/resources/json/parse_map.json", "r") as parse_map_file:
-        parse_map_json_data = parse_map_file.read()
-    parse_map_dict = json.loads(parse_map_json_data)
-
-    # Get authenticated Box client; get root Box folder
-    print("Authenticating Box client...")
-    box_client = get_box_authenticated_client(box_jwt_json_config_path)
-    root_box_dir = box_client.folder(folder_id=box_folder_id).get()
-
-    # Get list of summary sheet Box subitems
-    print("Retrieving Neuropsych Summary Sheets from Box...")
-    summ_sheet_box_items_list = \
-        extract_regexed_box_subitems(root_box_dir,
-                                     subdirs_regex,
-                                     xlsx_regex,
-                                     ("type", "id", "sequence_id", "etag", "name", "path_collection"))
-
-    # Loop over summary sheet DirEntries and process
-    print("Building raw dataframe...")
-    raw_df = box_build_accum_df(summ_sheet_box_items_list, parse_map_dict, electra_df, nss_logger)
+    # Open journal of summary sheets parsed in this run, optionally resuming the last run's if it didn't finish
+    scrape_journal_path = f"{app_path}/data/cache/scrape_journal.jsonl" if source == "box" \
+        else f"{app_path}/data/cache/scrape_journal_local.jsonl"
+    scrape_journal = ScrapeJournal(scrape_journal_path, parse_map_dict, nss_logger, resume)
+
+    # Get paths of extract files; Parquet files are only written if pyarrow is installed
+    extract_csv_dir = f"{app_path}/data/csv"
+    extract_parquet_dir = f"{app_path}/data/parquet"
+    if write_parquet and not is_parquet_available():
+        nss_logger.warning("pyarrow not installed; Parquet extracts will not be written")
+        write_parquet = False
+
+    def get_extract_paths(extract_name):
+        return (f"{extract_csv_dir}/{extract_name}-{date.today().isoformat()}.csv",
+                f"{extract_parquet_dir}/{extract_name}-{date.today().isoformat()}.parquet" if write_parquet else None)
+
+    # Route each summary sheet found by the shared crawl to its study
+    summ_sheet_items_list = summ_sheet_dir_entries_list if source == "local" else summ_sheet_box_items_list
+    study_summ_sheet_items = study_registry.route_items(summ_sheet_items_list, nss_logger)
+
+    # Loop over each study's summary sheets and process with the study's own download and parse workers, optionally
+    # streaming raw rows to file as they're built
+    start_stage("Building raw dataframe...")
+    raw_extract_writer = None
+    if write_raw_extract:
+        raw_extract_writer = ExtractWriter(*get_extract_paths("neuropsych_scrape_raw"),
+                                           column_dtypes=get_parse_map_column_dtypes(parse_map_dict,
+                                                                                     {'redcap_event_name': "string"}),
+                                           chunk_size=extract_chunk_size)
+    study_raw_dfs = []
+    try:
+        for study in study_registry:
+            study_items_list = study_summ_sheet_items[study.name]
+            nss_logger.info(f"Building raw dataframe of {len(study_items_list)} {study.name} summary sheets")
+            run_metrics.increment(f"sheets.found.{study.name}", len(study_items_list))
+            if source == "local":
+                study_raw_dfs.append(local_build_accum_df(study_items_list, parse_map,
+                                                          study_visit_indexes.get(study.name), nss_logger,
+                                                          scrape_cache, study.parse_workers, sheet_reader,
+                                                          raw_extract_writer, scrape_journal, study))
+            else:
+                study_raw_dfs.append(box_build_accum_df(study_items_list, parse_map,
+                                                        study_visit_indexes.get(study.name), nss_logger,
+                                                        scrape_cache, study.download_workers, study.parse_workers,
+                                                        sheet_reader, raw_extract_writer, scrape_journal, study))
+    except Exception:
+        if raw_extract_writer is not None:
+            raw_extract_writer.abort()
+        raise
+    finally:
+        scrape_journal.close()
+    if raw_extract_writer is not None:
+        raw_extract_writer.close()
+    raw_df = pd.concat(study_raw_dfs, ignore_index=True)
+    if use_cache:
+        # keep entries of skipped duplicates too, so their content hashes aren't computed again next run
+        prune_scrape_cache(scrape_cache, found_summ_sheet_item_ids)
+        save_scrape_cache(scrape_cache_path, scrape_cache)
+    run_metrics.increment("sheets.found", len(summ_sheet_items_list))
+    run_metrics.increment("rows.raw", len(raw_df))
 
     # Normalize UMMAP IDs
-    print("Cleaning dataframe...")
+    start_stage("Cleaning dataframe...")
     clean_df = raw_df.copy().dropna(subset=['redcap_event_name'])
-    clean_df['ptid'] = clean_df['ptid'].apply(normalize_ummap_id)
+    clean_df['ptid'] = normalize_ummap_ids(clean_df['ptid'])
 
     # Reörder columns
     clean_df_cols = clean_df.columns.tolist()
@@ -126,93 +303,87 @@ def main():
     clean_df_cols = front_cols + back_cols
     clean_df = clean_df[clean_df_cols]
 
-    # Left Join: `clean_df` + `ummap_df[['ptid', 'redcap_event_name', 'visit_type']]` => `clean_df`
-    clean_df = pd.merge(clean_df, ummap_df[['ptid', 'redcap_event_name', 'visit_type']],
-                        how="left", on=['ptid', 'redcap_event_name'])
+    # Look up each record's visit in `ummap_visit_index` once; add its `visit_type` now, and keep its position for
+    # filtering out records of incomplete visits below
+    ummap_visit_positions = ummap_visit_index.get_positions(clean_df['ptid'], clean_df['redcap_event_name'])
+    clean_df['visit_type'] = ummap_visit_index.get_visit_types(ummap_visit_positions)
 
     # Add "fu_" and "tele_" prefixes to NACC columns for in-person and tele-visit follow-up visits
-    print("Transforming dataframe...")
+    start_stage("Transforming dataframe...")
     with open(f"{app_path}/resources/json/nacc_fields.json", "r") as nacc_fields_json_file:
         nacc_fields_json_data = nacc_fields_json_file.read()
     nacc_fields_dict = json.loads(nacc_fields_json_data)
     nacc_fvp_cols = nacc_fields_dict['nacc_fvp_cols']
     nacc_tvp_cols = nacc_fields_dict['nacc_tvp_cols']
-    transformed_df = add_prefix_to_fu_visits(clean_df, nacc_fvp_cols, "fu_")
-    transformed_df = add_prefix_to_fu_visits(transformed_df, nacc_tvp_cols, "tele_")
-
-    # Ensure integer column types
-    for col, col_spec in parse_map_dict.items():
-        if col_spec['dtype'] == "int":
-            if col in transformed_df.columns:
-                transformed_df[col] = transformed_df[col].astype('Int64')
-            if "fu_" + col in transformed_df.columns:
-                transformed_df["fu_" + col] = transformed_df["fu_" + col].astype('Int64')
-            if "tele_" + col in transformed_df.columns:
-                transformed_df["tele_" + col] = transformed_df["tele_" + col].astype('Int64')
-
-
-    # Get records with forms marked as completed
-    ummap_df_ivp_complete = get_ivp_complete(ummap_df)
-    ummap_df_fvp_complete = get_fvp_complete(ummap_df)
-    ummap_df_tvp_complete = get_tvp_complete(ummap_df)
-    completed_forms_df = \
-        ummap_df.loc[(ummap_df.header_complete == "2") &
-                     (ummap_df_ivp_complete | ummap_df_fvp_complete | ummap_df_tvp_complete),
-                     ['ptid', 'redcap_event_name']]
-
-    # Avoid uploading records with incomplete forms by inner join of completed_forms_df and transformed_df
-    print("Filtering dataframe for only those with complete REDCap records...")
-    importable_df = pd.merge(completed_forms_df, transformed_df, how='inner', on=['ptid', 'redcap_event_name'])
+    transformed_df = add_prefixes_to_fu_visits(clean_df, nacc_fvp_cols, nacc_tvp_cols)
+
+    # Avoid uploading records with incomplete forms by keeping only those whose visits were found complete
+    start_stage("Filtering dataframe for only those with complete REDCap records...")
+    importable_df = ummap_visit_index.filter_completed(transformed_df, ummap_visit_positions)
 
     # Drop columns that are collected at video tele-visits but not a part of NACC UDS Telephone Follow-up Packet (TVP)
-    columns_to_drop = ["visit_type",
-                       "otraila",
-                       "otrlarr",
-                       "vnttotw",
-                       "vntpcnc",
-                       "otrailb",
-                       "otrlbrr",
-                       "tele_animals_c2",
-                       "tele_animals_c2z",
-                       "tele_craftdrez",
-                       "tele_craftdvrz",
-                       "tele_craftparaz",
-                       "tele_craftvrsz",
-                       "tele_digbacctz",
-                       "tele_digbacspanz",
-                       "tele_digforctz",
-                       "tele_digforspanz",
-                       "tele_mintpcngz",
-                       "tele_minttots",
-                       "tele_minttotsz",
-                       "tele_mocatots",
-                       "tele_mocaz",
-                       "tele_udsverfcz",
-                       "tele_udsverlcz",
-                       "tele_udsbentc",
-                       "tele_udsbentcz",
-                       "tele_udsbentd",
-                       "tele_udsbentdz",
-                       "tele_veg_c2",
-                       "tele_veg_c2z",
-                       "tele_npiq_score",
-                       "tele_fas_score",
-                       ]
+    columns_to_drop = ["visit_type"] + NON_TVP_TELE_VISIT_COLUMNS
     importable_df = importable_df.drop(columns=columns_to_drop)
 
-    # Write dataframe to CSV
-    print("Writing CSV to file...")
-    importable_csv_path = f"{app_path}/data/csv"
-    importable_csv_filename = f"neuropsych_scrape_data-{date.today().isoformat()}.csv"
-    importable_df.to_csv(f"{importable_csv_path}/{importable_csv_filename}", index=False)
-
-    # # Import CSV records to REDCap
-    # print("Importing CSV to REDCap...")
-    # with open(f"{importable_csv_path}/{importable_csv_filename}", "r") as importable_csv_data_file:
-    #     importable_csv_data = importable_csv_data_file.read()
-    #     import_redcap_data(config.get('ummap', 'redcap_api_uri'),
-    #                        config.get('ummap', 'redcap_project_token'),
-    #                        importable_csv_data, nss_logger, vp=False)
+    # Write dataframe to CSV, and optionally Parquet, in chunks
+    start_stage("Writing CSV to file...")
+    importable_csv_path, importable_parquet_path = get_extract_paths("neuropsych_scrape_data")
+    with ExtractWriter(importable_csv_path,
+                       get_extract_column_dtypes(parse_map_dict, importable_df.columns.tolist()),
+                       importable_parquet_path,
+                       extract_chunk_size) as importable_extract_writer:
+        importable_extract_writer.write_dataframe(importable_df)
+
+    # Keep only records and fields that differ from current REDCap values or from the rows earlier runs imported
+    redcap_imported_snapshot_path = f"{app_path}/data/cache/redcap_imported_snapshot.json"
+    if import_redcap or dry_run:
+        baseline_df = None
+        if redcap_import_diff == "redcap":
+            start_stage("Retrieving current REDCap values of records to import...")
+            baseline_df = export_redcap_baseline_dataframe(target_study.redcap_api_uri,
+                                                           target_study.redcap_project_token,
+                                                           importable_df, vp=target_study.redcap_verify_peer,
+                                                           batch_size=redcap_export_batch_size or
+                                                           REDCAP_DEFAULT_BATCH_SIZE,
+                                                           max_workers=redcap_export_workers)
+        elif redcap_import_diff == "imported":
+            baseline_df = load_redcap_imported_snapshot(redcap_imported_snapshot_path)
+            if baseline_df is None:
+                nss_logger.info(f"REDCap Diff - No imported-rows snapshot yet; importing every row")
+        delta_df, diff_report = diff_redcap_records(importable_df, baseline_df)
+        diff_report['baseline'] = redcap_import_diff
+        for duplicate_record in diff_report['duplicate_rows']:
+            nss_logger.warning(f"REDCap Diff - More than one row for {duplicate_record['ptid']} "
+                               f"{duplicate_record['redcap_event_name']}; importing only the last")
+        nss_logger.info(f"REDCap Diff - {diff_report['new_rows']} new rows, {diff_report['changed_rows']} changed "
+                        f"rows, {diff_report['unchanged_rows']} unchanged rows, "
+                        f"{diff_report['changed_cells']} changed fields")
+        save_redcap_diff_report(f"{app_path}/data/log/redcap_import_diff-{date.today().isoformat()}.json",
+                                diff_report)
+
+    # Import records to REDCap
+    if import_redcap and not dry_run:
+        start_stage("Importing records to REDCap...")
+        import_report = import_redcap_dataframe(target_study.redcap_api_uri,
+                                                target_study.redcap_project_token,
+                                                delta_df, nss_logger, vp=target_study.redcap_verify_peer,
+                                                chunk_size=redcap_import_chunk_size,
+                                                max_workers=redcap_import_workers)
+        # Only rows REDCap accepted become the baseline for the next run's diff
+        if redcap_import_diff == "imported":
+            save_redcap_imported_snapshot(redcap_imported_snapshot_path,
+                                          update_redcap_imported_snapshot(
+                                              baseline_df, delta_df, get_failed_redcap_import_records(import_report)))
+
+    # The run finished, so there's nothing left to resume
+    scrape_journal.remove()
+
+    # Write run report next to log file; print summary of it
+    run_metrics.end_stage()
+    run_metrics.increment("rows.importable", len(importable_df))
+    run_report = run_metrics.to_report()
+    save_run_report(get_run_report_path(nss_logger), run_report)
+    print(format_run_report_table(run_report))
 
     print("Done.")
 
@@ -1,12 +1,31 @@
 import configparser
 import logging
-import requests
 import pandas as pd
 import os
 import sys
-from re import match, search
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 from boxsdk import JWTAuth, Client
+from boxsdk.network.default_network import DefaultNetwork
+from boxsdk.session.session import AuthorizedSession
+
+from run_metrics import *
+from host_limits import *
+from redcap_export import *
+from redcap_import import *
+from redcap_completion import *
+from redcap_visit_index import *
+from row_accumulator import *
+from parse_map import *
+from summary_sheet_readers import *
+from summary_sheet_metadata import *
+from study_registry import *
+from scrape_cache import *
+from scrape_journal import *
+from content_dedup import *
+from extract_writers import *
 
 
 def get_logger(app_path):
@@ -39,435 +58,612 @@ def get_logger(app_path):
     return nss_logger
 
 
-def return_col_row_of_val(df_to_search, search_str):
+class FrozenDict(dict):
     """
-    Return row and column indices (as 2-tuple of integers) of `search_str` within dataframe `df_to_search`
-
-    :param df_to_search: DataFrame that may contain `search_str`
-    :type df_to_search: pandas.DataFrame
-    :param search_str: String that may exist in `df_to_search`
-    :type search_str: str
-    :return: tuple of indexes of `search_str` location in `df_to_search`
-    :rtype: (int, int)
+    Read-only dict that can still be pickled, e.g., to pass a lookup index to worker processes
     """
-    # loop over each df column
-    for col_idx, series in df_to_search.items():
-        # loop over each column's row
-        for row_idx, value in series.items():
-            # search for the string, return the indices early if found
-            if pd.notna(value) and match(search_str, value):
-                return row_idx, col_idx
-    # else return None-None tuple
-    return None, None
 
+    def _read_only(self, *args, **kwargs):
+        raise TypeError(f"{type(self).__name__} is read-only")
 
-def convert_x_to_dtype(raw_value, type_str, anchor, path, nss_logger):
-    """
-    Converts a value to a target data type
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
 
-    :param raw_value: Value to be converted
-    :type raw_value: Any
-    :param type_str: String of the target data type
-    :type type_str: str
-    :param anchor: Anchor value from `parse_map.json`
-    :type anchor: str
-    :param path: Path of file that `raw_value` came from
-    :type path: str
-    :param nss_logger: Logger object for writing to app log
-    :type nss_logger: logging.Logger
-    :return: value as target data type
-    """
-    # Determine coercion function
-    if type_str == "int":
-        func = int
-    elif type_str == "float":
-        func = float
-    elif type_str == "str":
-        func = str
-    else:
-        raise ValueError(f"Unexpected type string \"{type_str}\" for `{anchor}` in parse_map.json")
+    def __reduce__(self):
+        return type(self), (dict(self),)
 
-    # Apply coercion function to raw_value
-    try:
-        value = func(raw_value)
-    except ValueError as e:
-        value = None
-        nss_logger.warning(f"Raw value in sheet not compatible with defined dtype at {anchor} in {str(path)}; {e}")
 
-    return value
+def build_electra_visit_index(electra_df, visit_field="ummap_visit_number"):
+    """
+    Build lookup index of (ptid, ELECTRA REDCap event name) to UMMAP visit number
 
+    Records without a UMMAP visit number are left out. If several records share a key, the first one is kept. Works
+    the same for any study whose REDCap project holds the UMMAP visit number of each of its visits.
 
-def local_extract_dir_visit_num(dir_entry, nss_logger):
+    :param electra_df: DataFrame of ELECTRA REDCap data with `ptid`, `redcap_event_name`, and `visit_field`
+    :type electra_df: pandas.DataFrame
+    :param visit_field: Field holding the UMMAP visit number
+    :type visit_field: str
+    :return: read-only dict of (ptid, event name) to UMMAP visit number
+    :rtype: FrozenDict
     """
-    Extract directory visit number from local spreadsheet
+    electra_visit_index = {}
+    for ptid, redcap_event_name, ummap_visit_number in \
+            zip(electra_df['ptid'], electra_df['redcap_event_name'], electra_df[visit_field]):
+        if pd.notna(ummap_visit_number) and ummap_visit_number != "":
+            electra_visit_index.setdefault((ptid, redcap_event_name), ummap_visit_number)
+    return FrozenDict(electra_visit_index)
 
-    :param dir_entry: Spreadsheet DirEntry object
-    :type dir_entry: os.DirEntry
-    :param nss_logger: Logger object for writing to app log
-    :type nss_logger: logging.Logger
-    :return: Visit number
-    :rtype: int
+
+class ListLogger:
+    """
+    Minimal stand-in for a Logger that keeps messages in a list so they can be passed back from worker processes
     """
-    visit_match = search(r'.*Visit (\d+).*', dir_entry.path)
-    visit_str = visit_match.group(1)
-    try:
-        visit_int = int(visit_str)
-    except ValueError as e:
-        visit_int = None
-        nss_logger.warning(e)
 
-    return visit_int
+    def __init__(self):
+        self.records = []
 
+    def info(self, msg):
+        self.records.append(("info", msg))
 
-def box_extract_dir_visit_num(box_item, nss_logger):
-    """
+    def warning(self, msg):
+        self.records.append(("warning", msg))
 
-    :param box_item:
-    :param nss_logger: Logger object for writing to app log
-    :type nss_logger: logging.Logger
-    :return:
-    """
-    box_item_path = ""
-    for path_item in box_item.path_collection['entries']:
-        box_item_path += f"/{path_item.name}"
+    def error(self, msg):
+        self.records.append(("error", msg))
 
-    visit_match = search(r'.*Visit (\d+).*', box_item_path)
-    visit_str = visit_match.group(1)
-    try:
-        visit_int = int(visit_str)
-    except ValueError as e:
-        visit_int = None
-        nss_logger.warning(e)
+    def replay(self, nss_logger):
+        """
+        Write kept messages to a real logger
 
-    return visit_int
+        :param nss_logger: Logger object for writing to app log
+        :type nss_logger: logging.Logger
+        """
+        for level, msg in self.records:
+            getattr(nss_logger, level)(msg)
 
 
-def local_extract_dir_ummap_id(dir_entry, electra_dir_entry, nss_logger):
+def parse_summ_sheet(sheet_file, parse_map, path, sheet_reader="openpyxl"):
     """
+    Parse a summary sheet workbook into a dict of field values; safe to run in a worker process
 
-    :param dir_entry: Spreadsheet DirEntry object
-    :type dir_entry: os.DirEntry
-    :param electra_dir_entry:
-    :param nss_logger: Logger object for writing to app log
-    :type nss_logger: logging.Logger
-    :return:
+    :param sheet_file: Path or contents of summary sheet .xlsx file
+    :type sheet_file: str | bytes
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param path: Path or ID of file that `sheet_file` came from
+    :type path: str
+    :param sheet_reader: Key of reader in `SUMM_SHEET_READERS`
+    :type sheet_reader: str
+    :return: dict of field names to converted values (`None` if the sheet is empty), kept log messages, and timings
+        of reading and converting the sheet
+    :rtype: (dict, ListLogger, RunMetrics)
     """
-    if not electra_dir_entry:
-        id_match = search(r'.*/(\d+).[Ss]cor', dir_entry.path)
-        id_str = id_match.group(1)
-        try:
-            id_int = int(id_str)
-        except ValueError as e:
-            id_int = None
-            nss_logger.warning(e)
-    else:
-        id_match = search(r'.*/KG\d{6} - (\d{4})/KG\d{6}_(\d{4}).*', dir_entry.path)
-        id_str_1 = id_match.group(1)
-        id_str_2 = id_match.group(2)
-        if id_str_1 == id_str_2:
-            id_str = id_str_1
-            try:
-                id_int = int(id_str)
-            except ValueError as e:
-                id_int = None
-                nss_logger.warning(e)
-        else:
-            raise AssertionError(f"UMMAP IDs from {dir_entry.path} don't match")
-    ummap_id = normalize_ummap_id(id_int)
+    list_logger = ListLogger()
+    sheet_metrics = RunMetrics()
+    start = time.perf_counter()
 
-    return ummap_id
+    with sheet_metrics.time_operation("sheet.read"):
+        raw_values = read_raw_field_values(sheet_file, parse_map, list_logger, sheet_reader)
+    fields_dict = None
+    if raw_values is not None:
+        with sheet_metrics.time_operation("sheet.convert"):
+            fields_dict = parse_map.convert_raw_field_values(raw_values, path, list_logger)
+    sheet_metrics.record_sheet(path, time.perf_counter() - start)
 
+    return fields_dict, list_logger, sheet_metrics
 
-def box_extract_dir_ummap_id(box_item, electra_box_item, nss_logger):
-    """
 
-    :param box_item:
-    :param electra_box_item:
-    :param nss_logger: Logger object for writing to app log
-    :type nss_logger: logging.Logger
-    :return:
+def _download_box_item(box_item):
     """
-    if not electra_box_item:
-        id_match = search(r'^(\d{3,4}).*[Ss]cor.*[Ss]ummary.*\d{4}.*\.xlsx$', box_item.name)
-        id_str = id_match.group(1)
-        try:
-            id_int = int(id_str)
-        except ValueError as e:
-            id_int = None
-            logging.warning(e)
-    else:
-        id_match = search(r'^KG\d{6}_(\d{4})_Score_Summary_\d{4}.xlsx$', box_item.name)
-        id_str = id_match.group(1)
-        try:
-            id_int = int(id_str)
-        except ValueError as e:
-            id_int = None
-            nss_logger.warning(e)
-    ummap_id = normalize_ummap_id(id_int)
+    Download a Box file's contents, recording the download in the run metrics
 
-    return ummap_id
+    :param box_item: Box File object
+    :return: file contents
+    :rtype: bytes
+    """
+    with get_run_metrics().time_operation("box.download") as operation_info:
+        content = box_item.content()
+        operation_info['bytes'] = len(content)
+    return content
 
 
-def extract_redcap_event_name(dir_ummap_id, dir_visit_num, electra_dir_entry, electra_df):
+def _submit_box_fetch_and_parse(download_pool, parse_pool, box_item, parse_map, sheet_reader):
     """
+    Chain a Box download in `download_pool` to a sheet parse in `parse_pool`
 
-    :param dir_ummap_id:
-    :param dir_visit_num:
-    :param electra_dir_entry:
-    :param electra_df:
-    :return:
+    :return: future resolving to the result of `parse_summ_sheet`
+    :rtype: concurrent.futures.Future
     """
-    if not electra_dir_entry:
-        redcap_event_name_str = f"visit_{dir_visit_num}_arm_1"
-    else:
-        ummap_visit_values = \
-            electra_df[
-                (electra_df.ptid == dir_ummap_id) &
-                (electra_df.redcap_event_name == f"sv{dir_visit_num}_arm_1")
-            ].ummap_visit_number.values
-        if ummap_visit_values:
-            ummap_visit_value = ummap_visit_values[0]
-            redcap_event_name_str = f"visit_{ummap_visit_value}_arm_1"
-        else:
-            redcap_event_name_str = None
+    result_future = Future()
+
+    def on_parsed(parse_future):
+        try:
+            result_future.set_result(parse_future.result())
+        except Exception as e:
+            result_future.set_exception(e)
+
+    def on_downloaded(download_future):
+        try:
+            parse_future = parse_pool.submit(parse_summ_sheet, download_future.result(), parse_map, box_item.id,
+                                             sheet_reader)
+        except Exception as e:
+            result_future.set_exception(e)
+            return
+        parse_future.add_done_callback(on_parsed)
+
+    download_pool.submit(_download_box_item, box_item).add_done_callback(on_downloaded)
 
-    return redcap_event_name_str
+    return result_future
 
 
-def local_build_accum_row(summ_sheet_df, parse_dict, dir_entry, electra_df, nss_logger):
+def box_fetch_summ_sheet_fields(box_items_list, parse_map, nss_logger, download_workers=1, parse_workers=1,
+                                sheet_reader="openpyxl"):
     """
-    Build record row for dataframe of records for eventual REDCap import
+    Download and parse Box summary sheets, yielding results in the same order as `box_items_list`
 
-    :param summ_sheet_df:
-    :param parse_dict:
-    :param dir_entry: Spreadsheet DirEntry object
-    :type dir_entry: os.DirEntry
-    :param electra_df:
+    With more than one worker, downloads run in a thread pool while workbooks are parsed in a process pool, so network
+    wait overlaps with parsing. At most `download_workers + 2 * parse_workers` sheets are in flight at once.
+    Sheets that can't be downloaded or parsed are logged and skipped.
+
+    :param box_items_list: Box File objects of summary sheets
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
     :param nss_logger: Logger object for writing to app log
     :type nss_logger: logging.Logger
-    :return:
+    :param download_workers: Number of threads downloading from Box
+    :type download_workers: int
+    :param parse_workers: Number of processes parsing workbooks
+    :type parse_workers: int
+    :param sheet_reader: Key of reader in `SUMM_SHEET_READERS`
+    :type sheet_reader: str
+    :return: generator of Box items and their dicts of field names to converted values
+    """
+    if download_workers <= 1 and parse_workers <= 1:
+        for box_item in box_items_list:
+            print(f"  {box_item.name}")
+            try:
+                fields_dict, list_logger, sheet_metrics = \
+                    parse_summ_sheet(_download_box_item(box_item), parse_map, box_item.id, sheet_reader)
+            except:
+                nss_logger.warning(f"Cannot process {box_item.id} with name \"{box_item.name}\"")
+                get_run_metrics().increment("sheets.failed")
+                continue
+            list_logger.replay(nss_logger)
+            get_run_metrics().merge(sheet_metrics)
+            yield box_item, fields_dict
+        return
+
+    window_size = download_workers + 2 * parse_workers
+    with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool, \
+            ThreadPoolExecutor(max_workers=download_workers) as download_pool:
+        in_flight = deque()
+        box_items_iter = iter(box_items_list)
+        while True:
+            # keep the window of in-flight sheets full
+            for box_item in box_items_iter:
+                result_future = \
+                    _submit_box_fetch_and_parse(download_pool, parse_pool, box_item, parse_map, sheet_reader)
+                in_flight.append((box_item, result_future))
+                if len(in_flight) >= window_size:
+                    break
+            if not in_flight:
+                break
+            # wait on the oldest sheet so results come back in order
+            box_item, result_future = in_flight.popleft()
+            print(f"  {box_item.name}")
+            try:
+                fields_dict, list_logger, sheet_metrics = result_future.result()
+            except:
+                nss_logger.warning(f"Cannot process {box_item.id} with name \"{box_item.name}\"")
+                get_run_metrics().increment("sheets.failed")
+                continue
+            list_logger.replay(nss_logger)
+            get_run_metrics().merge(sheet_metrics)
+            yield box_item, fields_dict
+
+
+def get_box_item_path(box_item):
     """
-    row_dict = {}
-    for raw_field, spec_dict in parse_dict.items():
-        row_idx, col_idx = return_col_row_of_val(summ_sheet_df, spec_dict['anchor'])
-        if row_idx is not None:
-            raw_value = summ_sheet_df.loc[row_idx + spec_dict['row_diff'], col_idx + spec_dict['col_diff']]
-            if pd.isna(raw_value) or raw_value.strip().upper() in ["", "NA", "N/A"]:
-                value = None
-            else:
-                value = \
-                    convert_x_to_dtype(raw_value, spec_dict['dtype'], spec_dict['anchor'], dir_entry.path, nss_logger)
-            row_dict[raw_field] = value
+    Get path of a Box item from its folder path and name
 
-    electra_dir_entry = True if match(".*ELECTRA.*", dir_entry.path) else False
-    dir_ummap_id = local_extract_dir_ummap_id(dir_entry, electra_dir_entry, nss_logger)
-    dir_visit_num = local_extract_dir_visit_num(dir_entry, nss_logger)
-    redcap_event_name = extract_redcap_event_name(dir_ummap_id, dir_visit_num, electra_dir_entry, electra_df)
+    :param box_item: Box File object with `path_collection` and `name` fields
+    :return: path, e.g., "/All Files/Clinical Core/.../1234 Score Summary 2020.xlsx"
+    :rtype: str
+    """
+    return "".join(f"/{path_item.name}" for path_item in box_item.path_collection['entries']) + f"/{box_item.name}"
 
-    row_dict['redcap_event_name'] = redcap_event_name
 
-    return row_dict
+def _record_duplicate_groups(duplicate_groups, item_paths, nss_logger):
+    """
+    Log duplicate summary sheets found by `dedupe_by_content` and record them in the run metrics
+    """
+    for duplicate_group in duplicate_groups:
+        kept_path = item_paths[duplicate_group['kept']]
+        duplicate_paths = [item_paths[item_idx] for item_idx in duplicate_group['duplicates']]
+        duplicate_paths_str = ", ".join(f"\"{duplicate_path}\"" for duplicate_path in duplicate_paths)
+        nss_logger.info(f"Duplicate summary sheets - keeping \"{kept_path}\"; skipping {duplicate_paths_str}")
+        get_run_metrics().record_duplicate_sheets(duplicate_group['sha1'], kept_path, duplicate_paths)
 
 
-def box_build_accum_row(summ_sheet_df, parse_dict, box_item, electra_df, nss_logger):
+def dedupe_box_items(box_items_list, nss_logger):
     """
-    Build record row for dataframe of records for eventual REDCap import
+    Keep one Box item of each group of summary sheets with the same contents, going by each item's `sha1` field
+
+    The copy kept, and so the path the `redcap_event_name` comes from, is the UMMAP-named copy if there is one, then
+    the copy whose path sorts first, then the one with the lowest ID. Items without a `sha1` are always kept. The
+    duplicates are logged and recorded in the run metrics.
 
-    :param summ_sheet_df:
-    :param parse_dict:
-    :param box_item:
-    :param electra_df:
+    :param box_items_list: Box File objects of summary sheets
     :param nss_logger: Logger object for writing to app log
     :type nss_logger: logging.Logger
-    :return:
+    :return: kept Box File objects in their original order
     """
-    row_dict = {}
-    for raw_field, spec_dict in parse_dict.items():
-        row_idx, col_idx = return_col_row_of_val(summ_sheet_df, spec_dict['anchor'])
-        if row_idx is not None:
-            raw_value = summ_sheet_df.loc[row_idx + spec_dict['row_diff'], col_idx + spec_dict['col_diff']]
-            if pd.isna(raw_value) or raw_value.strip().upper() in ["", "NA", "N/A"]:
-                value = None
-            else:
-                value = \
-                    convert_x_to_dtype(raw_value, spec_dict['dtype'], spec_dict['anchor'], box_item.id, nss_logger)
-            row_dict[raw_field] = value
-
-    electra_box_item = True if match(r'^KG\d{6}_\d{4}_Score_Summary_\d{4}.xlsx$', box_item.name) else False
-    dir_ummap_id = box_extract_dir_ummap_id(box_item, electra_box_item, nss_logger)
-    dir_visit_num = box_extract_dir_visit_num(box_item, nss_logger)
-    redcap_event_name = extract_redcap_event_name(dir_ummap_id, dir_visit_num, electra_box_item, electra_df)
-
-    row_dict['redcap_event_name'] = redcap_event_name
-
-    return row_dict
+    box_item_paths = [get_box_item_path(box_item) for box_item in box_items_list]
+    preference_keys = [(is_electra_box_item(box_item), box_item_path, box_item.id)
+                       for box_item, box_item_path in zip(box_items_list, box_item_paths)]
+    kept_box_items_list, duplicate_groups = \
+        dedupe_by_content(box_items_list, [getattr(box_item, 'sha1', None) for box_item in box_items_list],
+                          preference_keys)
+    _record_duplicate_groups(duplicate_groups, box_item_paths, nss_logger)
+    return kept_box_items_list
 
 
-def local_build_accum_df(dir_entries_list, parse_dict, electra_df, nss_logger):
+def dedupe_local_dir_entries(dir_entries_list, nss_logger, scrape_cache=None):
     """
-    Build dataframe of records for eventual REDCap import
+    Keep one local summary sheet of each group of files with the same contents, going by the SHA-1 of each file
+
+    Works like `dedupe_box_items`: the UMMAP copy is kept if there is one, then the copy whose path sorts first. If
+    `scrape_cache` is passed, a file whose modification time and size haven't changed since it was last hashed isn't
+    read again; the hashes of the others are added to the cache.
 
-    :param dir_entries_list:
-    :param parse_dict:
-    :param electra_df:
+    :param dir_entries_list: Spreadsheet DirEntry objects
+    :type dir_entries_list: list[os.DirEntry]
     :param nss_logger: Logger object for writing to app log
     :type nss_logger: logging.Logger
-    :return:
+    :param scrape_cache: Scrape cache loaded with `load_scrape_cache`
+    :type scrape_cache: dict
+    :return: kept DirEntry objects in their original order
+    :rtype: list[os.DirEntry]
     """
-    # build empty dataframe
-    accum_df = pd.DataFrame(data=None, index=None, columns=parse_dict.keys())
-
-    # loop over summary sheet DirEntries and process
+    content_hashes = []
     for dir_entry in dir_entries_list:
-        print(f"  {dir_entry.name}")
         try:
-            summ_sheet_df = pd.read_excel(dir_entry.path, sheet_name=0, header=None, dtype=str)
-        except:
-            summ_sheet_df = pd.DataFrame(data=None)
-            nss_logger.warning(f"Cannot process \"{str(dir_entry.path)}\"")
-        if not summ_sheet_df.empty:
-            row_dict = local_build_accum_row(summ_sheet_df, parse_dict, dir_entry, electra_df, nss_logger)
-            accum_df = accum_df.append(row_dict, ignore_index=True)
-            nss_logger.info(f"Processed \"{str(dir_entry.path)}\"")
+            dir_entry_etag = get_local_file_etag(dir_entry)
+            content_hash = get_scrape_cache_sha1(scrape_cache, dir_entry.path, dir_entry_etag) \
+                if scrape_cache is not None else None
+            if content_hash is not None:
+                get_run_metrics().increment("sheets.hash_cache_hits")
+            else:
+                content_hash = hash_file_sha1(dir_entry.path)
+                if scrape_cache is not None:
+                    set_scrape_cache_sha1(scrape_cache, dir_entry.path, dir_entry_etag, content_hash)
+        except OSError as e:
+            nss_logger.warning(f"Cannot hash \"{str(dir_entry.path)}\"; {e}")
+            content_hash = None
+        content_hashes.append(content_hash)
+    preference_keys = [(is_electra_dir_entry(dir_entry), dir_entry.path) for dir_entry in dir_entries_list]
+    kept_dir_entries_list, duplicate_groups = dedupe_by_content(dir_entries_list, content_hashes, preference_keys)
+    _record_duplicate_groups(duplicate_groups, [dir_entry.path for dir_entry in dir_entries_list], nss_logger)
+    return kept_dir_entries_list
+
+
+def box_build_accum_df(box_items_list, parse_map, electra_visit_index, nss_logger, scrape_cache=None,
+                       download_workers=1, parse_workers=1, sheet_reader="openpyxl", row_sink=None,
+                       scrape_journal=None, study=None):
+    """
+    Build dataframe of records for eventual REDCap import
 
-    return accum_df.dropna(axis="index", how="all")
+    If `scrape_cache` is passed, Box items whose ID and etag are already in the cache are not downloaded; their cached
+    sheet fields are reused. The cache is updated in place with newly parsed items; since one cache can be shared by
+    several calls, e.g., one per study, pruning it of items no longer found is left to the caller.
 
+    If `scrape_journal` is passed, each newly parsed sheet is recorded in it as soon as it's processed, and sheets
+    already in it, e.g., from a run being resumed, are reused like cached sheets.
 
-def box_build_accum_df(box_items_list, parse_dict, electra_df, nss_logger):
-    """
-    Build dataframe of records for eventual REDCap import
+    Rows are built in the order of `box_items_list` as soon as each sheet is parsed. If `row_sink` is passed, each
+    row is also appended to it as it's built, e.g., to stream rows to an `ExtractWriter`.
 
     :param box_items_list:
-    :param parse_dict:
-    :param electra_df:
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param electra_visit_index: Index of ELECTRA visits from `build_electra_visit_index`
+    :type electra_visit_index: FrozenDict
     :param nss_logger: Logger object for writing to app log
     :type nss_logger: logging.Logger
+    :param scrape_cache: Scrape cache loaded with `load_scrape_cache`
+    :type scrape_cache: dict
+    :param download_workers: Number of threads downloading from Box
+    :type download_workers: int
+    :param parse_workers: Number of processes parsing workbooks
+    :type parse_workers: int
+    :param sheet_reader: Key of reader in `SUMM_SHEET_READERS`
+    :type sheet_reader: str
+    :param row_sink: Object with an `append(row_dict)` method taking each row as it's built
+    :param scrape_journal: Journal of sheets parsed in this run
+    :type scrape_journal: ScrapeJournal
+    :param study: Study all of `box_items_list` belongs to, which sets how they map to REDCap events
+    :type study: Study
     :return:
     """
-    # build empty dataframe
-    accum_df = pd.DataFrame(data=None, index=None, columns=parse_dict.keys())
+    # build row accumulator
+    column_dtypes = get_parse_map_column_dtypes(parse_map.parse_dict, {'redcap_event_name': "string"})
+    accum_rows = RowAccumulator(column_dtypes, len(box_items_list))
+    sheet_metadata = SummarySheetMetadata(electra_visit_index, study)
 
-    # loop over summary sheet DirEntries and process
+    # split summary sheets into those with cached fields and those that need downloading
+    cached_fields_dicts = {}
+    fetch_box_items_list = []
     for box_item in box_items_list:
-        print(f"  {box_item.name}")
-        try:
-            summ_sheet_df = pd.read_excel(box_item.content(), sheet_name=0, header=None, dtype=str)
-        except:
-            summ_sheet_df = pd.DataFrame(data=None)
-            nss_logger.warning(f"Cannot process {box_item.id} with name \"{box_item.name}\"")
-        if not summ_sheet_df.empty:
-            row_dict = box_build_accum_row(summ_sheet_df, parse_dict, box_item, electra_df, nss_logger)
-            accum_df = accum_df.append(row_dict, ignore_index=True)
+        if scrape_cache is not None and is_scrape_cache_hit(scrape_cache, box_item.id, box_item.etag):
+            cached_fields_dicts[box_item.id] = get_scrape_cache_fields(scrape_cache, box_item.id)
+            nss_logger.info(f"Cache hit for {box_item.id} with name \"{box_item.name}\"")
+            get_run_metrics().increment("sheets.cache_hits")
+        elif scrape_journal is not None and scrape_journal.is_hit(box_item.id, box_item.etag):
+            cached_fields_dicts[box_item.id] = scrape_journal.get_fields(box_item.id)
+            if scrape_cache is not None:
+                set_scrape_cache_fields(scrape_cache, box_item.id, box_item.etag, cached_fields_dicts[box_item.id])
+            nss_logger.info(f"Journal hit for {box_item.id} with name \"{box_item.name}\"")
+            get_run_metrics().increment("sheets.journal_hits")
+        else:
+            fetch_box_items_list.append(box_item)
+
+    # download and parse summary sheets that aren't cached; results come back in order, skipping failed sheets
+    fetched_fields = box_fetch_summ_sheet_fields(fetch_box_items_list, parse_map, nss_logger,
+                                                 download_workers, parse_workers, sheet_reader)
+    next_fetched = next(fetched_fields, None)
+
+    # loop over summary sheet Box items in their original order and process
+    for box_item in box_items_list:
+        if box_item.id in cached_fields_dicts:
+            fields_dict = cached_fields_dicts[box_item.id]
+        elif next_fetched is not None and next_fetched[0].id == box_item.id:
+            fields_dict = next_fetched[1]
+            if scrape_cache is not None:
+                set_scrape_cache_fields(scrape_cache, box_item.id, box_item.etag, fields_dict)
+            if scrape_journal is not None:
+                scrape_journal.append(box_item.id, box_item.etag, fields_dict)
+            next_fetched = next(fetched_fields, None)
+        else:
+            fields_dict = None
+        if fields_dict is not None:
+            row_dict = dict(fields_dict)
+            row_dict['redcap_event_name'] = sheet_metadata.box_redcap_event_name(box_item)
+            accum_rows.append(row_dict)
+            if row_sink is not None:
+                row_sink.append(row_dict)
             nss_logger.info(f"Processed {box_item.id} with name \"{box_item.name}\"")
 
-    return accum_df.dropna(axis="index", how="all")
+    return accum_rows.to_dataframe().dropna(axis="index", how="all")
 
 
-def normalize_ummap_id(id_):
+def get_local_file_etag(dir_entry):
     """
-    Normalize UMMAP IDs
+    Get a stand-in for a Box etag for a local summary sheet, changing whenever the file is modified
 
-    :param id_: UMMAP ID
-    :type id_: str
-    :return: normalized UMMAP ID
+    :param dir_entry: Spreadsheet DirEntry object
+    :type dir_entry: os.DirEntry
     :rtype: str
     """
-    id_str = str(id_)
-    if match(r'^UM\d{8}$', id_str):
-        return id_str
-    elif match(r'^\d{3,4}$', str(id_str)):
-        return "UM" + "0" * (8 - len(id_str)) + id_str
-    else:
-        raise Exception(f"UMMAP ID {id_str} doesn't conform to expected form")
-
+    dir_entry_stat = dir_entry.stat()
+    return f"{dir_entry_stat.st_mtime_ns}-{dir_entry_stat.st_size}"
 
-def add_prefix_to_fu_visits(df, cols, prefix):
-    """
 
-    :param df:
-    :param cols:
-    :param prefix:
-    :return:
+def local_fetch_summ_sheet_fields(dir_entries_list, parse_map, nss_logger, parse_workers=1, sheet_reader="openpyxl"):
     """
-    df = df.copy(deep=True)
+    Parse local summary sheets, yielding results in the same order as `dir_entries_list`
 
-    for col in cols:
-        if prefix == "fu_" and not df[col].isnull().all():
-            df.loc[df['visit_type'].eq("IF"), prefix + col] = df.loc[df['visit_type'].eq("IF"), col]
-            df.loc[df['visit_type'].eq("IF"), col] = pd.NA  # None, pd.NA, np.nan
-        elif prefix == "tele_" and not df[col].isnull().all():
-            df.loc[df['visit_type'].eq("TF"), prefix + col] = df.loc[df['visit_type'].eq("TF"), col]
-            df.loc[df['visit_type'].eq("TF"), col] = pd.NA  # None, pd.NA, np.nan
-
-    return df
+    With more than one worker, workbooks are parsed in a process pool with at most `2 * parse_workers` sheets in
+    flight at once. Sheets that can't be parsed are logged and skipped.
 
-
-def get_ivp_complete(df):
-    """
-
-    :param df:
+    :param dir_entries_list: Spreadsheet DirEntry objects
+    :type dir_entries_list: list[os.DirEntry]
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param nss_logger: Logger object for writing to app log
+    :type nss_logger: logging.Logger
+    :param parse_workers: Number of processes parsing workbooks
+    :type parse_workers: int
+    :param sheet_reader: Key of reader in `SUMM_SHEET_READERS`
+    :type sheet_reader: str
+    :return: generator of DirEntry objects and their dicts of field names to converted values
+    """
+    if parse_workers <= 1:
+        for dir_entry in dir_entries_list:
+            print(f"  {dir_entry.name}")
+            try:
+                fields_dict, list_logger, sheet_metrics = \
+                    parse_summ_sheet(dir_entry.path, parse_map, dir_entry.path, sheet_reader)
+            except:
+                nss_logger.warning(f"Cannot process \"{str(dir_entry.path)}\"")
+                get_run_metrics().increment("sheets.failed")
+                continue
+            list_logger.replay(nss_logger)
+            get_run_metrics().merge(sheet_metrics)
+            yield dir_entry, fields_dict
+        return
+
+    window_size = 2 * parse_workers
+    with ProcessPoolExecutor(max_workers=parse_workers) as parse_pool:
+        in_flight = deque()
+        dir_entries_iter = iter(dir_entries_list)
+        while True:
+            # keep the window of in-flight sheets full; DirEntry objects can't be pickled, so workers get paths
+            for dir_entry in dir_entries_iter:
+                in_flight.append((dir_entry, parse_pool.submit(parse_summ_sheet, dir_entry.path, parse_map,
+                                                               dir_entry.path, sheet_reader)))
+                if len(in_flight) >= window_size:
+                    break
+            if not in_flight:
+                break
+            # wait on the oldest sheet so results come back in order
+            dir_entry, result_future = in_flight.popleft()
+            print(f"  {dir_entry.name}")
+            try:
+                fields_dict, list_logger, sheet_metrics = result_future.result()
+            except:
+                nss_logger.warning(f"Cannot process \"{str(dir_entry.path)}\"")
+                get_run_metrics().increment("sheets.failed")
+                continue
+            list_logger.replay(nss_logger)
+            get_run_metrics().merge(sheet_metrics)
+            yield dir_entry, fields_dict
+
+
+def local_build_accum_df(dir_entries_list, parse_map, electra_visit_index, nss_logger, scrape_cache=None,
+                         parse_workers=1, sheet_reader="openpyxl", row_sink=None, scrape_journal=None, study=None):
+    """
+    Build dataframe of records for eventual REDCap import from local summary sheets, e.g., in a synced Box Drive folder
+
+    Works like `box_build_accum_df`, with each file's path standing in for its Box ID and its modification time and
+    size standing in for its Box etag in `scrape_cache` and `scrape_journal`.
+
+    :param dir_entries_list: Spreadsheet DirEntry objects
+    :type dir_entries_list: list[os.DirEntry]
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param electra_visit_index: Index of ELECTRA visits from `build_electra_visit_index`
+    :type electra_visit_index: FrozenDict
+    :param nss_logger: Logger object for writing to app log
+    :type nss_logger: logging.Logger
+    :param scrape_cache: Scrape cache loaded with `load_scrape_cache`
+    :type scrape_cache: dict
+    :param parse_workers: Number of processes parsing workbooks
+    :type parse_workers: int
+    :param sheet_reader: Key of reader in `SUMM_SHEET_READERS`
+    :type sheet_reader: str
+    :param row_sink: Object with an `append(row_dict)` method taking each row as it's built
+    :param scrape_journal: Journal of sheets parsed in this run
+    :type scrape_journal: ScrapeJournal
+    :param study: Study all of `dir_entries_list` belongs to, which sets how they map to REDCap events
+    :type study: Study
     :return:
     """
-    ivp_complete = (df.ivp_a1_complete == "2") & \
-                   (df.ivp_a2_complete == "2") & \
-                   (df.ivp_a3_complete == "2") & \
-                   (df.ivp_a4_complete == "2") & \
-                   (df.ivp_a5_complete == "2") & \
-                   (df.ivp_b1_complete == "2") & \
-                   (df.ivp_b4_complete == "2") & \
-                   (df.ivp_b5_complete == "2") & \
-                   (df.ivp_b6_complete == "2") & \
-                   (df.ivp_b7_complete == "2") & \
-                   (df.ivp_b8_complete == "2") & \
-                   (df.ivp_b9_complete == "2") & \
-                   (df.ivp_d1_complete == "2") & \
-                   (df.ivp_d2_complete == "2")
-    return ivp_complete
+    # build row accumulator
+    column_dtypes = get_parse_map_column_dtypes(parse_map.parse_dict, {'redcap_event_name': "string"})
+    accum_rows = RowAccumulator(column_dtypes, len(dir_entries_list))
+    sheet_metadata = SummarySheetMetadata(electra_visit_index, study)
 
+    # split summary sheets into those with cached fields and those that need parsing
+    dir_entry_etags = {dir_entry.path: get_local_file_etag(dir_entry) for dir_entry in dir_entries_list}
+    cached_fields_dicts = {}
+    parse_dir_entries_list = []
+    for dir_entry in dir_entries_list:
+        if scrape_cache is not None and \
+                is_scrape_cache_hit(scrape_cache, dir_entry.path, dir_entry_etags[dir_entry.path]):
+            cached_fields_dicts[dir_entry.path] = get_scrape_cache_fields(scrape_cache, dir_entry.path)
+            nss_logger.info(f"Cache hit for \"{str(dir_entry.path)}\"")
+            get_run_metrics().increment("sheets.cache_hits")
+        elif scrape_journal is not None and \
+                scrape_journal.is_hit(dir_entry.path, dir_entry_etags[dir_entry.path]):
+            cached_fields_dicts[dir_entry.path] = scrape_journal.get_fields(dir_entry.path)
+            if scrape_cache is not None:
+                set_scrape_cache_fields(scrape_cache, dir_entry.path, dir_entry_etags[dir_entry.path],
+                                        cached_fields_dicts[dir_entry.path])
+            nss_logger.info(f"Journal hit for \"{str(dir_entry.path)}\"")
+            get_run_metrics().increment("sheets.journal_hits")
+        else:
+            parse_dir_entries_list.append(dir_entry)
 
-def get_fvp_complete(df):
-    """
-
-    :param df:
-    :return:
-    """
-    fvp_complete = (df.fvp_a1_complete == "2") & \
-                   (df.fvp_a2_complete == "2") & \
-                   (df.fvp_a3_complete == "2") & \
-                   (df.fvp_a4_complete == "2") & \
-                   (df.fvp_b1_complete == "2") & \
-                   (df.fvp_b4_complete == "2") & \
-                   (df.fvp_b5_complete == "2") & \
-                   (df.fvp_b6_complete == "2") & \
-                   (df.fvp_b7_complete == "2") & \
-                   (df.fvp_b8_complete == "2") & \
-                   (df.fvp_b9_complete == "2") & \
-                   (df.fvp_d1_complete == "2") & \
-                   (df.fvp_d2_complete == "2")
-    return fvp_complete
+    # parse summary sheets that aren't cached; results come back in order, skipping failed sheets
+    parsed_fields = local_fetch_summ_sheet_fields(parse_dir_entries_list, parse_map, nss_logger, parse_workers,
+                                                  sheet_reader)
+    next_parsed = next(parsed_fields, None)
 
+    # loop over summary sheet DirEntries in their original order and process
+    for dir_entry in dir_entries_list:
+        if dir_entry.path in cached_fields_dicts:
+            fields_dict = cached_fields_dicts[dir_entry.path]
+        elif next_parsed is not None and next_parsed[0].path == dir_entry.path:
+            fields_dict = next_parsed[1]
+            if scrape_cache is not None:
+                set_scrape_cache_fields(scrape_cache, dir_entry.path, dir_entry_etags[dir_entry.path], fields_dict)
+            if scrape_journal is not None:
+                scrape_journal.append(dir_entry.path, dir_entry_etags[dir_entry.path], fields_dict)
+            next_parsed = next(parsed_fields, None)
+        else:
+            fields_dict = None
+        if fields_dict is not None:
+            row_dict = dict(fields_dict)
+            row_dict['redcap_event_name'] = sheet_metadata.local_redcap_event_name(dir_entry)
+            accum_rows.append(row_dict)
+            if row_sink is not None:
+                row_sink.append(row_dict)
+            nss_logger.info(f"Processed \"{str(dir_entry.path)}\"")
 
-def get_tvp_complete(df):
+    return accum_rows.to_dataframe().dropna(axis="index", how="all")
+
+
+# Columns collected at video tele-visits but not a part of NACC UDS Telephone Follow-up Packet (TVP)
+NON_TVP_TELE_VISIT_COLUMNS = [
+    "otraila",
+    "otrlarr",
+    "vnttotw",
+    "vntpcnc",
+    "otrailb",
+    "otrlbrr",
+    "tele_animals_c2",
+    "tele_animals_c2z",
+    "tele_craftdrez",
+    "tele_craftdvrz",
+    "tele_craftparaz",
+    "tele_craftvrsz",
+    "tele_digbacctz",
+    "tele_digbacspanz",
+    "tele_digforctz",
+    "tele_digforspanz",
+    "tele_mintpcngz",
+    "tele_minttots",
+    "tele_minttotsz",
+    "tele_mocatots",
+    "tele_mocaz",
+    "tele_udsverfcz",
+    "tele_udsverlcz",
+    "tele_udsbentc",
+    "tele_udsbentcz",
+    "tele_udsbentd",
+    "tele_udsbentdz",
+    "tele_veg_c2",
+    "tele_veg_c2z",
+    "tele_npiq_score",
+    "tele_fas_score",
+]
+
+
+def add_prefixes_to_fu_visits(df, fvp_cols, tvp_cols):
+    """
+    Move NACC column values of in-person follow-up ("IF") visits to "fu_" columns and of tele-visit follow-up ("TF")
+    visits to "tele_" columns
+
+    Prefixed columns are only added for columns that have any values left to move, as with one pass per prefix.
+    `df` is changed in place and returned.
+
+    :param df: DataFrame with `visit_type` and NACC columns
+    :type df: pandas.DataFrame
+    :param fvp_cols: NACC columns collected at in-person follow-up visits
+    :type fvp_cols: list[str]
+    :param tvp_cols: NACC columns collected at tele-visit follow-up visits
+    :type tvp_cols: list[str]
+    :return: DataFrame with prefixed columns
+    :rtype: pandas.DataFrame
     """
+    prefixed_dfs = []
+    for prefix, visit_type, cols in (("fu_", "IF", fvp_cols), ("tele_", "TF", tvp_cols)):
+        visit_type_mask = df['visit_type'].eq(visit_type).fillna(False).astype(bool)
+        cols_with_values = df[cols].columns[df[cols].notna().any().to_numpy()].tolist()
+        if not cols_with_values:
+            continue
+        prefixed_dfs.append(df[cols_with_values].where(visit_type_mask, axis=0).add_prefix(prefix))
+        df.loc[visit_type_mask, cols_with_values] = pd.NA
 
-    :param df:
-    :return:
-    """
-    tvp_complete = (df.tvp_t1_complete == "2") & \
-                   (df.tvp_a1_complete == "2") & \
-                   (df.tvp_a2_complete == "2") & \
-                   (df.tvp_a3_complete == "2") & \
-                   (df.tvp_a4_complete == "2") & \
-                   (df.tvp_b4_complete == "2") & \
-                   (df.tvp_b5_complete == "2") & \
-                   (df.tvp_b7_complete == "2") & \
-                   (df.tvp_b9_complete == "2") & \
-                   (df.tvp_d1_complete == "2") & \
-                   (df.tvp_d2_complete == "2")
-    return tvp_complete
+    for prefixed_df in prefixed_dfs:
+        df[prefixed_df.columns.tolist()] = prefixed_df
+
+    return df
 
 
-def retrieve_redcap_dataframe(redcap_api_uri, redcap_project_token, fields_raw, vp=True):
+def retrieve_redcap_dataframe(redcap_api_uri, redcap_project_token, fields_raw, vp=True, batch_size=None,
+                              max_workers=1, snapshot_path=None, full_refresh=False, typed=False):
     """
     Retrieve data via REDCap as a pandas DataFrame
 
@@ -479,69 +675,80 @@ def retrieve_redcap_dataframe(redcap_api_uri, redcap_project_token, fields_raw,
     :type fields_raw: list[str]
     :param vp: Verify peer flag
     :type vp: bool
+    :param batch_size: Number of records per request; if not passed, all records are retrieved in one request
+    :type batch_size: int
+    :param max_workers: Number of concurrent requests when retrieving in batches
+    :type max_workers: int
+    :param snapshot_path: Path of local REDCap snapshot JSON file; only records changed since the snapshot was saved
+        are retrieved
+    :type snapshot_path: str
+    :param full_refresh: Retrieve every record even if there's a snapshot
+    :type full_refresh: bool
+    :param typed: Convert the kept records to compact dtypes with `convert_redcap_dataframe_dtypes`
+    :type typed: bool
     :return: DataFrame of REDCap data
     :rtype: pandas.DataFrame
     """
-    fields = ",".join(fields_raw)
-    # get data
-    request_dict = {
-        'token': redcap_project_token,
-        'content': 'record',
-        'format': 'json',
-        'type': 'flat',
-        'csvDelimiter': '',
-        'fields': fields,
-        'rawOrLabel': 'raw',
-        'rawOrLabelHeaders': 'raw',
-        'exportCheckboxLabel': 'false',
-        'exportSurveyFields': 'false',
-        'exportDataAccessGroups': 'false',
-        'returnFormat': 'json'
-    }
-    r = requests.post(redcap_api_uri, request_dict, verify=vp)
-    df_raw = pd.DataFrame.from_dict(r.json())
-
-    df_clean = df_raw[df_raw.ptid.str.match(r'^UM\d{8}$') &
-                    (df_raw.redcap_event_name.str.match(r'^visit_\d+_arm_1$') |
-                     df_raw.redcap_event_name.str.match(r'^sv\d+_arm_1$')) &
-                    pd.notna(df_raw.form_date) &
-                    (df_raw.form_date != "")]
+    if batch_size or snapshot_path:
+        df_raw = export_redcap_dataframe(redcap_api_uri, redcap_project_token, fields_raw, vp,
+                                         batch_size or REDCAP_DEFAULT_BATCH_SIZE, max_workers, snapshot_path,
+                                         full_refresh)
+    else:
+        fields = ",".join(fields_raw)
+        # get data
+        request_dict = {
+            'token': redcap_project_token,
+            'content': 'record',
+            'format': 'json',
+            'type': 'flat',
+            'csvDelimiter': '',
+            'fields': fields,
+            'rawOrLabel': 'raw',
+            'rawOrLabelHeaders': 'raw',
+            'exportCheckboxLabel': 'false',
+            'exportSurveyFields': 'false',
+            'exportDataAccessGroups': 'false',
+            'returnFormat': 'json'
+        }
+        with get_redcap_session() as session:
+            r = session.post(redcap_api_uri, request_dict, verify=vp)
+        df_raw = pd.DataFrame.from_dict(r.json())
+
+    df_clean = df_raw[get_redcap_records_mask(df_raw)]
+    if typed:
+        df_clean = convert_redcap_dataframe_dtypes(df_clean)
 
     return df_clean
 
 
-def import_redcap_data(redcap_api_uri, redcap_project_token, importable_csv_data, nss_logger, vp=True):
+########################
+# Box Client Functions #
+
+class BoxMetricsNetwork(DefaultNetwork):
     """
-    Import data via REDCap API
+    Box SDK network layer that holds every Box API call to its host's limits and records it in the run metrics
 
-    :param redcap_api_uri:
-    :param redcap_project_token:
-    :param importable_csv_data:
-    :param nss_logger: Logger object for writing to app log
-    :type nss_logger: logging.Logger
-    :param vp:
-    """
-    request_dict = {
-        'token': redcap_project_token,
-        'content': 'record',
-        'format': 'csv',
-        'type': 'flat',
-        'overwriteBehavior': 'normal',
-        'data': importable_csv_data,
-        'returnContent': 'count',
-        'returnFormat': 'json'
-    }
-    request_result = requests.post(redcap_api_uri, request_dict, verify=vp)
-    if request_result.status_code == 200:
-        nss_logger.info(f"REDCap Import - Imported {request_result.json()['count']} records")
-    elif request_result.status_code == 400:
-        nss_logger.error(f"REDCap Error - {request_result.reason} - {request_result.json()['error']}")
-    else:
-        nss_logger.error(f"REDCap Error - {request_result.reason} - {request_result.content}")
+    A 429 response pauses every request to the host for the response's `Retry-After`; the Box SDK then retries the
+    request itself.
+    """
 
+    def request(self, method, url, access_token, **kwargs):
+        host_limiter = get_host_limiter(url)
+        with host_limiter.limit():
+            start = time.perf_counter()
+            try:
+                response = super(BoxMetricsNetwork, self).request(method, url, access_token, **kwargs)
+            except Exception:
+                get_run_metrics().record_operation("box.api", time.perf_counter() - start, failed=True)
+                raise
+        if response.status_code == 429:
+            get_run_metrics().increment("box.api.rate_limited")
+            host_limiter.pause(get_retry_after_seconds(response.headers))
+        get_run_metrics().record_operation("box.api", time.perf_counter() - start,
+                                           int(response.headers.get('Content-Length') or 0),
+                                           failed=not response.ok)
+        return response
 
-########################
-# Box Client Functions #
 
 def get_box_authenticated_client(box_json_config_path):
     """
@@ -554,19 +761,5 @@ def get_box_authenticated_client(box_json_config_path):
         raise ValueError("`box_json_config_path` must be a path to the JSON config file for your Box JWT app")
     auth = JWTAuth.from_settings_file(box_json_config_path)
     auth.authenticate_instance()
-    return Client(auth)
-
+    return Client(auth, session=AuthorizedSession(auth, network_layer=BoxMetricsNetwork()))
 
-def get_box_subitems(box_client, box_folder, fields):
-    """
-    Get a collection of all immediate folder items
-
-    :param box_client:
-    :param box_folder:
-    :param fields:
-    """
-    items = []
-    # fetch folder items and add subfolders to list
-    for item in box_client.folder(folder_id=box_folder['id']).get_items(fields=fields):
-        items.append(item)
-    return items
@@ -0,0 +1,145 @@
+import json
+from re import compile, error
+
+
+# Converters for the `dtype` entries in `parse_map.json`
+PARSE_MAP_CONVERTERS = {
+    "int": int,
+    "float": float,
+    "str": str,
+}
+PARSE_MAP_SPEC_KEYS = frozenset(["anchor", "row_diff", "col_diff", "dtype"])
+# Raw cell values (stripped, upper-cased) that are read as missing
+PARSE_MAP_NA_STRINGS = frozenset(["", "NA", "N/A"])
+
+
+class FieldPlan:
+    """
+    Where to find one parse map field relative to its anchor cell, and how to convert its raw value
+    """
+    __slots__ = ("field", "anchor", "row_diff", "col_diff", "dtype", "convert")
+
+    def __init__(self, field, anchor, row_diff, col_diff, dtype):
+        self.field = field
+        self.anchor = anchor
+        self.row_diff = row_diff
+        self.col_diff = col_diff
+        self.dtype = dtype
+        self.convert = PARSE_MAP_CONVERTERS[dtype]
+
+
+class AnchorPlan:
+    """
+    An anchor's compiled regex and the fields found relative to its cell
+    """
+    __slots__ = ("anchor", "regex", "field_plans", "max_row_diff")
+
+    def __init__(self, anchor, field_plans):
+        self.anchor = anchor
+        self.regex = compile(anchor)
+        self.field_plans = tuple(field_plans)
+        self.max_row_diff = max(max(field_plan.row_diff for field_plan in self.field_plans), 0)
+
+
+def validate_parse_dict(parse_dict):
+    """
+    Check every field of a parse map, collecting all problems rather than stopping at the first
+
+    :param parse_dict: Parse map loaded from `parse_map.json`
+    :type parse_dict: dict
+    :return: list of problems; empty if the parse map is valid
+    :rtype: list[str]
+    """
+    problems = []
+    for raw_field, spec_dict in parse_dict.items():
+        if not isinstance(spec_dict, dict):
+            problems.append(f"`{raw_field}` is not an object")
+            continue
+        if spec_dict.keys() != PARSE_MAP_SPEC_KEYS:
+            problems.append(f"`{raw_field}` has keys {sorted(spec_dict)}; expected {sorted(PARSE_MAP_SPEC_KEYS)}")
+            continue
+        if not isinstance(spec_dict['anchor'], str) or not spec_dict['anchor']:
+            problems.append(f"`{raw_field}` anchor is not a non-empty string")
+        else:
+            try:
+                compile(spec_dict['anchor'])
+            except error as e:
+                problems.append(f"`{raw_field}` anchor \"{spec_dict['anchor']}\" is not a valid regex; {e}")
+        for diff_key in ("row_diff", "col_diff"):
+            if not isinstance(spec_dict[diff_key], int) or isinstance(spec_dict[diff_key], bool):
+                problems.append(f"`{raw_field}` {diff_key} is not an integer")
+        if spec_dict['dtype'] not in PARSE_MAP_CONVERTERS:
+            problems.append(f"Unexpected type string \"{spec_dict['dtype']}\" for `{raw_field}`")
+    return problems
+
+
+class ParseMap:
+    """
+    Parse map compiled once into an extraction plan: fields grouped by anchor, anchors compiled to regexes, and each
+    field's converter bound to it
+    """
+    __slots__ = ("parse_dict", "field_plans", "anchor_plans", "any_anchor_regex")
+
+    def __init__(self, parse_dict):
+        """
+        :param parse_dict: Parse map loaded from `parse_map.json`
+        :type parse_dict: dict
+        """
+        problems = validate_parse_dict(parse_dict)
+        if problems:
+            raise ValueError("Invalid parse_map.json; " + "; ".join(problems))
+
+        self.parse_dict = parse_dict
+        self.field_plans = tuple(FieldPlan(raw_field, spec_dict['anchor'], spec_dict['row_diff'],
+                                           spec_dict['col_diff'], spec_dict['dtype'])
+                                 for raw_field, spec_dict in parse_dict.items())
+
+        anchor_field_plans = {}
+        for field_plan in self.field_plans:
+            anchor_field_plans.setdefault(field_plan.anchor, []).append(field_plan)
+        self.anchor_plans = tuple(AnchorPlan(anchor, field_plans)
+                                  for anchor, field_plans in anchor_field_plans.items())
+
+        # single alternation that matches a value if any anchor matches it
+        self.any_anchor_regex = compile("|".join(f"(?:{anchor_plan.anchor})" for anchor_plan in self.anchor_plans))
+
+    def convert_raw_field_values(self, raw_values, path, nss_logger):
+        """
+        Convert raw field values read from a summary sheet with each field's bound converter
+
+        :param raw_values: dict of field names to raw string values (`None` for empty cells)
+        :type raw_values: dict[str, str]
+        :param path: Path or ID of file that `raw_values` came from
+        :type path: str
+        :param nss_logger: Logger object for writing to app log
+        :type nss_logger: logging.Logger
+        :return: dict of field names to converted values, in parse map order
+        :rtype: dict
+        """
+        fields_dict = {}
+        for field_plan in self.field_plans:
+            if field_plan.field not in raw_values:
+                continue
+            raw_value = raw_values[field_plan.field]
+            if raw_value is None or raw_value.strip().upper() in PARSE_MAP_NA_STRINGS:
+                fields_dict[field_plan.field] = None
+                continue
+            try:
+                fields_dict[field_plan.field] = field_plan.convert(raw_value)
+            except ValueError as e:
+                fields_dict[field_plan.field] = None
+                nss_logger.warning(f"Raw value in sheet not compatible with defined dtype at {field_plan.anchor} in "
+                                   f"{str(path)}; {e}")
+        return fields_dict
+
+
+def load_parse_map(parse_map_path):
+    """
+    Load and compile `parse_map.json`; an invalid parse map fails here rather than partway through a run
+
+    :param parse_map_path: Path of parse map JSON file
+    :type parse_map_path: str
+    :rtype: ParseMap
+    """
+    with open(parse_map_path, "r") as parse_map_file:
+        return ParseMap(json.load(parse_map_file))
@@ -0,0 +1,137 @@
+import json
+import numpy as np
+import pandas as pd
+
+
+# REDCap `*_complete` field codes
+REDCAP_FORM_INCOMPLETE = 0
+REDCAP_FORM_UNVERIFIED = 1
+REDCAP_FORM_COMPLETE = 2
+# Code given to blank `*_complete` values when they're encoded as int8
+REDCAP_FORM_MISSING = -1
+
+
+def load_completion_rules(completion_rules_path):
+    """
+    Load form completion rules from `completion_rules.json`
+
+    The rules are a list of `required` `*_complete` fields and a dict of `packets` to lists of `*_complete` fields. A
+    record is complete if every required field and every field of at least one packet is complete.
+
+    :param completion_rules_path: Path of completion rules JSON file
+    :type completion_rules_path: str
+    :return: dict with `required` fields and `packets`
+    :rtype: dict
+    """
+    with open(completion_rules_path, "r") as completion_rules_file:
+        completion_rules = json.load(completion_rules_file)
+
+    if not completion_rules.get('packets'):
+        raise ValueError(f"No packets in {completion_rules_path}")
+    completion_rules.setdefault('required', [])
+    return completion_rules
+
+
+def get_completion_rules_fields(completion_rules):
+    """
+    Get every `*_complete` field named in completion rules, without duplicates, required fields first
+
+    :param completion_rules: Completion rules from `load_completion_rules`
+    :type completion_rules: dict
+    :rtype: list[str]
+    """
+    fields = list(completion_rules['required'])
+    for packet_fields in completion_rules['packets'].values():
+        fields.extend(packet_fields)
+    return list(dict.fromkeys(fields))
+
+
+def encode_redcap_complete_columns(df, complete_fields=None):
+    """
+    Encode `*_complete` columns of REDCap data as int8 codes, with blanks as `REDCAP_FORM_MISSING`
+
+    :param df: DataFrame of REDCap data with `*_complete` columns as strings
+    :type df: pandas.DataFrame
+    :param complete_fields: Columns to encode; defaults to every column ending in `_complete`
+    :type complete_fields: list[str]
+    :return: DataFrame with encoded columns
+    :rtype: pandas.DataFrame
+    """
+    if complete_fields is None:
+        complete_fields = [column for column in df.columns if column.endswith("_complete")]
+    df = df.copy()
+    for field in complete_fields:
+        df[field] = pd.to_numeric(df[field], errors="coerce").fillna(REDCAP_FORM_MISSING).astype("int8")
+    return df
+
+
+def convert_redcap_dataframe_dtypes(df, complete_fields=None):
+    """
+    Convert REDCap data to compact dtypes: `ptid` and `redcap_event_name` to categoricals, since each participant has
+    several events and a project has only a few events, and `*_complete` columns to int8 codes as in
+    `encode_redcap_complete_columns`
+
+    Other columns are left as strings. `get_form_complete` and `get_completed_forms_mask` work on either form.
+
+    :param df: DataFrame of REDCap data as exported
+    :type df: pandas.DataFrame
+    :param complete_fields: `*_complete` columns to encode; defaults to every column ending in `_complete`
+    :type complete_fields: list[str]
+    :return: DataFrame with converted columns
+    :rtype: pandas.DataFrame
+    """
+    df = encode_redcap_complete_columns(df, complete_fields)
+    df['ptid'] = df['ptid'].astype("category")
+    df['redcap_event_name'] = df['redcap_event_name'].astype("category")
+    return df
+
+
+def get_form_complete(complete_values):
+    """
+    Get whether each value of a `*_complete` column marks its form complete, whether the column holds REDCap's raw
+    strings or int8 codes from `encode_redcap_complete_columns`
+
+    :param complete_values: `*_complete` column
+    :type complete_values: pandas.Series
+    :rtype: pandas.Series
+    """
+    if pd.api.types.is_numeric_dtype(complete_values):
+        return complete_values.eq(REDCAP_FORM_COMPLETE)
+    return complete_values.eq(str(REDCAP_FORM_COMPLETE))
+
+
+def get_completed_forms_mask(df, completion_rules):
+    """
+    Get whether each record of REDCap data is complete under `completion_rules`
+
+    Every `*_complete` column the rules name is compared against the complete code once, as a single 2-D array; each
+    packet then reduces its columns of that array, and the packets and required fields are combined without building
+    any intermediate Series.
+
+    :param df: DataFrame of REDCap data with `*_complete` columns as raw strings or int8 codes
+    :type df: pandas.DataFrame
+    :param completion_rules: Completion rules from `load_completion_rules`
+    :type completion_rules: dict
+    :return: boolean Series aligned to `df`
+    :rtype: pandas.Series
+    """
+    fields = get_completion_rules_fields(completion_rules)
+    missing_fields = [field for field in fields if field not in df.columns]
+    if missing_fields:
+        raise KeyError(f"Completion rules fields {missing_fields} not in REDCap data")
+    field_idxs = {field: field_idx for field_idx, field in enumerate(fields)}
+
+    if all(pd.api.types.is_numeric_dtype(df[field]) for field in fields):
+        is_complete = df[fields].to_numpy() == REDCAP_FORM_COMPLETE
+    else:
+        complete_codes = np.array([REDCAP_FORM_COMPLETE if pd.api.types.is_numeric_dtype(df[field])
+                                   else str(REDCAP_FORM_COMPLETE) for field in fields], dtype=object)
+        is_complete = (df[fields].to_numpy(dtype=object) == complete_codes).astype(bool)
+
+    packets_complete = np.column_stack([
+        is_complete[:, [field_idxs[field] for field in packet_fields]].all(axis=1)
+        for packet_fields in completion_rules['packets'].values()
+    ])
+    required_complete = is_complete[:, [field_idxs[field] for field in completion_rules['required']]].all(axis=1)
+
+    return pd.Series(required_complete & packets_complete.any(axis=1), index=df.index)
@@ -0,0 +1,207 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+from redcap_export import *
+
+
+# Baselines `redcap_import_diff` can compare against: nothing, current REDCap values, or the rows and fields earlier
+# runs imported successfully
+REDCAP_DIFF_BASELINES = ("none", "redcap", "imported")
+
+
+def export_redcap_baseline_dataframe(redcap_api_uri, redcap_project_token, extract_df, vp=True,
+                                     batch_size=REDCAP_DEFAULT_BATCH_SIZE, max_workers=1, record_id_field="ptid"):
+    """
+    Export the current REDCap values of an extract's fields for the extract's records
+
+    :param redcap_api_uri: URI of REDCap instance
+    :type redcap_api_uri: str
+    :param redcap_project_token: Token of REDCap project to pull data from
+    :type redcap_project_token: str
+    :param extract_df: DataFrame of records to import
+    :type extract_df: pandas.DataFrame
+    :param vp: Verify peer flag
+    :type vp: bool
+    :param batch_size: Number of records per request
+    :type batch_size: int
+    :param max_workers: Number of concurrent requests
+    :type max_workers: int
+    :param record_id_field: Record ID field of REDCap project
+    :type record_id_field: str
+    :return: DataFrame of REDCap data
+    :rtype: pandas.DataFrame
+    """
+    fields = [record_id_field] + [column for column in extract_df.columns
+                                  if column not in (record_id_field, 'redcap_event_name')]
+    record_ids = extract_df[record_id_field].drop_duplicates().tolist()
+    with get_redcap_session(max_workers) as session:
+        return export_redcap_records(session, redcap_api_uri, redcap_project_token, fields, record_ids, vp,
+                                     batch_size, max_workers)
+
+
+def _are_values_equal(new_values, old_values):
+    """
+    Compare two columns of values as REDCap would store them, i.e., as text with numbers compared by value
+    """
+    new_strs = new_values.astype("string").fillna("")
+    old_strs = old_values.astype("string").fillna("")
+    new_nums = pd.to_numeric(new_strs, errors="coerce")
+    old_nums = pd.to_numeric(old_strs, errors="coerce")
+    are_nums_equal = (new_nums == old_nums).fillna(False).astype(bool)
+    return ((new_strs == old_strs) | are_nums_equal).to_numpy()
+
+
+def diff_redcap_records(extract_df, baseline_df, key_fields=("ptid", "redcap_event_name")):
+    """
+    Compare extract records against baseline records with the same keys, keeping only rows and fields that changed
+
+    A field has changed if its extract value isn't blank and differs from the baseline value. Blank extract values are
+    never sent; a REDCap import with `overwriteBehavior` "normal" wouldn't clear the field anyway. Rows whose keys
+    aren't in the baseline are always kept, so their records get created. Of extract rows with the same keys, e.g.,
+    from two differing sheets of one visit, only the last is kept, as REDCap would keep it; the keys of the rows
+    dropped are listed under "duplicate_rows" of the diff report.
+
+    :param extract_df: DataFrame of records to import
+    :type extract_df: pandas.DataFrame
+    :param baseline_df: DataFrame of records to compare against, e.g., current REDCap values or the imported-rows
+        snapshot
+    :type baseline_df: pandas.DataFrame
+    :param key_fields: Fields that identify a row
+    :type key_fields: tuple[str]
+    :return: DataFrame of changed rows with unchanged fields blanked and unchanged columns dropped, and diff report
+    :rtype: (pandas.DataFrame, dict)
+    """
+    key_fields = list(key_fields)
+    value_fields = [column for column in extract_df.columns if column not in key_fields]
+    is_duplicate_row = extract_df.duplicated(subset=key_fields, keep="last").to_numpy()
+    duplicate_records = extract_df.loc[is_duplicate_row, key_fields].astype(object).to_dict(orient="records")
+    extract_values_df = extract_df[~is_duplicate_row].set_index(key_fields)[value_fields]
+
+    if baseline_df is None or baseline_df.empty:
+        baseline_values_df = pd.DataFrame(index=extract_values_df.index, columns=value_fields, dtype="string")
+        is_new_row = np.ones(len(extract_values_df), dtype=bool)
+    else:
+        baseline_values_df = baseline_df.drop_duplicates(subset=key_fields).set_index(key_fields)
+        is_new_row = ~extract_values_df.index.isin(baseline_values_df.index)
+        baseline_values_df = baseline_values_df.reindex(index=extract_values_df.index, columns=value_fields)
+
+    is_changed_df = pd.DataFrame({
+        field: (extract_values_df[field].astype("string").fillna("") != "").to_numpy()
+        & ~_are_values_equal(extract_values_df[field], baseline_values_df[field])
+        for field in value_fields
+    }, index=extract_values_df.index)
+    is_changed_row = is_changed_df.any(axis=1).to_numpy() | is_new_row
+
+    changed_fields = [field for field in value_fields if is_changed_df.loc[is_changed_row, field].any()]
+    is_changed_delta_df = is_changed_df.loc[is_changed_row, changed_fields]
+    delta_df = extract_values_df.loc[is_changed_row, changed_fields].where(is_changed_delta_df).reset_index()
+
+    diff_records = []
+    for row_keys, row_is_new, row_is_changed in zip(is_changed_delta_df.index, is_new_row[is_changed_row],
+                                                    is_changed_delta_df.to_numpy()):
+        diff_records.append({
+            **dict(zip(key_fields, row_keys if len(key_fields) > 1 else (row_keys,))),
+            'is_new': bool(row_is_new),
+            'fields': [field for field, is_changed in zip(changed_fields, row_is_changed) if is_changed],
+        })
+    diff_report = {
+        'rows': len(extract_df),
+        'new_rows': int(is_new_row.sum()),
+        'changed_rows': int((is_changed_row & ~is_new_row).sum()),
+        'unchanged_rows': int((~is_changed_row).sum()),
+        'duplicate_rows': duplicate_records,
+        'changed_cells': int(is_changed_df.to_numpy().sum()),
+        'changed_fields': {field: int(is_changed_df[field].sum()) for field in changed_fields},
+        'records': diff_records,
+    }
+
+    return delta_df, diff_report
+
+
+def load_redcap_imported_snapshot(snapshot_path):
+    """
+    Load snapshot of the rows and fields earlier runs imported into REDCap
+
+    `None` is returned if there's no snapshot file or if it can't be read.
+
+    :param snapshot_path: Path of imported-rows snapshot JSON file
+    :type snapshot_path: str
+    :return: DataFrame of imported rows
+    :rtype: pandas.DataFrame
+    """
+    if not os.path.isfile(snapshot_path):
+        return None
+
+    try:
+        with open(snapshot_path, "r") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+    return pd.DataFrame.from_dict(snapshot['records'])
+
+
+def update_redcap_imported_snapshot(snapshot_df, delta_df, failed_record_ids, key_fields=("ptid", "redcap_event_name"),
+                                    record_id_field="ptid"):
+    """
+    Fold the rows of a finished import into the imported-rows snapshot, as text like REDCap stores them
+
+    Only the records of chunks that imported are folded in; a record whose chunk failed keeps its old snapshot values,
+    so its rows are sent again next run. Blank cells of `delta_df` weren't sent, so they keep their snapshot values.
+
+    :param snapshot_df: DataFrame of imported rows from `load_redcap_imported_snapshot`, or `None`
+    :type snapshot_df: pandas.DataFrame
+    :param delta_df: DataFrame of changed rows that was imported, from `diff_redcap_records`
+    :type delta_df: pandas.DataFrame
+    :param failed_record_ids: Record IDs from `get_failed_redcap_import_records`
+    :type failed_record_ids: list[str]
+    :param key_fields: Fields that identify a row
+    :type key_fields: tuple[str]
+    :param record_id_field: Record ID field of REDCap project
+    :type record_id_field: str
+    :return: DataFrame of imported rows
+    :rtype: pandas.DataFrame
+    """
+    key_fields = list(key_fields)
+    imported_df = delta_df[~delta_df[record_id_field].isin(failed_record_ids)].astype("string")
+    if snapshot_df is None or snapshot_df.empty:
+        return imported_df.reset_index(drop=True)
+
+    snapshot_columns = list(dict.fromkeys(snapshot_df.columns.tolist() + imported_df.columns.tolist()))
+    return imported_df.set_index(key_fields) \
+        .combine_first(snapshot_df.astype("string").drop_duplicates(subset=key_fields).set_index(key_fields)) \
+        .reset_index()[snapshot_columns]
+
+
+def save_redcap_imported_snapshot(snapshot_path, snapshot_df):
+    """
+    Save imported-rows snapshot to JSON file, replacing the old file only once the new one is fully written
+
+    :param snapshot_path: Path of imported-rows snapshot JSON file
+    :type snapshot_path: str
+    :param snapshot_df: DataFrame of imported rows from `update_redcap_imported_snapshot`
+    :type snapshot_df: pandas.DataFrame
+    """
+    tmp_snapshot_path = f"{snapshot_path}.tmp"
+    with open(tmp_snapshot_path, "w") as snapshot_file:
+        json.dump({
+            'records': snapshot_df.astype(object).where(snapshot_df.notna(), None).to_dict(orient="records"),
+        }, snapshot_file)
+    os.replace(tmp_snapshot_path, snapshot_path)
+
+
+def save_redcap_diff_report(report_path, diff_report):
+    """
+    Save REDCap diff report to JSON file, replacing the old file only once the new one is fully written
+
+    :param report_path: Path of REDCap diff report JSON file
+    :type report_path: str
+    :param diff_report: Diff report from `diff_redcap_records`
+    :type diff_report: dict
+    """
+    tmp_report_path = f"{report_path}.tmp"
+    with open(tmp_report_path, "w") as report_file:
+        json.dump(diff_report, report_file, indent=2)
+    os.replace(tmp_report_path, report_path)
@@ -0,0 +1,255 @@
+import json
+import os
+import requests
+import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from host_limits import RateLimitedHTTPAdapter
+from run_metrics import get_requests_metrics_hook
+
+
+# Watermarks are taken from the local clock but compared against REDCap server time, so each incremental export
+# reaches back this far to cover clock and time zone differences
+REDCAP_WATERMARK_OVERLAP = timedelta(hours=24)
+REDCAP_DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+REDCAP_DEFAULT_BATCH_SIZE = 500
+# Records kept from an export: UMMAP participants at UMMAP ("visit_N_arm_1") or ELECTRA ("svN_arm_1") visits
+REDCAP_PTID_REGEX = r'UM\d{8}'
+REDCAP_EVENT_NAME_REGEX = r'(?:visit_|sv)\d+_arm_1'
+
+
+def get_redcap_session(max_workers=1):
+    """
+    Get a requests Session whose connection pool is big enough for `max_workers` concurrent REDCap requests, whose
+    requests are held to the REDCap host's limits and retried when rate limited, and whose responses are recorded in
+    the run metrics
+
+    :param max_workers: Number of threads sharing the session
+    :type max_workers: int
+    :rtype: requests.Session
+    """
+    session = requests.Session()
+    adapter = RateLimitedHTTPAdapter("redcap.api", pool_connections=1, pool_maxsize=max(max_workers, 1))
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.hooks['response'].append(get_requests_metrics_hook("redcap.api"))
+    return session
+
+
+def get_redcap_records_mask(df):
+    """
+    Get which exported REDCap records have a UMMAP `ptid`, a UMMAP or ELECTRA visit `redcap_event_name`, and a
+    `form_date`, in one vectorized pass with a single regex per column
+
+    :param df: DataFrame of REDCap data
+    :type df: pandas.DataFrame
+    :return: boolean Series aligned to `df`
+    :rtype: pandas.Series
+    """
+    return (df['ptid'].str.fullmatch(REDCAP_PTID_REGEX, na=False) &
+            df['redcap_event_name'].str.fullmatch(REDCAP_EVENT_NAME_REGEX, na=False) &
+            df['form_date'].notna() &
+            df['form_date'].ne(""))
+
+
+def _post_redcap_export(session, redcap_api_uri, redcap_project_token, fields, vp, extra_request_dict=None):
+    """
+    POST a REDCap record export request and decode the JSON response into a DataFrame
+
+    :return: DataFrame of REDCap data
+    :rtype: pandas.DataFrame
+    """
+    request_dict = {
+        'token': redcap_project_token,
+        'content': 'record',
+        'format': 'json',
+        'type': 'flat',
+        'csvDelimiter': '',
+        'fields': ",".join(fields),
+        'rawOrLabel': 'raw',
+        'rawOrLabelHeaders': 'raw',
+        'exportCheckboxLabel': 'false',
+        'exportSurveyFields': 'false',
+        'exportDataAccessGroups': 'false',
+        'returnFormat': 'json'
+    }
+    if extra_request_dict:
+        request_dict.update(extra_request_dict)
+    r = session.post(redcap_api_uri, request_dict, verify=vp)
+    r.raise_for_status()
+    return pd.DataFrame.from_dict(r.json())
+
+
+def export_redcap_record_ids(session, redcap_api_uri, redcap_project_token, record_id_field, vp=True,
+                             date_range_begin=None):
+    """
+    Export the IDs of all REDCap records, or of those created or modified since `date_range_begin`
+
+    :param session: requests Session from `get_redcap_session`
+    :type session: requests.Session
+    :param redcap_api_uri: URI of REDCap instance
+    :type redcap_api_uri: str
+    :param redcap_project_token: Token of REDCap project to pull data from
+    :type redcap_project_token: str
+    :param record_id_field: Record ID field of REDCap project
+    :type record_id_field: str
+    :param vp: Verify peer flag
+    :type vp: bool
+    :param date_range_begin: Only export records changed at or after this REDCap server time
+    :type date_range_begin: str
+    :return: unique record IDs in export order
+    :rtype: list[str]
+    """
+    extra_request_dict = {'dateRangeBegin': date_range_begin} if date_range_begin else None
+    ids_df = _post_redcap_export(session, redcap_api_uri, redcap_project_token, [record_id_field], vp,
+                                 extra_request_dict)
+    if ids_df.empty:
+        return []
+    return ids_df[record_id_field].drop_duplicates().tolist()
+
+
+def export_redcap_records(session, redcap_api_uri, redcap_project_token, fields_raw, record_ids, vp=True,
+                          batch_size=REDCAP_DEFAULT_BATCH_SIZE, max_workers=1):
+    """
+    Export REDCap records in batches of `batch_size` record IDs across `max_workers` threads
+
+    Each batch's JSON response is decoded into its own DataFrame as it arrives; batches are concatenated in the order
+    of `record_ids`.
+
+    :param session: requests Session from `get_redcap_session`
+    :type session: requests.Session
+    :param redcap_api_uri: URI of REDCap instance
+    :type redcap_api_uri: str
+    :param redcap_project_token: Token of REDCap project to pull data from
+    :type redcap_project_token: str
+    :param fields_raw: List of fields to retrieve
+    :type fields_raw: list[str]
+    :param record_ids: IDs of records to retrieve
+    :type record_ids: list[str]
+    :param vp: Verify peer flag
+    :type vp: bool
+    :param batch_size: Number of records per request
+    :type batch_size: int
+    :param max_workers: Number of concurrent requests
+    :type max_workers: int
+    :return: DataFrame of REDCap data
+    :rtype: pandas.DataFrame
+    """
+    record_id_batches = [record_ids[i:i + batch_size] for i in range(0, len(record_ids), batch_size)]
+
+    def export_batch(record_id_batch):
+        records_request_dict = {f"records[{i}]": record_id for i, record_id in enumerate(record_id_batch)}
+        return _post_redcap_export(session, redcap_api_uri, redcap_project_token, fields_raw, vp,
+                                   records_request_dict)
+
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+        batch_dfs = list(pool.map(export_batch, record_id_batches))
+
+    if not batch_dfs:
+        return pd.DataFrame(data=None, columns=fields_raw)
+    return pd.concat(batch_dfs, ignore_index=True)
+
+
+def load_redcap_snapshot(snapshot_path, fields_raw):
+    """
+    Load local snapshot of REDCap records saved by a previous export
+
+    `None` is returned if there's no snapshot file, if it can't be read, or if it was saved with different fields.
+
+    :param snapshot_path: Path of REDCap snapshot JSON file
+    :type snapshot_path: str
+    :param fields_raw: List of fields to retrieve
+    :type fields_raw: list[str]
+    :return: dict with the `watermark` the snapshot is current to and a DataFrame of its `records`
+    :rtype: dict
+    """
+    if not os.path.isfile(snapshot_path):
+        return None
+
+    try:
+        with open(snapshot_path, "r") as snapshot_file:
+            snapshot = json.load(snapshot_file)
+    except (OSError, ValueError):
+        return None
+
+    if snapshot.get('fields') != list(fields_raw):
+        return None
+
+    return {'watermark': snapshot['watermark'], 'records': pd.DataFrame.from_dict(snapshot['records'])}
+
+
+def save_redcap_snapshot(snapshot_path, fields_raw, watermark, records_df):
+    """
+    Save local snapshot of REDCap records, replacing the old file only once the new one is fully written
+
+    :param snapshot_path: Path of REDCap snapshot JSON file
+    :type snapshot_path: str
+    :param fields_raw: List of fields retrieved
+    :type fields_raw: list[str]
+    :param watermark: REDCap server time the snapshot is current to
+    :type watermark: str
+    :param records_df: DataFrame of REDCap data
+    :type records_df: pandas.DataFrame
+    """
+    tmp_snapshot_path = f"{snapshot_path}.tmp"
+    with open(tmp_snapshot_path, "w") as snapshot_file:
+        json.dump({
+            'fields': list(fields_raw),
+            'watermark': watermark,
+            'records': records_df.astype(object).where(records_df.notna(), None).to_dict(orient="records"),
+        }, snapshot_file)
+    os.replace(tmp_snapshot_path, snapshot_path)
+
+
+def export_redcap_dataframe(redcap_api_uri, redcap_project_token, fields_raw, vp=True,
+                            batch_size=REDCAP_DEFAULT_BATCH_SIZE, max_workers=1, snapshot_path=None,
+                            full_refresh=False):
+    """
+    Export REDCap records as a DataFrame, first listing record IDs and then exporting the records in batches
+
+    If `snapshot_path` is passed, records are kept in a local snapshot; later exports only fetch the records created
+    or modified since the snapshot's watermark (REDCap's `dateRangeBegin`) and merge them in. Records deleted from
+    REDCap stay in the snapshot until an export with `full_refresh`.
+
+    :param redcap_api_uri: URI of REDCap instance
+    :type redcap_api_uri: str
+    :param redcap_project_token: Token of REDCap project to pull data from
+    :type redcap_project_token: str
+    :param fields_raw: List of fields to retrieve; the first must be the record ID field
+    :type fields_raw: list[str]
+    :param vp: Verify peer flag
+    :type vp: bool
+    :param batch_size: Number of records per request
+    :type batch_size: int
+    :param max_workers: Number of concurrent requests
+    :type max_workers: int
+    :param snapshot_path: Path of REDCap snapshot JSON file
+    :type snapshot_path: str
+    :param full_refresh: Export every record even if there's a snapshot
+    :type full_refresh: bool
+    :return: DataFrame of REDCap data
+    :rtype: pandas.DataFrame
+    """
+    record_id_field = fields_raw[0]
+    new_watermark = (datetime.now() - REDCAP_WATERMARK_OVERLAP).strftime(REDCAP_DATETIME_FORMAT)
+    snapshot = None
+    if snapshot_path and not full_refresh:
+        snapshot = load_redcap_snapshot(snapshot_path, fields_raw)
+
+    session = get_redcap_session(max_workers)
+    with session:
+        date_range_begin = snapshot['watermark'] if snapshot is not None else None
+        record_ids = export_redcap_record_ids(session, redcap_api_uri, redcap_project_token, record_id_field, vp,
+                                              date_range_begin)
+        records_df = export_redcap_records(session, redcap_api_uri, redcap_project_token, fields_raw, record_ids,
+                                           vp, batch_size, max_workers)
+
+    if snapshot is not None and not snapshot['records'].empty:
+        unchanged_records_df = snapshot['records'][~snapshot['records'][record_id_field].isin(record_ids)]
+        records_df = pd.concat([unchanged_records_df, records_df], ignore_index=True)
+
+    if snapshot_path:
+        save_redcap_snapshot(snapshot_path, fields_raw, new_watermark, records_df)
+
+    return records_df
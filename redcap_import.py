@@ -0,0 +1,172 @@
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+from redcap_export import get_redcap_session
+from run_metrics import get_run_metrics
+
+
+REDCAP_DEFAULT_IMPORT_CHUNK_SIZE = 200
+
+
+def chunk_redcap_records(importable_df, chunk_size=REDCAP_DEFAULT_IMPORT_CHUNK_SIZE, record_id_field="ptid"):
+    """
+    Split a DataFrame of REDCap records into chunks of about `chunk_size` rows, keeping all of a record's rows (one per
+    event) in the same chunk
+
+    :param importable_df: DataFrame of records to import
+    :type importable_df: pandas.DataFrame
+    :param chunk_size: Target number of rows per chunk
+    :type chunk_size: int
+    :param record_id_field: Record ID field of REDCap project
+    :type record_id_field: str
+    :return: list of DataFrame chunks
+    :rtype: list[pandas.DataFrame]
+    """
+    chunks = []
+    chunk_row_idxs = []
+    for _, record_df in importable_df.groupby(record_id_field, sort=False):
+        if chunk_row_idxs and len(chunk_row_idxs) + len(record_df) > chunk_size:
+            chunks.append(importable_df.loc[chunk_row_idxs])
+            chunk_row_idxs = []
+        chunk_row_idxs.extend(record_df.index)
+    if chunk_row_idxs:
+        chunks.append(importable_df.loc[chunk_row_idxs])
+    return chunks
+
+
+def post_redcap_import_chunk(session, redcap_api_uri, redcap_project_token, chunk_df, vp=True, max_retries=3,
+                             backoff_seconds=1.0, timeout_seconds=300, record_id_field="ptid"):
+    """
+    Import one chunk of records via REDCap API, retrying server errors and timeouts with exponential backoff
+
+    :param session: requests Session from `get_redcap_session`
+    :type session: requests.Session
+    :param redcap_api_uri: URI of REDCap instance
+    :type redcap_api_uri: str
+    :param redcap_project_token: Token of REDCap project to import data to
+    :type redcap_project_token: str
+    :param chunk_df: DataFrame chunk of records to import
+    :type chunk_df: pandas.DataFrame
+    :param vp: Verify peer flag
+    :type vp: bool
+    :param max_retries: Number of retries after the first attempt
+    :type max_retries: int
+    :param backoff_seconds: Wait before the first retry; doubled for each later retry
+    :type backoff_seconds: float
+    :param timeout_seconds: Request timeout
+    :type timeout_seconds: float
+    :param record_id_field: Record ID field of REDCap project
+    :type record_id_field: str
+    :return: report of the chunk's "records", "rows", "count" imported, "attempts", and "error" (`None` if imported)
+    :rtype: dict
+    """
+    request_dict = {
+        'token': redcap_project_token,
+        'content': 'record',
+        'format': 'csv',
+        'type': 'flat',
+        'overwriteBehavior': 'normal',
+        'data': chunk_df.to_csv(index=False),
+        'returnContent': 'count',
+        'returnFormat': 'json'
+    }
+    chunk_report = {
+        'records': chunk_df[record_id_field].drop_duplicates().tolist(),
+        'rows': len(chunk_df),
+        'count': 0,
+        'attempts': 0,
+        'error': None,
+    }
+
+    for attempt in range(max_retries + 1):
+        if attempt:
+            time.sleep(backoff_seconds * 2 ** (attempt - 1))
+        chunk_report['attempts'] = attempt + 1
+        try:
+            request_result = session.post(redcap_api_uri, request_dict, verify=vp, timeout=timeout_seconds)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            chunk_report['error'] = f"{type(e).__name__} - {e}"
+            get_run_metrics().increment("redcap.api.connection_errors")
+            continue
+
+        if request_result.status_code == 200:
+            chunk_report['count'] = int(request_result.json()['count'])
+            chunk_report['error'] = None
+            break
+        elif request_result.status_code == 400:
+            chunk_report['error'] = f"{request_result.reason} - {request_result.json()['error']}"
+            break
+        else:
+            chunk_report['error'] = f"{request_result.reason} - {request_result.content}"
+            if request_result.status_code < 500:
+                break
+
+    return chunk_report
+
+
+def import_redcap_dataframe(redcap_api_uri, redcap_project_token, importable_df, nss_logger, vp=True,
+                            chunk_size=REDCAP_DEFAULT_IMPORT_CHUNK_SIZE, max_workers=1, max_retries=3,
+                            backoff_seconds=1.0, record_id_field="ptid"):
+    """
+    Import a DataFrame of records via REDCap API in record-aligned chunks posted by up to `max_workers` threads
+
+    Each chunk is retried on server errors and timeouts. Nothing is logged until every chunk is done; then the totals
+    and any failed chunks are logged. Failed chunks can be retried by importing only the rows of their records, e.g.,
+    with `get_failed_redcap_import_records`.
+
+    :param redcap_api_uri: URI of REDCap instance
+    :type redcap_api_uri: str
+    :param redcap_project_token: Token of REDCap project to import data to
+    :type redcap_project_token: str
+    :param importable_df: DataFrame of records to import
+    :type importable_df: pandas.DataFrame
+    :param nss_logger: Logger object for writing to app log
+    :type nss_logger: logging.Logger
+    :param vp: Verify peer flag
+    :type vp: bool
+    :param chunk_size: Target number of rows per chunk
+    :type chunk_size: int
+    :param max_workers: Number of concurrent requests
+    :type max_workers: int
+    :param max_retries: Number of retries per chunk after its first attempt
+    :type max_retries: int
+    :param backoff_seconds: Wait before a chunk's first retry; doubled for each later retry
+    :type backoff_seconds: float
+    :param record_id_field: Record ID field of REDCap project
+    :type record_id_field: str
+    :return: list of per-chunk reports from `post_redcap_import_chunk`
+    :rtype: list[dict]
+    """
+    chunks = chunk_redcap_records(importable_df, chunk_size, record_id_field)
+
+    with get_redcap_session(max_workers) as session, ThreadPoolExecutor(max_workers=max(max_workers, 1)) as pool:
+        import_report = list(pool.map(
+            lambda chunk_df: post_redcap_import_chunk(session, redcap_api_uri, redcap_project_token, chunk_df, vp,
+                                                      max_retries, backoff_seconds,
+                                                      record_id_field=record_id_field),
+            chunks))
+
+    imported_count = sum(chunk_report['count'] for chunk_report in import_report)
+    failed_chunk_reports = [chunk_report for chunk_report in import_report if chunk_report['error'] is not None]
+    nss_logger.info(f"REDCap Import - Imported {imported_count} records in {len(import_report)} chunks")
+    for chunk_report in failed_chunk_reports:
+        nss_logger.error(f"REDCap Error - chunk of {chunk_report['rows']} rows failed after "
+                         f"{chunk_report['attempts']} attempts - {chunk_report['error']} - "
+                         f"records {', '.join(chunk_report['records'])}")
+
+    return import_report
+
+
+def get_failed_redcap_import_records(import_report):
+    """
+    Get record IDs of every chunk that failed to import
+
+    :param import_report: list of per-chunk reports from `import_redcap_dataframe`
+    :type import_report: list[dict]
+    :return: record IDs
+    :rtype: list[str]
+    """
+    return [record_id
+            for chunk_report in import_report if chunk_report['error'] is not None
+            for record_id in chunk_report['records']]
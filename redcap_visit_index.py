@@ -0,0 +1,87 @@
+import numpy as np
+import pandas as pd
+
+from redcap_completion import get_completed_forms_mask, get_form_complete
+
+
+# Visit type given to a visit whose `*_complete` field marks its form complete; later forms win over earlier ones
+VISIT_TYPE_FORMS = (
+    ("ivp_a1_complete", "II"),  # In-Person Initial
+    ("fvp_a1_complete", "IF"),  # In-Person Follow-up
+    ("tvp_a1_complete", "TF"),  # Tele-visit Follow-up
+)
+
+
+class RedcapVisitIndex:
+    """
+    Index of REDCap visits by (ptid, redcap_event_name), holding each visit's `visit_type` and whether its forms are
+    complete
+
+    Built once over the target project's records. Each scraped record is then looked up once, and the positions found
+    serve both for adding `visit_type` and for keeping only records of completed visits. Together they replace a left
+    join for `visit_type` and an inner join against a separate frame of completed visits. REDCap has one record per
+    participant and event; if a key repeats anyway, its first record is used.
+    """
+
+    def __init__(self, redcap_df, completion_rules):
+        """
+        :param redcap_df: DataFrame of REDCap data with `ptid`, `redcap_event_name`, and `*_complete` columns as raw
+            strings or int8 codes
+        :type redcap_df: pandas.DataFrame
+        :param completion_rules: Completion rules from `load_completion_rules`
+        :type completion_rules: dict
+        """
+        keys = pd.MultiIndex.from_arrays([redcap_df['ptid'], redcap_df['redcap_event_name']])
+        first_records = ~keys.duplicated()
+        self._keys = keys[first_records]
+
+        visit_types = np.full(len(redcap_df), None, dtype=object)
+        for complete_field, visit_type in VISIT_TYPE_FORMS:
+            visit_types[get_form_complete(redcap_df[complete_field]).fillna(False).to_numpy(dtype=bool)] = visit_type
+        # a trailing entry for visits not in REDCap, which `get_indexer` gives position -1
+        self._visit_types = np.append(visit_types[first_records], None)
+        self._completed = np.append(
+            get_completed_forms_mask(redcap_df, completion_rules).to_numpy(dtype=bool)[first_records], False)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def get_positions(self, ptids, redcap_event_names):
+        """
+        Look up visits in the index
+
+        :param ptids: Normalized UMMAP IDs
+        :type ptids: pandas.Series
+        :param redcap_event_names: REDCap event names, aligned to `ptids`
+        :type redcap_event_names: pandas.Series
+        :return: position of each visit in the index, or -1 where it's not in REDCap
+        :rtype: numpy.ndarray
+        """
+        return self._keys.get_indexer(pd.MultiIndex.from_arrays([ptids, redcap_event_names]))
+
+    def get_visit_types(self, positions):
+        """
+        Get visit types of looked up visits
+
+        :param positions: Positions from `get_positions`
+        :type positions: numpy.ndarray
+        :return: visit type of each visit, or NA where it's not in REDCap or has none
+        :rtype: pandas.array
+        """
+        return pd.array(self._visit_types[positions], dtype="string")
+
+    def filter_completed(self, df, positions):
+        """
+        Keep records whose visits' forms are complete, in the order of their visits in REDCap, as an inner join of
+        completed visits and `df` would give
+
+        :param df: DataFrame whose rows are aligned to `positions`
+        :type df: pandas.DataFrame
+        :param positions: Positions from `get_positions`
+        :type positions: numpy.ndarray
+        :return: DataFrame of kept records
+        :rtype: pandas.DataFrame
+        """
+        kept_rows = np.flatnonzero(self._completed[positions])
+        kept_rows = kept_rows[np.argsort(positions[kept_rows], kind="stable")]
+        return df.iloc[kept_rows].reset_index(drop=True)
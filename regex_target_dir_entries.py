@@ -1,3 +1,5 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from os import scandir
 from re import match
 
@@ -7,31 +9,121 @@ def extract_regexed_dir_entries(root_dir_path, subdirs_rgx, file_rgx):
     Build list of DirEntry objects below `root_dir_path` whose intervening subdirectory names match the `subdirs_rgx`
     regular expression and whose file name matches the `file_rgx` regular expression.
 
+    Directories are walked depth-first with a stack of open `scandir` iterators rather than by recursion, so entries
+    come back in the same order without building and copying a list per directory.
+
     :param root_dir_path: str path of root directory
     :param subdirs_rgx: str regular expression to match subdirectories
     :param file_rgx: str regular expression to match leaf files
     :return: list DirEntry objects
     """
     dir_entries_list = []
-    root_dir_entries = scandir(root_dir_path)
-
-    # loop over each DirEntry object
-    for dir_entry in root_dir_entries:
-        # if DirEntry object is a matching directory...
-        if dir_entry.is_dir(follow_symlinks=False) and match(subdirs_rgx, dir_entry.name):
-            # recurse down through the directory
-            sub_dir_entries_list = extract_regexed_dir_entries(dir_entry, subdirs_rgx, file_rgx)
-            # append matching DirEntry objects list to `dir_entries_list`
-            dir_entries_list = [*dir_entries_list, *sub_dir_entries_list]
-        # else if DirEntry object is a matching file...
-        elif dir_entry.is_file(follow_symlinks=False) and match(file_rgx, dir_entry.name):
-            # append matching DirEntry object to `dir_entries_list`
-            dir_entries_list.append(dir_entry)
+    scandir_stack = [scandir(root_dir_path)]
+    try:
+        while scandir_stack:
+            dir_entry = next(scandir_stack[-1], None)
+            # if the directory on top of the stack is exhausted, go back up to its parent
+            if dir_entry is None:
+                scandir_stack.pop().close()
+            # else if DirEntry object is a matching directory, descend into it
+            elif dir_entry.is_dir(follow_symlinks=False) and match(subdirs_rgx, dir_entry.name):
+                scandir_stack.append(scandir(dir_entry.path))
+            # else if DirEntry object is a matching file, append it to `dir_entries_list`
+            elif dir_entry.is_file(follow_symlinks=False) and match(file_rgx, dir_entry.name):
+                dir_entries_list.append(dir_entry)
+    finally:
+        for dir_entries_iter in scandir_stack:
+            dir_entries_iter.close()
 
     return dir_entries_list
 
 
-def extract_regexed_box_subitems(root_box_dir, subdirs_rgx, file_rgx, fields):
+def box_object_to_json(value):
+    """
+    Convert a Box SDK object, including any Box objects nested in its fields, to plain JSON-serializable data
+
+    :param value: Box SDK object, or dict, list, or scalar that may contain Box SDK objects
+    :return: JSON-serializable data
+    """
+    if hasattr(value, 'response_object'):
+        value = value.response_object
+    if isinstance(value, dict):
+        return {key: box_object_to_json(sub_value) for key, sub_value in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [box_object_to_json(sub_value) for sub_value in value]
+    return value
+
+
+def box_object_from_json(box_object, response_object):
+    """
+    Translate plain JSON data saved with `box_object_to_json` back into a Box SDK object
+
+    :param box_object: Any Box SDK object whose session the translated object will use
+    :param response_object: JSON data of a Box item
+    :type response_object: dict
+    :return: Box SDK object
+    """
+    return box_object.session.translator.translate(session=box_object.session, response_object=response_object)
+
+
+def list_regexed_box_folder(box_folder, subdirs_rgx, file_rgx, fields, page_size=1000):
+    """
+    List the immediate subfolders and files of `box_folder` whose names match `subdirs_rgx` and `file_rgx`, paging
+    through the folder with marker-based pagination
+
+    :param box_folder: Box Folder object
+    :param subdirs_rgx: regular expression to match subdirectories
+    :param file_rgx: regular expression to match leaf files
+    :param fields: Box item fields to request
+    :param page_size: Number of items to request per page
+    :type page_size: int
+    :return: lists of matching Box Folder objects and matching Box File objects
+    :rtype: (list, list)
+    """
+    box_subfolders_list = []
+    box_files_list = []
+    for box_item in box_folder.get_items(limit=page_size, use_marker=True, fields=fields):
+        if box_item.type == "folder" and match(subdirs_rgx, box_item.name):
+            box_subfolders_list.append(box_item)
+        if box_item.type == "file" and match(file_rgx, box_item.name):
+            box_files_list.append(box_item)
+    return box_subfolders_list, box_files_list
+
+
+def iter_regexed_box_subitems(root_box_dir, subdirs_rgx, file_rgx, fields, max_workers=1, page_size=1000):
+    """
+    Generate Box items below `root_box_dir` whose intervening subdirectory names match the `subdirs_rgx` regular
+    expression and whose file name matches the `file_rgx` regular expression.
+
+    Folders are crawled breadth-first, with sibling folders listed concurrently by up to `max_workers` threads; items
+    are still generated in a fixed breadth-first order.
+
+    :param root_box_dir: Box Folder object of root directory
+    :param subdirs_rgx: regular expression to match subdirectories
+    :param file_rgx: regular expression to match leaf files
+    :param fields: Box item fields to request; must include "type" and "name"
+    :param max_workers: Number of threads listing folders
+    :type max_workers: int
+    :param page_size: Number of items to request per page of a folder listing
+    :type page_size: int
+    :return: generator of Box File objects
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        pending_listings = deque([
+            pool.submit(list_regexed_box_folder, root_box_dir, subdirs_rgx, file_rgx, fields, page_size)
+        ])
+        while pending_listings:
+            box_subfolders_list, box_files_list = pending_listings.popleft().result()
+            # queue subfolder listings so siblings are listed concurrently
+            for box_subfolder in box_subfolders_list:
+                pending_listings.append(
+                    pool.submit(list_regexed_box_folder, box_subfolder, subdirs_rgx, file_rgx, fields, page_size))
+            for box_file in box_files_list:
+                print(f"  {box_file.name}")
+                yield box_file
+
+
+def extract_regexed_box_subitems(root_box_dir, subdirs_rgx, file_rgx, fields, max_workers=1, page_size=1000):
     """
     Build list of Box items below `root_box_dir` whose intervening subdirectory names match the `subdirs_rgx`
     regular expression and whose file name matches the `file_rgx` regular expression.
@@ -39,23 +131,11 @@ def extract_regexed_box_subitems(root_box_dir, subdirs_rgx, file_rgx, fields):
     :param root_box_dir: Box Folder object of root directory
     :param subdirs_rgx: str regular expression to match subdirectories
     :param file_rgx: str regular expression to match leaf files
-    :param fields:
+    :param fields: Box item fields to request
+    :param max_workers: Number of threads listing folders
+    :type max_workers: int
+    :param page_size: Number of items to request per page of a folder listing
+    :type page_size: int
     :return: list Box File objects
     """
-    box_items_list = []
-    root_box_subitems = root_box_dir.get_items(fields=fields)
-
-    # loop over each subitem
-    for box_item in root_box_subitems:
-        # print(item.type, item.id, item.sequence_id, item.name)
-        if box_item.type == "folder" and match(subdirs_rgx, box_item.name):
-            # recurse down through the directory
-            sub_box_items_list = extract_regexed_box_subitems(box_item, subdirs_rgx, file_rgx, fields)
-            # append matching item list to `box_items_list`
-            box_items_list = [*box_items_list, *sub_box_items_list]
-        if box_item.type == "file" and match(file_rgx, box_item.name):
-            # append matching item to `box_items_list`
-            print(f"  {box_item.name}")
-            box_items_list.append(box_item)
-
-    return box_items_list
+    return list(iter_regexed_box_subitems(root_box_dir, subdirs_rgx, file_rgx, fields, max_workers, page_size))
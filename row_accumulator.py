@@ -0,0 +1,87 @@
+import pandas as pd
+
+
+# Nullable pandas dtypes for the `dtype` entries in `parse_map.json`
+PARSE_MAP_PANDAS_DTYPES = {
+    "int": "Int64",
+    "float": "Float64",
+    "str": "string",
+}
+
+
+def get_parse_map_column_dtypes(parse_dict, extra_column_dtypes=None):
+    """
+    Get nullable pandas dtypes for each parse map field, followed by any extra columns
+
+    :param parse_dict: Parse map loaded from `parse_map.json`
+    :type parse_dict: dict
+    :param extra_column_dtypes: dict of extra column names to pandas dtypes, e.g., `{'redcap_event_name': "string"}`
+    :type extra_column_dtypes: dict[str, str]
+    :return: dict of column names to pandas dtypes
+    :rtype: dict[str, str]
+    """
+    column_dtypes = {}
+    for raw_field, spec_dict in parse_dict.items():
+        try:
+            column_dtypes[raw_field] = PARSE_MAP_PANDAS_DTYPES[spec_dict['dtype']]
+        except KeyError:
+            raise ValueError(f"Unexpected type string \"{spec_dict['dtype']}\" for `{raw_field}` in parse_map.json")
+    if extra_column_dtypes:
+        column_dtypes.update(extra_column_dtypes)
+    return column_dtypes
+
+
+class RowAccumulator:
+    """
+    Collect record rows into per-column buffers and build a typed DataFrame from them once
+
+    Growing a DataFrame one row at a time copies the whole frame on every row; this keeps one preallocated list per
+    column instead and only converts to pandas arrays in `to_dataframe`.
+    """
+
+    def __init__(self, column_dtypes, capacity=0):
+        """
+        :param column_dtypes: dict of column names to pandas dtypes, e.g., from `get_parse_map_column_dtypes`
+        :type column_dtypes: dict[str, str]
+        :param capacity: Number of rows to preallocate; buffers grow if more rows are appended
+        :type capacity: int
+        """
+        self.column_dtypes = dict(column_dtypes)
+        self._capacity = max(capacity, 0)
+        self._columns = {column: [None] * self._capacity for column in self.column_dtypes}
+        self._n_rows = 0
+
+    def __len__(self):
+        return self._n_rows
+
+    def append(self, row_dict):
+        """
+        Append a record row; columns missing from `row_dict` are left null
+
+        :param row_dict: dict of column names to values
+        :type row_dict: dict
+        """
+        unknown_columns = row_dict.keys() - self._columns.keys()
+        if unknown_columns:
+            raise KeyError(f"Unexpected columns {sorted(unknown_columns)} for row accumulator")
+
+        if self._n_rows == self._capacity:
+            grow_by = max(self._capacity, 16)
+            for buffer in self._columns.values():
+                buffer.extend([None] * grow_by)
+            self._capacity += grow_by
+
+        for column, value in row_dict.items():
+            self._columns[column][self._n_rows] = value
+        self._n_rows += 1
+
+    def to_dataframe(self):
+        """
+        Build DataFrame of accumulated rows with each column's nullable dtype applied
+
+        :rtype: pandas.DataFrame
+        """
+        return pd.DataFrame({
+            column: pd.array(self._columns[column][:self._n_rows], dtype=dtype)
+            for column, dtype in self.column_dtypes.items()
+        })
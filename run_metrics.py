@@ -0,0 +1,275 @@
+import heapq
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+
+# Number of slowest summary sheets kept in the run report
+RUN_REPORT_SLOWEST_SHEETS = 10
+
+
+class RunMetrics:
+    """
+    Collect stage durations, per-operation timings, bytes transferred, API call counts, and failures for one run
+
+    Safe to update from several threads. Worker processes collect into their own `RunMetrics` and hand it back to be
+    folded in with `merge`.
+    """
+
+    def __init__(self):
+        self.started = datetime.now()
+        self.stages = []
+        self.operations = {}
+        self.counters = {}
+        self.sheet_seconds = []
+        self.duplicate_sheets = []
+        self._stage_name = None
+        self._stage_start = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def start_stage(self, stage_name):
+        """
+        End the current stage, if any, and start timing the next one
+
+        :param stage_name: Name of stage
+        :type stage_name: str
+        """
+        self.end_stage()
+        self._stage_name = stage_name
+        self._stage_start = time.perf_counter()
+
+    def end_stage(self):
+        """
+        End the current stage, if any
+        """
+        if self._stage_name is not None:
+            self.stages.append({'name': self._stage_name,
+                                'seconds': round(time.perf_counter() - self._stage_start, 3)})
+            self._stage_name = None
+
+    def record_operation(self, operation_name, seconds, n_bytes=0, failed=False):
+        """
+        Record one run of an operation, e.g., a Box download or a REDCap API call
+
+        :param operation_name: Name of operation, e.g., "box.download"
+        :type operation_name: str
+        :param seconds: Duration of the operation
+        :type seconds: float
+        :param n_bytes: Bytes transferred by the operation
+        :type n_bytes: int
+        :param failed: Whether the operation failed
+        :type failed: bool
+        """
+        with self._lock:
+            operation = self.operations.setdefault(
+                operation_name, {'count': 0, 'failures': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0})
+            operation['count'] += 1
+            operation['failures'] += int(failed)
+            operation['seconds'] += seconds
+            operation['max_seconds'] = max(operation['max_seconds'], seconds)
+            operation['bytes'] += n_bytes or 0
+
+    @contextmanager
+    def time_operation(self, operation_name):
+        """
+        Time a block as one run of an operation; an exception raised in the block is recorded as a failure
+
+        The yielded dict's "bytes" can be set inside the block to record bytes transferred.
+
+        :param operation_name: Name of operation
+        :type operation_name: str
+        """
+        operation_info = {'bytes': 0}
+        start = time.perf_counter()
+        try:
+            yield operation_info
+        except Exception:
+            self.record_operation(operation_name, time.perf_counter() - start, operation_info['bytes'], failed=True)
+            raise
+        self.record_operation(operation_name, time.perf_counter() - start, operation_info['bytes'])
+
+    def increment(self, counter_name, n=1):
+        """
+        Add `n` to a counter, e.g., of cache hits
+
+        :param counter_name: Name of counter
+        :type counter_name: str
+        :param n: Amount to add
+        :type n: int
+        """
+        with self._lock:
+            self.counters[counter_name] = self.counters.get(counter_name, 0) + n
+
+    def record_sheet(self, path, seconds):
+        """
+        Record the total time spent getting one summary sheet's fields
+
+        :param path: Path or ID of summary sheet
+        :type path: str
+        :param seconds: Duration
+        :type seconds: float
+        """
+        with self._lock:
+            self.sheet_seconds.append((seconds, str(path)))
+
+    def record_duplicate_sheets(self, sha1, kept_path, duplicate_paths):
+        """
+        Record a summary sheet whose contents were found in several places, and which copy was kept
+
+        :param sha1: SHA-1 of the sheet's contents
+        :type sha1: str
+        :param kept_path: Path of the copy kept
+        :type kept_path: str
+        :param duplicate_paths: Paths of the copies skipped
+        :type duplicate_paths: list[str]
+        """
+        with self._lock:
+            self.duplicate_sheets.append({'sha1': sha1, 'kept': kept_path, 'duplicates': list(duplicate_paths)})
+        self.increment("sheets.duplicates", len(duplicate_paths))
+
+    def merge(self, other_metrics):
+        """
+        Fold operations, counters, and sheet timings collected elsewhere, e.g., in a worker process, into these
+
+        :param other_metrics: Metrics to fold in
+        :type other_metrics: RunMetrics
+        """
+        for operation_name, other_operation in other_metrics.operations.items():
+            with self._lock:
+                operation = self.operations.setdefault(
+                    operation_name, {'count': 0, 'failures': 0, 'seconds': 0.0, 'max_seconds': 0.0, 'bytes': 0})
+                operation['count'] += other_operation['count']
+                operation['failures'] += other_operation['failures']
+                operation['seconds'] += other_operation['seconds']
+                operation['max_seconds'] = max(operation['max_seconds'], other_operation['max_seconds'])
+                operation['bytes'] += other_operation['bytes']
+        for counter_name, n in other_metrics.counters.items():
+            self.increment(counter_name, n)
+        with self._lock:
+            self.sheet_seconds.extend(other_metrics.sheet_seconds)
+
+    def to_report(self):
+        """
+        Build JSON-serializable run report
+
+        :rtype: dict
+        """
+        self.end_stage()
+        finished = datetime.now()
+        return {
+            'started': self.started.isoformat(timespec="seconds"),
+            'finished': finished.isoformat(timespec="seconds"),
+            'seconds': round((finished - self.started).total_seconds(), 3),
+            'stages': list(self.stages),
+            'operations': {
+                operation_name: {
+                    **operation,
+                    'seconds': round(operation['seconds'], 3),
+                    'max_seconds': round(operation['max_seconds'], 3),
+                    'mean_seconds': round(operation['seconds'] / operation['count'], 3) if operation['count'] else 0,
+                }
+                for operation_name, operation in sorted(self.operations.items())
+            },
+            'counters': dict(sorted(self.counters.items())),
+            'slowest_sheets': [{'path': path, 'seconds': round(seconds, 3)}
+                               for seconds, path in heapq.nlargest(RUN_REPORT_SLOWEST_SHEETS, self.sheet_seconds)],
+            'duplicate_sheets': list(self.duplicate_sheets),
+        }
+
+
+# Metrics of the running process; like `logging.getLogger`, so call sites that make API calls needn't pass it around
+_run_metrics = RunMetrics()
+
+
+def get_run_metrics():
+    """
+    Get the metrics of the running process
+
+    :rtype: RunMetrics
+    """
+    return _run_metrics
+
+
+def get_requests_metrics_hook(operation_name):
+    """
+    Get a `requests` response hook that records each response as one run of an operation in the run metrics
+
+    :param operation_name: Name of operation, e.g., "redcap.api"
+    :type operation_name: str
+    :return: hook for a `requests.Session`'s or request's `hooks['response']`
+    """
+    def record_response(response, *args, **kwargs):
+        get_run_metrics().record_operation(operation_name, response.elapsed.total_seconds(),
+                                           int(response.headers.get('Content-Length') or 0),
+                                           failed=response.status_code >= 400)
+        return response
+
+    return record_response
+
+
+def get_run_report_path(nss_logger):
+    """
+    Get path of the run report, next to the app log file with the same name but a .json extension
+
+    :param nss_logger: Logger object for writing to app log
+    :type nss_logger: logging.Logger
+    :return: Path of run report JSON file, or `None` if the logger doesn't write to a file
+    :rtype: str
+    """
+    for handler in nss_logger.handlers:
+        if isinstance(handler, logging.FileHandler):
+            return f"{os.path.splitext(handler.baseFilename)[0]}.json"
+    return None
+
+
+def save_run_report(report_path, run_report):
+    """
+    Save run report to JSON file, replacing the old file only once the new one is fully written
+
+    :param report_path: Path of run report JSON file
+    :type report_path: str
+    :param run_report: Run report from `RunMetrics.to_report`
+    :type run_report: dict
+    """
+    tmp_report_path = f"{report_path}.tmp"
+    with open(tmp_report_path, "w") as report_file:
+        json.dump(run_report, report_file, indent=2)
+    os.replace(tmp_report_path, report_path)
+
+
+def format_run_report_table(run_report):
+    """
+    Format a run report as plain text tables of stages and operations
+
+    :param run_report: Run report from `RunMetrics.to_report`
+    :type run_report: dict
+    :rtype: str
+    """
+    lines = [f"{'Stage':<60}{'Seconds':>10}"]
+    for stage in run_report['stages']:
+        lines.append(f"{stage['name']:<60}{stage['seconds']:>10.1f}")
+    lines.append(f"{'Total':<60}{run_report['seconds']:>10.1f}")
+    lines.append("")
+    lines.append(f"{'Operation':<20}{'Count':>8}{'Failures':>10}{'Seconds':>10}{'Mean s':>10}{'Max s':>10}{'MB':>10}")
+    for operation_name, operation in run_report['operations'].items():
+        lines.append(f"{operation_name:<20}{operation['count']:>8}{operation['failures']:>10}"
+                     f"{operation['seconds']:>10.1f}{operation['mean_seconds']:>10.3f}{operation['max_seconds']:>10.3f}"
+                     f"{operation['bytes'] / 2 ** 20:>10.1f}")
+    if run_report['counters']:
+        lines.append("")
+        for counter_name, n in run_report['counters'].items():
+            lines.append(f"{counter_name:<60}{n:>10}")
+    return "\n".join(lines)
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+
+
+def get_parse_map_digest(parse_dict):
+    """
+    Get a digest of the parse map so that cached fields are invalidated when `parse_map.json` changes
+
+    :param parse_dict: Parse map loaded from `parse_map.json`
+    :type parse_dict: dict
+    :return: hex digest of parse map
+    :rtype: str
+    """
+    parse_map_str = json.dumps(parse_dict, sort_keys=True)
+    return hashlib.sha1(parse_map_str.encode("utf-8")).hexdigest()
+
+
+def load_scrape_cache(cache_path, parse_dict, nss_logger):
+    """
+    Load scrape cache of parsed summary sheet fields keyed by Box file ID and etag
+
+    An empty cache is returned if there's no cache file, if it can't be read, or if it was built with a different
+    parse map.
+
+    :param cache_path: Path of scrape cache JSON file
+    :type cache_path: str
+    :param parse_dict: Parse map loaded from `parse_map.json`
+    :type parse_dict: dict
+    :param nss_logger: Logger object for writing to app log
+    :type nss_logger: logging.Logger
+    :return: scrape cache
+    :rtype: dict
+    """
+    parse_map_digest = get_parse_map_digest(parse_dict)
+    empty_cache = {'parse_map_digest': parse_map_digest, 'items': {}}
+
+    if not os.path.isfile(cache_path):
+        return empty_cache
+
+    try:
+        with open(cache_path, "r") as cache_file:
+            scrape_cache = json.load(cache_file)
+    except (OSError, ValueError) as e:
+        nss_logger.warning(f"Cannot read scrape cache \"{cache_path}\"; {e}")
+        return empty_cache
+
+    if scrape_cache.get('parse_map_digest') != parse_map_digest:
+        nss_logger.info(f"Parse map changed since scrape cache \"{cache_path}\" was written; discarding cache")
+        return empty_cache
+
+    return scrape_cache
+
+
+def save_scrape_cache(cache_path, scrape_cache):
+    """
+    Save scrape cache to JSON file, replacing the old file only once the new one is fully written
+
+    :param cache_path: Path of scrape cache JSON file
+    :type cache_path: str
+    :param scrape_cache: Scrape cache
+    :type scrape_cache: dict
+    """
+    tmp_cache_path = f"{cache_path}.tmp"
+    with open(tmp_cache_path, "w") as cache_file:
+        json.dump(scrape_cache, cache_file)
+    os.replace(tmp_cache_path, cache_path)
+
+
+def is_scrape_cache_hit(scrape_cache, item_id, etag):
+    """
+    Check whether a Box item with this etag has already been parsed
+
+    :param scrape_cache: Scrape cache
+    :type scrape_cache: dict
+    :param item_id: Box item ID
+    :type item_id: str
+    :param etag: Box item etag
+    :type etag: str
+    :rtype: bool
+    """
+    cache_entry = scrape_cache['items'].get(item_id)
+    return cache_entry is not None and 'fields' in cache_entry and etag is not None and cache_entry['etag'] == etag
+
+
+def get_scrape_cache_fields(scrape_cache, item_id):
+    """
+    Get cached sheet fields for a Box item; `None` means the sheet was empty
+
+    :param scrape_cache: Scrape cache
+    :type scrape_cache: dict
+    :param item_id: Box item ID
+    :type item_id: str
+    :return: dict of field names to converted values
+    :rtype: dict
+    """
+    return scrape_cache['items'][item_id]['fields']
+
+
+def set_scrape_cache_fields(scrape_cache, item_id, etag, fields_dict):
+    """
+    Set cached sheet fields for a Box item
+
+    :param scrape_cache: Scrape cache
+    :type scrape_cache: dict
+    :param item_id: Box item ID
+    :type item_id: str
+    :param etag: Box item etag
+    :type etag: str
+    :param fields_dict: dict of field names to converted values
+    :type fields_dict: dict
+    """
+    cache_entry = {'etag': etag, 'fields': fields_dict}
+    old_cache_entry = scrape_cache['items'].get(item_id)
+    if old_cache_entry is not None and old_cache_entry['etag'] == etag and 'sha1' in old_cache_entry:
+        cache_entry['sha1'] = old_cache_entry['sha1']
+    scrape_cache['items'][item_id] = cache_entry
+
+
+def get_scrape_cache_sha1(scrape_cache, item_id, etag):
+    """
+    Get the cached SHA-1 of a local file's contents, if it was hashed when the file had this etag
+
+    :param scrape_cache: Scrape cache
+    :type scrape_cache: dict
+    :param item_id: Local file path
+    :type item_id: str
+    :param etag: Local stand-in for a Box etag
+    :type etag: str
+    :return: hex digest, or `None` if it isn't cached for this etag
+    :rtype: str
+    """
+    cache_entry = scrape_cache['items'].get(item_id)
+    if cache_entry is None or etag is None or cache_entry['etag'] != etag:
+        return None
+    return cache_entry.get('sha1')
+
+
+def set_scrape_cache_sha1(scrape_cache, item_id, etag, sha1):
+    """
+    Set the cached SHA-1 of a local file's contents, dropping cached fields of an older version of the file
+
+    :param scrape_cache: Scrape cache
+    :type scrape_cache: dict
+    :param item_id: Local file path
+    :type item_id: str
+    :param etag: Local stand-in for a Box etag
+    :type etag: str
+    :param sha1: hex digest from `hash_file_sha1`
+    :type sha1: str
+    """
+    cache_entry = scrape_cache['items'].get(item_id)
+    if cache_entry is None or cache_entry['etag'] != etag:
+        cache_entry = scrape_cache['items'][item_id] = {'etag': etag}
+    cache_entry['sha1'] = sha1
+
+
+def prune_scrape_cache(scrape_cache, item_ids):
+    """
+    Drop cache entries for Box items that weren't found in this run
+
+    :param scrape_cache: Scrape cache
+    :type scrape_cache: dict
+    :param item_ids: IDs of Box items found in this run
+    :type item_ids: list[str]
+    """
+    item_ids = set(item_ids)
+    for cached_item_id in list(scrape_cache['items']):
+        if cached_item_id not in item_ids:
+            del scrape_cache['items'][cached_item_id]
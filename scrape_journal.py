@@ -0,0 +1,136 @@
+import json
+import os
+from datetime import datetime
+
+from scrape_cache import get_parse_map_digest
+
+
+class ScrapeJournal:
+    """
+    Append-only journal of the summary sheets parsed so far in a run, so a run that fails or is killed partway through
+    can be resumed without downloading and parsing those sheets again
+
+    The first line of the journal file is a header with the parse map digest; each later line is one sheet's ID, etag,
+    and fields, written and flushed as soon as the sheet is parsed. A line cut short by a crash is dropped when the
+    journal is resumed.
+    """
+
+    def __init__(self, journal_path, parse_dict, nss_logger, resume=False):
+        """
+        :param journal_path: Path of journal JSON Lines file
+        :type journal_path: str
+        :param parse_dict: Parse map loaded from `parse_map.json`
+        :type parse_dict: dict
+        :param nss_logger: Logger object for writing to app log
+        :type nss_logger: logging.Logger
+        :param resume: Keep the sheets in an existing journal built with the same parse map; otherwise any existing
+            journal is discarded
+        :type resume: bool
+        """
+        self.journal_path = journal_path
+        self.parse_map_digest = get_parse_map_digest(parse_dict)
+        self.items = {}
+
+        journal_end = self._load(nss_logger) if resume else None
+        if journal_end is None:
+            if os.path.isfile(journal_path):
+                nss_logger.info(f"Discarding scrape journal \"{journal_path}\" of an earlier run")
+            self._journal_file = open(journal_path, "w")
+            self._write_line({'parse_map_digest': self.parse_map_digest,
+                              'started': datetime.now().isoformat(timespec="seconds")})
+        else:
+            self._journal_file = open(journal_path, "r+")
+            self._journal_file.seek(journal_end)
+            self._journal_file.truncate()
+            nss_logger.info(f"Resuming from scrape journal \"{journal_path}\" with {len(self.items)} sheets")
+
+    def __len__(self):
+        return len(self.items)
+
+    def _load(self, nss_logger):
+        """
+        Load sheets from an existing journal file
+
+        :return: offset just past the last complete line, or `None` if there's no journal that can be resumed
+        :rtype: int
+        """
+        if not os.path.isfile(self.journal_path):
+            return None
+
+        journal_end = 0
+        with open(self.journal_path, "rb") as journal_file:
+            for line_idx, line in enumerate(journal_file):
+                try:
+                    if not line.endswith(b"\n"):
+                        raise ValueError("line cut short")
+                    entry = json.loads(line)
+                except ValueError:
+                    if line_idx == 0:
+                        nss_logger.warning(f"Cannot read scrape journal \"{self.journal_path}\"; starting over")
+                        return None
+                    nss_logger.info(f"Dropping incomplete entry at end of scrape journal \"{self.journal_path}\"")
+                    break
+                if line_idx == 0:
+                    if entry.get('parse_map_digest') != self.parse_map_digest:
+                        nss_logger.info(f"Parse map changed since scrape journal \"{self.journal_path}\" was "
+                                        f"written; starting over")
+                        return None
+                else:
+                    self.items[entry['id']] = {'etag': entry['etag'], 'fields': entry['fields']}
+                journal_end += len(line)
+        return journal_end
+
+    def _write_line(self, entry):
+        self._journal_file.write(json.dumps(entry) + "\n")
+        self._journal_file.flush()
+
+    def is_hit(self, item_id, etag):
+        """
+        Check whether a sheet with this etag was already parsed in the run being resumed
+
+        :param item_id: Box item ID or local file path
+        :type item_id: str
+        :param etag: Box item etag or local stand-in
+        :type etag: str
+        :rtype: bool
+        """
+        journal_entry = self.items.get(item_id)
+        return journal_entry is not None and etag is not None and journal_entry['etag'] == etag
+
+    def get_fields(self, item_id):
+        """
+        Get journaled sheet fields; `None` means the sheet was empty
+
+        :param item_id: Box item ID or local file path
+        :type item_id: str
+        :return: dict of field names to converted values
+        :rtype: dict
+        """
+        return self.items[item_id]['fields']
+
+    def append(self, item_id, etag, fields_dict):
+        """
+        Record a parsed sheet, flushing it to the journal file at once
+
+        :param item_id: Box item ID or local file path
+        :type item_id: str
+        :param etag: Box item etag or local stand-in
+        :type etag: str
+        :param fields_dict: dict of field names to converted values
+        :type fields_dict: dict
+        """
+        self.items[item_id] = {'etag': etag, 'fields': fields_dict}
+        self._write_line({'id': item_id, 'etag': etag, 'fields': fields_dict})
+
+    def close(self):
+        """
+        Close the journal file, keeping it so the run can be resumed
+        """
+        self._journal_file.close()
+
+    def remove(self):
+        """
+        Close and delete the journal file once the run it covers has finished
+        """
+        self._journal_file.close()
+        os.remove(self.journal_path)
@@ -0,0 +1,187 @@
+from re import compile
+
+
+# How a study's summary sheets get their REDCap event in the target study: "direct" takes the visit number from the
+# sheet's folder as the target study's visit; "visit_index" looks the visit up in the study's own REDCap project
+STUDY_EVENT_MAPPINGS = ("direct", "visit_index")
+
+
+class Study:
+    """
+    One study whose summary sheets are scraped: the regexes that find its sheets in the shared crawl, its REDCap
+    project, how its sheets map to REDCap events of the target study, and its share of download and parse workers
+    """
+
+    def __init__(self, name, subdirs_regex, xlsx_regex, redcap_api_uri=None, redcap_project_token=None,
+                 redcap_fields=None, redcap_verify_peer=True, event_mapping="direct",
+                 visit_index_event="sv{visit_num}_arm_1", visit_index_field="ummap_visit_number", ummap_id_regex=None,
+                 download_workers=1, parse_workers=1):
+        """
+        :param name: Name of study, the same as its config section, e.g., "ummap"
+        :type name: str
+        :param subdirs_regex: Regex of folder names to descend into
+        :type subdirs_regex: str
+        :param xlsx_regex: Regex of summary sheet file names
+        :type xlsx_regex: str
+        :param redcap_api_uri: URI of REDCap instance of the study's project, or `None` if it has none
+        :type redcap_api_uri: str
+        :param redcap_project_token: Token of the study's REDCap project
+        :type redcap_project_token: str
+        :param redcap_fields: Fields to export from the study's REDCap project
+        :type redcap_fields: list[str]
+        :param redcap_verify_peer: Verify the REDCap server's certificate
+        :type redcap_verify_peer: bool
+        :param event_mapping: One of `STUDY_EVENT_MAPPINGS`
+        :type event_mapping: str
+        :param visit_index_event: Format of the study's own REDCap event name, with the sheet's `{visit_num}`
+        :type visit_index_event: str
+        :param visit_index_field: Field of the study's REDCap project holding the target study's visit number
+        :type visit_index_field: str
+        :param ummap_id_regex: Regex whose first group is the UMMAP ID in a sheet's file name; if not set, the ID is
+            read from the UMMAP or ELECTRA naming scheme
+        :type ummap_id_regex: str
+        :param download_workers: Number of threads downloading the study's summary sheets from Box
+        :type download_workers: int
+        :param parse_workers: Number of processes parsing the study's summary sheets
+        :type parse_workers: int
+        """
+        if event_mapping not in STUDY_EVENT_MAPPINGS:
+            raise ValueError(f"Unexpected event_mapping \"{event_mapping}\" of study \"{name}\"; "
+                             f"expected one of {list(STUDY_EVENT_MAPPINGS)}")
+        if event_mapping == "visit_index" and redcap_api_uri is None:
+            raise ValueError(f"Study \"{name}\" maps events by visit_index but has no redcap_api_uri")
+        if redcap_api_uri is not None and not redcap_fields:
+            raise ValueError(f"Study \"{name}\" has a redcap_api_uri but no fields in redcap_fields.json")
+        self.name = name
+        self.subdirs_regex = subdirs_regex
+        self.xlsx_regex = compile(xlsx_regex)
+        self.redcap_api_uri = redcap_api_uri
+        self.redcap_project_token = redcap_project_token
+        self.redcap_fields = redcap_fields
+        self.redcap_verify_peer = redcap_verify_peer
+        self.event_mapping = event_mapping
+        self.visit_index_event = visit_index_event
+        self.visit_index_field = visit_index_field
+        self.ummap_id_regex = compile(ummap_id_regex) if ummap_id_regex else None
+        self.download_workers = download_workers
+        self.parse_workers = parse_workers
+
+    def __repr__(self):
+        return f"Study({self.name!r})"
+
+
+class StudyRegistry:
+    """
+    Studies scraped in one run, in config order, with the combined regexes that find all of their summary sheets in a
+    single crawl, and routing of each sheet found to its study
+    """
+
+    def __init__(self, studies, target_study_name):
+        """
+        :param studies: Studies in config order
+        :type studies: list[Study]
+        :param target_study_name: Name of the study whose REDCap project records are imported into
+        :type target_study_name: str
+        """
+        self.studies = {study.name: study for study in studies}
+        if target_study_name not in self.studies:
+            raise ValueError(f"Target study \"{target_study_name}\" has no config section")
+        self.target_study = self.studies[target_study_name]
+        if self.target_study.redcap_api_uri is None:
+            raise ValueError(f"Target study \"{target_study_name}\" has no redcap_api_uri")
+        self.subdirs_regex = compile("|".join(study.subdirs_regex for study in studies))
+        self.xlsx_regex = compile("|".join(study.xlsx_regex.pattern for study in studies))
+
+    def __iter__(self):
+        return iter(self.studies.values())
+
+    def __len__(self):
+        return len(self.studies)
+
+    def route(self, sheet_name):
+        """
+        Get the study a summary sheet belongs to: the first study, in config order, whose `xlsx_regex` matches
+
+        :param sheet_name: File name of summary sheet
+        :type sheet_name: str
+        :return: study, or `None` if no study's regex matches
+        :rtype: Study
+        """
+        for study in self.studies.values():
+            if study.xlsx_regex.match(sheet_name):
+                return study
+        return None
+
+    def route_items(self, items, nss_logger):
+        """
+        Split summary sheets found by the shared crawl into lists per study, keeping their order
+
+        :param items: Box File objects or DirEntry objects of summary sheets
+        :type items: list
+        :param nss_logger: Logger object for writing to app log
+        :type nss_logger: logging.Logger
+        :return: dict of study name to its summary sheets, with every study present
+        :rtype: dict[str, list]
+        """
+        study_items = {study_name: [] for study_name in self.studies}
+        for item in items:
+            study = self.route(item.name)
+            if study is None:
+                nss_logger.warning(f"No study for summary sheet \"{item.name}\"; skipping")
+                continue
+            study_items[study.name].append(item)
+        return study_items
+
+
+def load_study_registry(config, redcap_fields_dict):
+    """
+    Load studies from every config section but `[base]`
+
+    Each section needs `subdirs_regex` and `xlsx_regex`. `redcap_api_uri` and `redcap_project_token` give the study's
+    REDCap project, whose fields to export are the section's entry in `redcap_fields.json`. `event_mapping`,
+    `visit_index_event`, `visit_index_field`, and `ummap_id_regex` set how sheets map to events, and
+    `box_download_workers` and `sheet_parse_workers` override the `[base]` worker counts for the study. Without an
+    `event_mapping`, `[electra]` is "visit_index", as config files predating `event_mapping` expect, and any other
+    study is "direct"; a study other than the target that has a `redcap_api_uri` but no `event_mapping` is rejected,
+    since guessing its mapping could import its scores into the wrong visits. The target study is `[base]`'s
+    `target_study`, "ummap" by default.
+
+    :param config: Parsed config file
+    :type config: configparser.ConfigParser
+    :param redcap_fields_dict: dict of study name to REDCap fields from `redcap_fields.json`
+    :type redcap_fields_dict: dict[str, list[str]]
+    :rtype: StudyRegistry
+    """
+    target_study_name = config.get('base', 'target_study', fallback="ummap")
+    download_workers = config.getint('base', 'box_download_workers', fallback=1)
+    parse_workers = config.getint('base', 'sheet_parse_workers', fallback=1)
+    studies = []
+    for section in config.sections():
+        if section == 'base':
+            continue
+        if section == "electra":
+            event_mapping_fallback = "visit_index"
+        elif (section != target_study_name and config.has_option(section, 'redcap_api_uri')
+              and not config.has_option(section, 'event_mapping')):
+            raise ValueError(f"Study \"{section}\" has a redcap_api_uri but no event_mapping; "
+                             f"set event_mapping to one of {list(STUDY_EVENT_MAPPINGS)}")
+        else:
+            event_mapping_fallback = "direct"
+        studies.append(Study(
+            section,
+            config.get(section, 'subdirs_regex'),
+            config.get(section, 'xlsx_regex'),
+            redcap_api_uri=config.get(section, 'redcap_api_uri', fallback=None),
+            redcap_project_token=config.get(section, 'redcap_project_token', fallback=None),
+            redcap_fields=redcap_fields_dict.get(section),
+            # the target project has always been exported and imported without verifying the peer
+            redcap_verify_peer=config.getboolean(section, 'redcap_verify_peer',
+                                                 fallback=section != target_study_name),
+            event_mapping=config.get(section, 'event_mapping', fallback=event_mapping_fallback),
+            visit_index_event=config.get(section, 'visit_index_event', fallback="sv{visit_num}_arm_1"),
+            visit_index_field=config.get(section, 'visit_index_field', fallback="ummap_visit_number"),
+            ummap_id_regex=config.get(section, 'ummap_id_regex', fallback=None),
+            download_workers=config.getint(section, 'box_download_workers', fallback=download_workers),
+            parse_workers=config.getint(section, 'sheet_parse_workers', fallback=parse_workers),
+        ))
+    return StudyRegistry(studies, target_study_name)
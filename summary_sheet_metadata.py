@@ -0,0 +1,241 @@
+import os
+import re
+
+
+# Visit number in a summary sheet's folder path, e.g., ".../Visit 3/..."; the last match in the path wins
+VISIT_NUM_PATTERN = re.compile(r'.*Visit (\d+).*')
+# UMMAP ID in a Box summary sheet name, e.g., "1234 Score Summary 2020.xlsx"
+UMMAP_SHEET_NAME_PATTERN = re.compile(r'^(\d{3,4}).*[Ss]cor.*[Ss]ummary.*\d{4}.*\.xlsx$')
+# UMMAP ID in a Box ELECTRA summary sheet name, e.g., "KG123456_1234_Score_Summary_2020.xlsx"
+ELECTRA_SHEET_NAME_PATTERN = re.compile(r'^KG\d{6}_(\d{4})_Score_Summary_\d{4}.xlsx$')
+# UMMAP ID in a local summary sheet path
+UMMAP_SHEET_PATH_PATTERN = re.compile(r'.*/(\d+).[Ss]cor')
+# UMMAP IDs in a local ELECTRA summary sheet's folder and file names, which have to agree
+ELECTRA_SHEET_PATH_PATTERN = re.compile(r'.*/KG\d{6} - (\d{4})/KG\d{6}_(\d{4}).*')
+ELECTRA_PATH_PATTERN = re.compile(r'.*ELECTRA.*')
+# Normalized UMMAP ID, and the bare ID number it's normalized from
+UMMAP_ID_PATTERN = re.compile(r'UM\d{8}')
+UMMAP_ID_NUM_PATTERN = re.compile(r'\d{3,4}')
+
+
+def normalize_ummap_id(id_):
+    """
+    Normalize UMMAP IDs
+
+    :param id_: UMMAP ID
+    :type id_: str
+    :return: normalized UMMAP ID
+    :rtype: str
+    """
+    id_str = str(id_)
+    if UMMAP_ID_PATTERN.fullmatch(id_str):
+        return id_str
+    elif UMMAP_ID_NUM_PATTERN.fullmatch(id_str):
+        return "UM" + id_str.zfill(8)
+    else:
+        raise Exception(f"UMMAP ID {id_str} doesn't conform to expected form")
+
+
+def normalize_ummap_ids(ids):
+    """
+    Normalize a column of UMMAP IDs at once, like `normalize_ummap_id` on each value
+
+    :param ids: UMMAP IDs
+    :type ids: pandas.Series
+    :return: normalized UMMAP IDs, with the same index
+    :rtype: pandas.Series
+    """
+    id_strs = ids.astype("string")
+    is_ummap_id = id_strs.str.fullmatch(UMMAP_ID_PATTERN.pattern).fillna(False).astype(bool)
+    is_ummap_id_num = id_strs.str.fullmatch(UMMAP_ID_NUM_PATTERN.pattern).fillna(False).astype(bool)
+    nonconforming = ~(is_ummap_id | is_ummap_id_num)
+    if nonconforming.any():
+        raise Exception(f"UMMAP ID {str(ids[nonconforming].iloc[0])} doesn't conform to expected form")
+
+    return id_strs.where(is_ummap_id, "UM" + id_strs.str.zfill(8)).astype(ids.dtype)
+
+
+def is_electra_box_item(box_item):
+    """
+    Check whether a Box summary sheet is an ELECTRA sheet, going by its name
+
+    :param box_item: Box File object
+    :rtype: bool
+    """
+    return ELECTRA_SHEET_NAME_PATTERN.match(box_item.name) is not None
+
+
+def is_electra_dir_entry(dir_entry):
+    """
+    Check whether a local summary sheet is an ELECTRA sheet, going by its path
+
+    :param dir_entry: Spreadsheet DirEntry object
+    :type dir_entry: os.DirEntry
+    :rtype: bool
+    """
+    return ELECTRA_PATH_PATTERN.match(dir_entry.path) is not None
+
+
+class SummarySheetMetadata:
+    """
+    Extract the UMMAP ID, visit number, and REDCap event name of summary sheets from their names and folder paths
+
+    Sibling sheets share the "Visit N" folder their visit number comes from, so visit numbers are memoized per folder:
+    by parent folder ID for Box items, whose folder path otherwise has to be rebuilt from `path_collection` for every
+    item, and by parent directory for local files.
+
+    Without a study, a sheet's naming scheme tells whether it's an ELECTRA sheet whose visit is looked up in the visit
+    index; with one, the study's `event_mapping` and `ummap_id_regex` apply to every sheet.
+    """
+
+    def __init__(self, electra_visit_index, study=None):
+        """
+        :param electra_visit_index: Index of ELECTRA visits from `build_electra_visit_index`, or of `study`'s visits
+        :type electra_visit_index: FrozenDict
+        :param study: Study every sheet extracted from belongs to
+        :type study: Study
+        """
+        self.electra_visit_index = electra_visit_index
+        self.study = study
+        self.visit_index_event = study.visit_index_event if study is not None else "sv{visit_num}_arm_1"
+        self._folder_visit_nums = {}
+
+    @staticmethod
+    def _search_visit_num(path):
+        visit_match = VISIT_NUM_PATTERN.search(path)
+        if visit_match is None:
+            raise ValueError(f"No visit number in path \"{path}\"")
+        return int(visit_match.group(1))
+
+    def box_visit_num(self, box_item):
+        """
+        Get visit number from the folder path of a Box summary sheet
+
+        :param box_item: Box File object with `path_collection` field
+        :rtype: int
+        """
+        path_entries = box_item.path_collection['entries']
+        folder_key = path_entries[-1].id if path_entries else None
+        if folder_key not in self._folder_visit_nums:
+            self._folder_visit_nums[folder_key] = \
+                self._search_visit_num("".join(f"/{path_item.name}" for path_item in path_entries))
+        return self._folder_visit_nums[folder_key]
+
+    def local_visit_num(self, dir_entry):
+        """
+        Get visit number from the path of a local summary sheet
+
+        :param dir_entry: Spreadsheet DirEntry object
+        :type dir_entry: os.DirEntry
+        :rtype: int
+        """
+        # a visit number in the file name comes last in the path, so it wins over the folders'
+        if VISIT_NUM_PATTERN.search(dir_entry.name):
+            return self._search_visit_num(dir_entry.name)
+        folder_key = os.path.dirname(dir_entry.path)
+        if folder_key not in self._folder_visit_nums:
+            self._folder_visit_nums[folder_key] = self._search_visit_num(folder_key)
+        return self._folder_visit_nums[folder_key]
+
+    @staticmethod
+    def box_ummap_id(box_item):
+        """
+        Get normalized UMMAP ID, and whether it's an ELECTRA sheet, from the name of a Box summary sheet
+
+        :param box_item: Box File object
+        :return: normalized UMMAP ID and whether the sheet is an ELECTRA sheet
+        :rtype: (str, bool)
+        """
+        electra_box_item = True
+        id_match = ELECTRA_SHEET_NAME_PATTERN.match(box_item.name)
+        if id_match is None:
+            electra_box_item = False
+            id_match = UMMAP_SHEET_NAME_PATTERN.match(box_item.name)
+        if id_match is None:
+            raise ValueError(f"No UMMAP ID in name \"{box_item.name}\"")
+        return normalize_ummap_id(int(id_match.group(1))), electra_box_item
+
+    @staticmethod
+    def local_ummap_id(dir_entry):
+        """
+        Get normalized UMMAP ID, and whether it's an ELECTRA sheet, from the path of a local summary sheet
+
+        :param dir_entry: Spreadsheet DirEntry object
+        :type dir_entry: os.DirEntry
+        :return: normalized UMMAP ID and whether the sheet is an ELECTRA sheet
+        :rtype: (str, bool)
+        """
+        electra_dir_entry = is_electra_dir_entry(dir_entry)
+        if not electra_dir_entry:
+            id_match = UMMAP_SHEET_PATH_PATTERN.search(dir_entry.path)
+            if id_match is None:
+                raise ValueError(f"No UMMAP ID in path \"{dir_entry.path}\"")
+            id_str = id_match.group(1)
+        else:
+            id_match = ELECTRA_SHEET_PATH_PATTERN.search(dir_entry.path)
+            if id_match is None:
+                raise ValueError(f"No UMMAP ID in path \"{dir_entry.path}\"")
+            if id_match.group(1) != id_match.group(2):
+                raise AssertionError(f"UMMAP IDs from {dir_entry.path} don't match")
+            id_str = id_match.group(1)
+        return normalize_ummap_id(int(id_str)), electra_dir_entry
+
+    def _study_ummap_id(self, sheet_name, extract_ummap_id, item):
+        """
+        Get normalized UMMAP ID with the study's `ummap_id_regex`, or else from the sheet's naming scheme
+        """
+        if self.study.ummap_id_regex is None:
+            return extract_ummap_id(item)[0]
+        id_match = self.study.ummap_id_regex.search(sheet_name)
+        if id_match is None:
+            raise ValueError(f"No UMMAP ID in name \"{sheet_name}\" for study \"{self.study.name}\"")
+        return normalize_ummap_id(int(id_match.group(1)))
+
+    def get_redcap_event_name(self, ummap_id, visit_num, electra_sheet):
+        """
+        Get REDCap event name of a UMMAP or ELECTRA visit
+
+        :param ummap_id: Normalized UMMAP ID
+        :type ummap_id: str
+        :param visit_num: Visit number from the sheet's folder path
+        :type visit_num: int
+        :param electra_sheet: Whether the sheet is an ELECTRA sheet, or a sheet of a study mapped by visit index,
+            whose visit number is a visit of its own study
+        :type electra_sheet: bool
+        :return: REDCap event name, or `None` if the visit has no matching UMMAP visit
+        :rtype: str
+        """
+        if not electra_sheet:
+            return f"visit_{visit_num}_arm_1"
+        ummap_visit_value = \
+            self.electra_visit_index.get((ummap_id, self.visit_index_event.format(visit_num=visit_num)))
+        if ummap_visit_value is None:
+            return None
+        return f"visit_{ummap_visit_value}_arm_1"
+
+    def box_redcap_event_name(self, box_item):
+        """
+        Get REDCap event name from Box item name and path
+
+        :param box_item: Box File object with `path_collection` field
+        :rtype: str
+        """
+        if self.study is None:
+            ummap_id, electra_box_item = self.box_ummap_id(box_item)
+            return self.get_redcap_event_name(ummap_id, self.box_visit_num(box_item), electra_box_item)
+        return self.get_redcap_event_name(self._study_ummap_id(box_item.name, self.box_ummap_id, box_item),
+                                          self.box_visit_num(box_item), self.study.event_mapping == "visit_index")
+
+    def local_redcap_event_name(self, dir_entry):
+        """
+        Get REDCap event name from local spreadsheet path
+
+        :param dir_entry: Spreadsheet DirEntry object
+        :type dir_entry: os.DirEntry
+        :rtype: str
+        """
+        if self.study is None:
+            ummap_id, electra_dir_entry = self.local_ummap_id(dir_entry)
+            return self.get_redcap_event_name(ummap_id, self.local_visit_num(dir_entry), electra_dir_entry)
+        return self.get_redcap_event_name(self._study_ummap_id(dir_entry.name, self.local_ummap_id, dir_entry),
+                                          self.local_visit_num(dir_entry), self.study.event_mapping == "visit_index")
@@ -0,0 +1,240 @@
+import io
+from collections import deque
+import openpyxl
+import pandas as pd
+from openpyxl.cell.cell import ERROR_CODES
+
+
+# String cell values `pd.read_excel` treats as missing by default; the openpyxl reader does the same so both readers
+# hand back identical raw values
+EXCEL_NA_STRINGS = frozenset([
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+])
+
+
+def build_anchor_index(summ_sheet_df, parse_map):
+    """
+    Build index of anchor strings to row and column indices of their first match in `summ_sheet_df`
+
+    Cells are searched column by column, each from the top, but the sheet is scanned once for all anchors: distinct
+    cell values are prefiltered against the parse map's single alternation of every anchor, so only the few cells that
+    match some anchor are tested against each one.
+
+    :param summ_sheet_df: DataFrame of summary sheet cells as strings
+    :type summ_sheet_df: pandas.DataFrame
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :return: dict of anchor strings to (row index, column index); anchors not found are left out
+    :rtype: dict[str, (int, int)]
+    """
+    anchor_index = {}
+    if not parse_map.anchor_plans or summ_sheet_df.empty:
+        return anchor_index
+
+    # flatten cells column by column, keeping the first position of each distinct value
+    n_rows = summ_sheet_df.shape[0]
+    cell_values = pd.Series(summ_sheet_df.to_numpy(dtype=object).ravel(order="F"))
+    cell_values = cell_values[cell_values.notna()].astype(str).drop_duplicates()
+
+    # keep only values that match at least one anchor
+    candidate_values = cell_values[cell_values.str.match(parse_map.any_anchor_regex)]
+
+    for anchor_plan in parse_map.anchor_plans:
+        for cell_pos, cell_value in candidate_values.items():
+            if anchor_plan.regex.match(cell_value):
+                anchor_index[anchor_plan.anchor] = \
+                    (summ_sheet_df.index[cell_pos % n_rows], summ_sheet_df.columns[cell_pos // n_rows])
+                break
+
+    return anchor_index
+
+
+def extract_df_raw_field_values(summ_sheet_df, parse_map):
+    """
+    Extract raw cell values for each parse map field from a summary sheet dataframe
+
+    :param summ_sheet_df: DataFrame of summary sheet cells as strings
+    :type summ_sheet_df: pandas.DataFrame
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :return: dict of field names to raw string values (`None` for empty cells); fields whose anchor isn't found are
+        left out
+    :rtype: dict[str, str]
+    """
+    anchor_index = build_anchor_index(summ_sheet_df, parse_map)
+
+    raw_values = {}
+    for anchor_plan in parse_map.anchor_plans:
+        if anchor_plan.anchor not in anchor_index:
+            continue
+        anchor_row_idx, anchor_col_idx = anchor_index[anchor_plan.anchor]
+        for field_plan in anchor_plan.field_plans:
+            row_idx, col_idx = anchor_row_idx + field_plan.row_diff, anchor_col_idx + field_plan.col_diff
+            if row_idx in summ_sheet_df.index and col_idx in summ_sheet_df.columns:
+                raw_value = summ_sheet_df.loc[row_idx, col_idx]
+                raw_values[field_plan.field] = None if pd.isna(raw_value) else raw_value
+            else:
+                raw_values[field_plan.field] = None
+
+    return raw_values
+
+
+def pandas_read_raw_field_values(sheet_file, parse_map):
+    """
+    Read raw field values from the first worksheet of a summary sheet by loading it whole with `pd.read_excel`
+
+    :param sheet_file: Path or file-like object of summary sheet .xlsx file
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :return: dict of field names to raw string values, or `None` if the worksheet is empty
+    :rtype: dict[str, str]
+    """
+    summ_sheet_df = pd.read_excel(sheet_file, sheet_name=0, header=None, dtype=str)
+    if summ_sheet_df.empty:
+        return None
+
+    return extract_df_raw_field_values(summ_sheet_df, parse_map)
+
+
+def _openpyxl_value_to_str(value):
+    """
+    Convert an openpyxl cell value to the string `pd.read_excel(..., dtype=str)` would give, or `None` if missing
+    """
+    if value is None:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    value_str = str(value)
+    if value_str in EXCEL_NA_STRINGS or value_str in ERROR_CODES:
+        return None
+    return value_str
+
+
+def openpyxl_read_raw_field_values(sheet_file, parse_map):
+    """
+    Read raw field values from the first worksheet of a summary sheet by streaming its rows in read-only mode
+
+    Anchors are found at their first match column by column, like `build_anchor_index`, so an anchor matching
+    several cells gives the same cell as `pandas_read_raw_field_values`, e.g., "Speed Attn Task - Color" also matches
+    "Speed Attn Task - Color-Word". As rows stream in, a match can still be beaten by one in an earlier column further
+    down, so rows are read to the end unless every anchor has matched in the first column and every field's target row
+    has been reached. Rows aren't kept: each match takes the cells its fields point to from the current row, from the
+    few earlier rows that negative `row_diff`s reach, or from later rows as they stream in.
+
+    :param sheet_file: Path or file-like object of summary sheet .xlsx file
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :return: dict of field names to raw string values, or `None` if the worksheet is empty
+    :rtype: dict[str, str]
+    """
+    def get_row_value(sheet_row, col_idx):
+        return sheet_row[col_idx] if 0 <= col_idx < len(sheet_row) else None
+
+    workbook = openpyxl.load_workbook(sheet_file, read_only=True, data_only=True, keep_links=False)
+    try:
+        worksheet = workbook.worksheets[0]
+        worksheet.reset_dimensions()
+
+        # (column index, row index) of each anchor's first match column by column so far, and its fields' values
+        anchor_matches = {}
+        anchor_values = {}
+        # row index to (anchor, match, field, column index) of field cells in rows not read yet
+        pending_cells = {}
+        # earlier rows that fields with a negative row_diff point to
+        earlier_rows = deque(maxlen=max([-field_plan.row_diff for field_plan in parse_map.field_plans] + [0]))
+        n_anchors = len(parse_map.anchor_plans)
+        # anchors matched in the first column, where no later row can give an earlier match
+        settled_anchor_plans = []
+        last_needed_row_idx = 0
+        is_empty = True
+        for row_idx, row in enumerate(worksheet.iter_rows(values_only=True)):
+            sheet_row = [_openpyxl_value_to_str(value) for value in row]
+            for anchor, anchor_match, field, col_idx in pending_cells.pop(row_idx, ()):
+                # a later match of the anchor replaces this one's values
+                if anchor_matches[anchor] == anchor_match:
+                    anchor_values[anchor][field] = get_row_value(sheet_row, col_idx)
+            for col_idx, cell_value in enumerate(sheet_row):
+                if cell_value is None:
+                    continue
+                is_empty = False
+                if len(settled_anchor_plans) == n_anchors or not parse_map.any_anchor_regex.match(cell_value):
+                    continue
+                for anchor_plan in parse_map.anchor_plans:
+                    anchor_match = anchor_matches.get(anchor_plan.anchor)
+                    # rows come in order, so a match in the same or a later column than the one held comes after it
+                    if anchor_match is not None and anchor_match[0] <= col_idx:
+                        continue
+                    if anchor_plan.regex.match(cell_value):
+                        anchor_match = (col_idx, row_idx)
+                        anchor_matches[anchor_plan.anchor] = anchor_match
+                        field_values = anchor_values[anchor_plan.anchor] = {}
+                        for field_plan in anchor_plan.field_plans:
+                            field_row_idx = row_idx + field_plan.row_diff
+                            field_col_idx = col_idx + field_plan.col_diff
+                            field_values[field_plan.field] = None
+                            if field_row_idx == row_idx:
+                                field_values[field_plan.field] = get_row_value(sheet_row, field_col_idx)
+                            elif field_row_idx > row_idx:
+                                pending_cells.setdefault(field_row_idx, []).append(
+                                    (anchor_plan.anchor, anchor_match, field_plan.field, field_col_idx))
+                            elif field_row_idx >= row_idx - len(earlier_rows):
+                                field_values[field_plan.field] = \
+                                    get_row_value(earlier_rows[field_row_idx - row_idx], field_col_idx)
+                        if col_idx == 0:
+                            settled_anchor_plans.append(anchor_plan)
+                            last_needed_row_idx = max(last_needed_row_idx, row_idx + anchor_plan.max_row_diff)
+            # stop once every anchor is settled and the rows their fields point to have been read
+            if len(settled_anchor_plans) == n_anchors and row_idx >= last_needed_row_idx:
+                break
+            if earlier_rows.maxlen:
+                earlier_rows.append(sheet_row)
+    finally:
+        workbook.close()
+
+    if is_empty:
+        return None
+
+    raw_values = {}
+    for anchor_plan in parse_map.anchor_plans:
+        if anchor_plan.anchor in anchor_values:
+            raw_values.update(anchor_values[anchor_plan.anchor])
+
+    return raw_values
+
+
+# Summary sheet readers selectable with `sheet_reader` in `config.cfg`
+SUMM_SHEET_READERS = {
+    "openpyxl": openpyxl_read_raw_field_values,
+    "pandas": pandas_read_raw_field_values,
+}
+
+
+def read_raw_field_values(sheet_file, parse_map, nss_logger, sheet_reader="openpyxl"):
+    """
+    Read raw field values from a summary sheet with the chosen reader, falling back to the pandas reader if it fails
+
+    :param sheet_file: Path or contents of summary sheet .xlsx file
+    :type sheet_file: str | bytes
+    :param parse_map: Compiled parse map
+    :type parse_map: ParseMap
+    :param nss_logger: Logger object for writing to app log
+    :type nss_logger: logging.Logger
+    :param sheet_reader: Key of reader in `SUMM_SHEET_READERS`
+    :type sheet_reader: str
+    :return: dict of field names to raw string values, or `None` if the worksheet is empty
+    :rtype: dict[str, str]
+    """
+    if sheet_reader not in SUMM_SHEET_READERS:
+        raise ValueError(f"Unexpected sheet reader \"{sheet_reader}\"; expected one of {list(SUMM_SHEET_READERS)}")
+
+    def open_sheet_file():
+        return io.BytesIO(sheet_file) if isinstance(sheet_file, bytes) else sheet_file
+
+    if sheet_reader != "pandas":
+        try:
+            return SUMM_SHEET_READERS[sheet_reader](open_sheet_file(), parse_map)
+        except Exception as e:
+            nss_logger.info(f"{sheet_reader} reader failed; falling back to pandas reader; {e}")
+
+    return pandas_read_raw_field_values(open_sheet_file(), parse_map)
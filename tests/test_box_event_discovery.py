@@ -0,0 +1,211 @@
+import copy
+import os
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from benchmark_scrape import FakeBoxItem, get_fake_box_root
+from box_event_discovery import *
+from regex_target_dir_entries import extract_regexed_box_subitems
+
+
+SUBDIRS_REGEX = r'^Summaries$|^Visit \d+$'
+XLSX_REGEX = r'^\d{4} Score Summary \d{4}\.xlsx$'
+BOX_ITEM_FIELDS = ("type", "id", "etag", "name", "path_collection")
+
+
+class FakeBoxEventsClient:
+    """
+    Box client answering events requests from fixed pages, keyed by the stream position each page starts at, and file
+    requests from a dict of Box items
+    """
+
+    def __init__(self, event_pages, files):
+        self.event_pages = event_pages
+        self.files = files
+        self.requested_positions = []
+        self.fetched_file_ids = []
+        self.fetched_folder_ids = []
+
+    def events(self):
+        return self
+
+    def get_events(self, limit=100, stream_position=0):
+        self.requested_positions.append(stream_position)
+        entries, next_stream_position = self.event_pages[stream_position]
+        assert len(entries) <= limit
+        return {'entries': entries, 'next_stream_position': next_stream_position}
+
+    def file(self, file_id):
+        self.fetched_file_ids.append(file_id)
+        box_file = self.files[file_id]
+        return SimpleNamespace(get=lambda fields=None: box_file)
+
+    def folder(self, folder_id):
+        self.fetched_folder_ids.append(folder_id)
+        box_folder = self.files[folder_id]
+        return SimpleNamespace(get=lambda fields=None: box_folder)
+
+
+def box_event(event_type, source):
+    return {'event_type': event_type, 'source': source}
+
+
+class TestDiscoverBoxEventsChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root_path = self.temp_dir.name
+        for visit_dir, sheet_name in (("Visit 1", "1001 Score Summary 2020.xlsx"),
+                                      ("Visit 1", "1002 Score Summary 2020.xlsx"),
+                                      ("Visit 2", "1001 Score Summary 2021.xlsx")):
+            self.write_file(os.path.join("Summaries", visit_dir, sheet_name))
+        self.write_file(os.path.join("Archive", "1003 Score Summary 2019.xlsx"))
+
+        self.box_items = self.crawl()
+        self.events_state = load_box_events_state(os.path.join(self.root_path, "missing.json"), "0",
+                                                  SUBDIRS_REGEX, XLSX_REGEX)
+        set_box_events_state_items(self.events_state, 100, self.box_items.values())
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_file(self, relative_path, contents=b"xlsx"):
+        file_path = os.path.join(self.root_path, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as box_file:
+            box_file.write(contents)
+
+    def crawl(self):
+        box_items_list = extract_regexed_box_subitems(get_fake_box_root(self.root_path, 0), SUBDIRS_REGEX, XLSX_REGEX,
+                                                      BOX_ITEM_FIELDS)
+        return {box_item.id: box_item for box_item in box_items_list}
+
+    def discover(self, event_pages, files=None, limit=2):
+        box_client = FakeBoxEventsClient(event_pages, files or {})
+        changes = discover_box_events_changes(box_client, self.events_state, "0", SUBDIRS_REGEX, XLSX_REGEX,
+                                              BOX_ITEM_FIELDS, limit)
+        return box_client, changes
+
+    def test_file_events(self):
+        visit_1_path = os.path.join("Summaries", "Visit 1")
+        self.write_file(os.path.join(visit_1_path, "1004 Score Summary 2022.xlsx"))
+        self.write_file(os.path.join(visit_1_path, "1002 Score Summary 2020.xlsx"), b"edited xlsx")
+        self.write_file(os.path.join("Archive", "1005 Score Summary 2022.xlsx"))
+        box_items = self.crawl()
+        created_id = os.path.join(visit_1_path, "1004 Score Summary 2022.xlsx")
+        modified_id = os.path.join(visit_1_path, "1002 Score Summary 2020.xlsx")
+        deleted_id = os.path.join("Summaries", "Visit 2", "1001 Score Summary 2021.xlsx")
+        root_folder = get_fake_box_root(self.root_path, 0)
+        archive_folder = FakeBoxItem("folder", "Archive", "Archive", os.path.join(self.root_path, "Archive"),
+                                     [root_folder], 0)
+        archive_item = FakeBoxItem("file", os.path.join("Archive", "1005 Score Summary 2022.xlsx"),
+                                   "1005 Score Summary 2022.xlsx",
+                                   os.path.join(self.root_path, "Archive", "1005 Score Summary 2022.xlsx"),
+                                   [root_folder, archive_folder], 0)
+
+        _, changes = self.discover({
+            100: ([box_event("ITEM_UPLOAD", box_items[created_id]),
+                   box_event("ITEM_UPLOAD", archive_item)], 101),
+            101: ([box_event("ITEM_UPLOAD", box_items[modified_id])], 102),
+            102: ([box_event("ITEM_TRASH", self.box_items[deleted_id])], 103),
+            103: ([], 104),
+        })
+
+        self.assertEqual(changes, {'created': [created_id], 'modified': [modified_id], 'deleted': [deleted_id]})
+        self.assertEqual(self.events_state['stream_position'], 104)
+        self.assertEqual(set(self.events_state['items']), set(box_items) - {deleted_id})
+        self.assertEqual(self.events_state['items'][modified_id]['etag'], box_items[modified_id].etag)
+
+    def test_short_page_keeps_paging(self):
+        box_items_list = list(self.box_items.values())
+        box_client, changes = self.discover({
+            100: ([box_event("ITEM_UPLOAD", box_items_list[0])], 101),
+            101: ([box_event("ITEM_TRASH", box_items_list[1])], 102),
+            102: ([], 103),
+        })
+
+        self.assertEqual(box_client.requested_positions, [100, 101, 102])
+        self.assertEqual(changes['deleted'], [box_items_list[1].id])
+        self.assertEqual(self.events_state['stream_position'], 103)
+
+    def test_created_then_trashed_file_is_no_change(self):
+        self.write_file(os.path.join("Summaries", "Visit 2", "1006 Score Summary 2022.xlsx"))
+        created_item = self.crawl()[os.path.join("Summaries", "Visit 2", "1006 Score Summary 2022.xlsx")]
+
+        _, changes = self.discover({
+            100: ([box_event("ITEM_UPLOAD", created_item), box_event("ITEM_TRASH", created_item)], 101),
+            101: ([], 102),
+        })
+
+        self.assertEqual(changes, {'created': [], 'modified': [], 'deleted': []})
+        self.assertEqual(set(self.events_state['items']), set(self.box_items))
+
+    def test_source_without_path_collection_is_fetched(self):
+        modified_item = next(iter(self.box_items.values()))
+        bare_source = SimpleNamespace(type="file", id=modified_item.id, name=modified_item.name)
+
+        box_client, changes = self.discover({
+            100: ([box_event("ITEM_UPLOAD", bare_source)], 101),
+            101: ([], 102),
+        }, files={modified_item.id: modified_item})
+
+        self.assertEqual(box_client.fetched_file_ids, [modified_item.id])
+        self.assertEqual(changes['modified'], [modified_item.id])
+
+    def test_event_on_known_folder_needs_full_crawl(self):
+        visit_folder = self.box_items[os.path.join("Summaries", "Visit 2", "1001 Score Summary 2021.xlsx")] \
+            .path_collection['entries'][-1]
+        events_state = copy.deepcopy(self.events_state)
+
+        _, changes = self.discover({
+            100: ([box_event("ITEM_RENAME", visit_folder)], 101),
+            101: ([], 102),
+        })
+
+        self.assertIsNone(changes)
+        self.assertEqual(self.events_state, events_state)
+
+    def test_folder_moved_into_tree_needs_full_crawl(self):
+        root_folder = get_fake_box_root(self.root_path, 0)
+        moved_folder = SimpleNamespace(type="folder", id="Visit 3", name="Visit 3",
+                                       path_collection={'entries': [root_folder]})
+
+        _, changes = self.discover({
+            100: ([box_event("ITEM_MOVE", moved_folder)], 101),
+            101: ([], 102),
+        })
+
+        self.assertIsNone(changes)
+
+    def test_renamed_folder_without_path_collection_is_fetched(self):
+        summaries_folder = self.box_items[os.path.join("Summaries", "Visit 1", "1001 Score Summary 2020.xlsx")] \
+            .path_collection['entries'][1]
+        renamed_folder = SimpleNamespace(type="folder", id="Visit 4", name="Visit 4",
+                                         path_collection={'entries': [summaries_folder.path_collection['entries'][0],
+                                                                      summaries_folder]})
+        bare_source = SimpleNamespace(type="folder", id=renamed_folder.id, name=renamed_folder.name)
+
+        box_client, changes = self.discover({
+            100: ([box_event("ITEM_RENAME", bare_source)], 101),
+            101: ([], 102),
+        }, files={renamed_folder.id: renamed_folder})
+
+        self.assertEqual(box_client.fetched_folder_ids, [renamed_folder.id])
+        self.assertIsNone(changes)
+
+    def test_event_on_folder_outside_tree_is_skipped(self):
+        other_root = SimpleNamespace(type="folder", id="other", name="Other")
+        other_folder = SimpleNamespace(type="folder", id="Archive", name="Archive",
+                                       path_collection={'entries': [other_root]})
+
+        _, changes = self.discover({
+            100: ([box_event("ITEM_RENAME", other_folder)], 101),
+            101: ([], 102),
+        })
+
+        self.assertEqual(changes, {'created': [], 'modified': [], 'deleted': []})
+        self.assertEqual(self.events_state['stream_position'], 102)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import logging
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import neuropsych_summary_scrape_helpers
+from neuropsych_summary_scrape_helpers import *
+from regex_target_dir_entries import extract_regexed_dir_entries
+
+
+SUBDIRS_REGEX = r'^Summaries$|^ELECTRA$|^Visit \d+$'
+XLSX_REGEX = r'^.*\.xlsx$'
+
+
+class TestDedupeLocalDirEntries(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.root_path = self.temp_dir.name
+        self.write_file(os.path.join("Summaries", "Visit 1", "1001 Score Summary 2020.xlsx"), b"sheet 1")
+        self.write_file(os.path.join("Summaries", "Visit 2", "1001 Score Summary 2020.xlsx"), b"sheet 1")
+        self.write_file(os.path.join("Summaries", "Visit 1", "1002 Score Summary 2020.xlsx"), b"sheet 2")
+        self.scrape_cache = {'parse_map_digest': "", 'items': {}}
+        self.nss_logger = logging.getLogger("neuropsych_summary_scrape_test")
+        self.nss_logger.addHandler(logging.NullHandler())
+        self.nss_logger.propagate = False
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_file(self, relative_path, contents):
+        file_path = os.path.join(self.root_path, relative_path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, "wb") as sheet_file:
+            sheet_file.write(contents)
+
+    def dedupe(self):
+        """
+        Crawl and dedupe the summary sheets, counting the files hashed
+
+        :return: names of folders of kept sheets, and paths of hashed files
+        """
+        dir_entries_list = extract_regexed_dir_entries(self.root_path, SUBDIRS_REGEX, XLSX_REGEX)
+        with mock.patch.object(neuropsych_summary_scrape_helpers, "hash_file_sha1",
+                               wraps=hash_file_sha1) as hash_file_sha1_mock:
+            kept_dir_entries_list = dedupe_local_dir_entries(dir_entries_list, self.nss_logger, self.scrape_cache)
+        kept_paths = [os.path.relpath(dir_entry.path, self.root_path) for dir_entry in kept_dir_entries_list]
+        hashed_paths = [os.path.relpath(call.args[0], self.root_path) for call in hash_file_sha1_mock.call_args_list]
+        return kept_paths, hashed_paths
+
+    def test_duplicates_are_skipped(self):
+        kept_paths, hashed_paths = self.dedupe()
+
+        self.assertEqual(sorted(kept_paths), [os.path.join("Summaries", "Visit 1", "1001 Score Summary 2020.xlsx"),
+                                              os.path.join("Summaries", "Visit 1", "1002 Score Summary 2020.xlsx")])
+        self.assertEqual(len(hashed_paths), 3)
+
+    def test_unchanged_files_are_not_hashed_again(self):
+        first_kept_paths, _ = self.dedupe()
+
+        kept_paths, hashed_paths = self.dedupe()
+
+        self.assertEqual(kept_paths, first_kept_paths)
+        self.assertEqual(hashed_paths, [])
+
+    def test_changed_file_is_hashed_again(self):
+        self.dedupe()
+        changed_path = os.path.join("Summaries", "Visit 2", "1001 Score Summary 2020.xlsx")
+        self.write_file(changed_path, b"sheet 1, edited")
+
+        kept_paths, hashed_paths = self.dedupe()
+
+        self.assertEqual(hashed_paths, [changed_path])
+        self.assertIn(changed_path, kept_paths)
+
+    def test_cached_fields_keep_hash(self):
+        self.dedupe()
+        dir_entry = extract_regexed_dir_entries(self.root_path, SUBDIRS_REGEX, XLSX_REGEX)[0]
+        dir_entry_etag = get_local_file_etag(dir_entry)
+        sha1 = get_scrape_cache_sha1(self.scrape_cache, dir_entry.path, dir_entry_etag)
+        # a hashed file whose fields aren't cached yet still has to be parsed
+        self.assertFalse(is_scrape_cache_hit(self.scrape_cache, dir_entry.path, dir_entry_etag))
+
+        set_scrape_cache_fields(self.scrape_cache, dir_entry.path, dir_entry_etag, {'ptid': "1001"})
+
+        self.assertTrue(is_scrape_cache_hit(self.scrape_cache, dir_entry.path, dir_entry_etag))
+        self.assertEqual(get_scrape_cache_sha1(self.scrape_cache, dir_entry.path, dir_entry_etag), sha1)
+        self.assertIsNone(get_scrape_cache_sha1(self.scrape_cache, dir_entry.path, "0-0"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from redcap_diff import *
+
+
+def build_extract_df(rows):
+    return pd.DataFrame(rows, columns=["ptid", "redcap_event_name", "mocatots", "udsbentc"]) \
+        .astype({'mocatots': "Int64", 'udsbentc': "Int64"})
+
+
+class TestRedcapImportedSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.temp_dir.name, "redcap_imported_snapshot.json")
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def import_extract(self, extract_df, failed_record_ids=()):
+        """
+        Diff an extract against the snapshot and fold the rows sent into it, as a run with `redcap_import_diff`
+        "imported" does
+
+        :return: DataFrame of rows sent
+        """
+        snapshot_df = load_redcap_imported_snapshot(self.snapshot_path)
+        delta_df, _ = diff_redcap_records(extract_df, snapshot_df)
+        save_redcap_imported_snapshot(self.snapshot_path,
+                                      update_redcap_imported_snapshot(snapshot_df, delta_df, list(failed_record_ids)))
+        return delta_df
+
+    def test_no_snapshot(self):
+        self.assertIsNone(load_redcap_imported_snapshot(self.snapshot_path))
+
+    def test_unchanged_rows_are_not_sent_again(self):
+        extract_df = build_extract_df([["UM00001001", "visit_1_arm_1", 26, 15],
+                                       ["UM00001002", "visit_1_arm_1", 28, None]])
+        self.assertEqual(len(self.import_extract(extract_df)), 2)
+
+        self.assertTrue(self.import_extract(extract_df).empty)
+
+    def test_changed_field_is_sent_and_kept(self):
+        self.import_extract(build_extract_df([["UM00001001", "visit_1_arm_1", 26, 15]]))
+
+        delta_df = self.import_extract(build_extract_df([["UM00001001", "visit_1_arm_1", 27, 15]]))
+
+        self.assertEqual(delta_df.columns.tolist(), ["ptid", "redcap_event_name", "mocatots"])
+        self.assertEqual(load_redcap_imported_snapshot(self.snapshot_path).to_dict(orient="records"),
+                         [{'ptid': "UM00001001", 'redcap_event_name': "visit_1_arm_1", 'mocatots': "27",
+                           'udsbentc': "15"}])
+
+    def test_failed_records_are_sent_again(self):
+        extract_df = build_extract_df([["UM00001001", "visit_1_arm_1", 26, 15],
+                                       ["UM00001002", "visit_1_arm_1", 28, 12]])
+        self.import_extract(extract_df, failed_record_ids=["UM00001002"])
+
+        delta_df = self.import_extract(extract_df)
+
+        self.assertEqual(delta_df['ptid'].tolist(), ["UM00001002"])
+        self.assertTrue(self.import_extract(extract_df).empty)
+
+    def test_duplicate_keys_keep_last_row(self):
+        extract_df = build_extract_df([["UM00001001", "visit_1_arm_1", 26, 15],
+                                       ["UM00001002", "visit_1_arm_1", 28, 12],
+                                       ["UM00001001", "visit_1_arm_1", 27, 15]])
+
+        snapshot_df = load_redcap_imported_snapshot(self.snapshot_path)
+        delta_df, diff_report = diff_redcap_records(extract_df, snapshot_df)
+        save_redcap_imported_snapshot(self.snapshot_path,
+                                      update_redcap_imported_snapshot(snapshot_df, delta_df, []))
+        delta_df, diff_report = diff_redcap_records(extract_df, load_redcap_imported_snapshot(self.snapshot_path))
+
+        self.assertEqual(diff_report['duplicate_rows'],
+                         [{'ptid': "UM00001001", 'redcap_event_name': "visit_1_arm_1"}])
+        self.assertTrue(delta_df.empty)
+        snapshot_df = load_redcap_imported_snapshot(self.snapshot_path)
+        self.assertEqual(dict(zip(snapshot_df['ptid'], snapshot_df['mocatots'])),
+                         {'UM00001001': "27", 'UM00001002': "28"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime
+
+import pandas as pd
+
+from benchmark_scrape import BENCHMARK_REDCAP_TOKENS, FakeRedcapServer
+from redcap_export import *
+
+
+REDCAP_FIELDS = ["ptid", "redcap_event_name", "form_date"]
+OLD_MODIFIED = "2020-01-01 00:00:00"
+
+
+class RecordingRedcapServer(FakeRedcapServer):
+    """
+    Fake REDCap API that records every request and, like REDCap, only lists records modified at or after
+    `dateRangeBegin` when it's passed
+    """
+
+    def __init__(self, redcap_records):
+        super().__init__(redcap_records, 0)
+        self.requests = []
+
+    def handle_request(self, request_dict):
+        with self._lock:
+            self.requests.append(request_dict)
+        if request_dict.get('dateRangeBegin'):
+            return 200, [{'ptid': record['ptid']} for record in self.redcap_records['ummap']
+                         if record['modified'] >= request_dict['dateRangeBegin']]
+        return super().handle_request(request_dict)
+
+    def get_record_id_batches(self):
+        """
+        Get the record IDs of each batch export request, in the order of their first record ID
+        """
+        return sorted([request_dict[key] for key in request_dict if key.startswith("records[")]
+                      for request_dict in self.requests if "records[0]" in request_dict)
+
+
+def build_records(n_ptids):
+    return [{'ptid': f"UM{ptid_num:08d}", 'redcap_event_name': f"visit_{visit_num}_arm_1",
+             'form_date': f"2020-0{visit_num}-01", 'modified': OLD_MODIFIED}
+            for ptid_num in range(1, n_ptids + 1) for visit_num in (1, 2)]
+
+
+def sort_records(records_df):
+    return records_df.sort_values(["ptid", "redcap_event_name"]).reset_index(drop=True)
+
+
+class TestExportRedcapDataframe(unittest.TestCase):
+
+    def setUp(self):
+        self.redcap_server = RecordingRedcapServer({'ummap': build_records(7), 'electra': []})
+        self.redcap_server.__enter__()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.temp_dir.name, "redcap_ummap_snapshot.json")
+
+    def tearDown(self):
+        self.redcap_server.__exit__(None, None, None)
+        self.temp_dir.cleanup()
+
+    def export(self, **kwargs):
+        return export_redcap_dataframe(self.redcap_server.api_uri, BENCHMARK_REDCAP_TOKENS['ummap'], REDCAP_FIELDS,
+                                       vp=False, **kwargs)
+
+    def test_batches_match_one_request(self):
+        one_batch_df = self.export(batch_size=100)
+        self.redcap_server.requests.clear()
+
+        batched_df = self.export(batch_size=2, max_workers=3)
+
+        pd.testing.assert_frame_equal(batched_df, one_batch_df)
+        self.assertEqual(len(one_batch_df), 14)
+        self.assertEqual(self.redcap_server.get_record_id_batches(),
+                         [["UM00000001", "UM00000002"], ["UM00000003", "UM00000004"],
+                          ["UM00000005", "UM00000006"], ["UM00000007"]])
+
+    def test_no_records(self):
+        self.redcap_server.redcap_records['ummap'] = []
+
+        records_df = self.export(batch_size=2)
+
+        self.assertTrue(records_df.empty)
+        self.assertEqual(list(records_df.columns), REDCAP_FIELDS)
+
+    def test_snapshot_exports_only_changed_records(self):
+        self.export(batch_size=2, snapshot_path=self.snapshot_path)
+        self.assertTrue(os.path.isfile(self.snapshot_path))
+
+        now = datetime.now().strftime(REDCAP_DATETIME_FORMAT)
+        ummap_records = self.redcap_server.redcap_records['ummap']
+        ummap_records[2].update(form_date="2021-02-01", modified=now)
+        ummap_records.append({'ptid': "UM00000008", 'redcap_event_name': "visit_1_arm_1",
+                              'form_date': "2021-03-01", 'modified': now})
+        self.redcap_server.requests.clear()
+
+        records_df = self.export(batch_size=2, snapshot_path=self.snapshot_path)
+
+        self.assertIsNotNone(self.redcap_server.requests[0].get('dateRangeBegin'))
+        self.assertEqual(self.redcap_server.get_record_id_batches(), [["UM00000002", "UM00000008"]])
+        expected_df = pd.DataFrame([{field: record[field] for field in REDCAP_FIELDS} for record in ummap_records])
+        pd.testing.assert_frame_equal(sort_records(records_df), sort_records(expected_df))
+
+    def test_full_refresh_drops_deleted_records(self):
+        self.export(snapshot_path=self.snapshot_path)
+        del self.redcap_server.redcap_records['ummap'][:2]
+
+        kept_df = self.export(snapshot_path=self.snapshot_path)
+        refreshed_df = self.export(snapshot_path=self.snapshot_path, full_refresh=True)
+
+        self.assertIn("UM00000001", set(kept_df['ptid']))
+        self.assertNotIn("UM00000001", set(refreshed_df['ptid']))
+        self.assertEqual(len(refreshed_df), 12)
+        self.assertNotIn("UM00000001", set(self.export(snapshot_path=self.snapshot_path)['ptid']))
+
+    def test_snapshot_with_other_fields_is_ignored(self):
+        save_redcap_snapshot(self.snapshot_path, ["ptid", "redcap_event_name"], "2999-01-01 00:00:00",
+                             pd.DataFrame({'ptid': ["UM00000099"], 'redcap_event_name': ["visit_1_arm_1"]}))
+
+        records_df = self.export(snapshot_path=self.snapshot_path)
+
+        self.assertIsNone(self.redcap_server.requests[0].get('dateRangeBegin'))
+        self.assertEqual(len(records_df), 14)
+        self.assertNotIn("UM00000099", set(records_df['ptid']))
+
+
+if __name__ == "__main__":
+    unittest.main()
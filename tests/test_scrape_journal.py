@@ -0,0 +1,133 @@
+import configparser
+import logging
+import os
+import tempfile
+import unittest
+
+import pandas as pd
+
+from benchmark_scrape import generate_synthetic_tree, plan_synthetic_sheets
+from neuropsych_summary_scrape_helpers import *
+from regex_target_dir_entries import extract_regexed_dir_entries
+
+
+APP_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+N_SHEETS = 8
+N_SHEETS_BEFORE_CRASH = 3
+
+
+class CrashingRowSink:
+    """
+    Row sink that raises once it's handed more than `n_rows` rows, standing in for a run killed partway through
+    """
+
+    def __init__(self, n_rows):
+        self.n_rows = n_rows
+        self.rows = []
+
+    def append(self, row_dict):
+        if len(self.rows) >= self.n_rows:
+            raise RuntimeError("Run killed")
+        self.rows.append(row_dict)
+
+
+class TestResumeFromScrapeJournal(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.temp_dir = tempfile.TemporaryDirectory()
+        cls.parse_map = load_parse_map(f"{APP_PATH}/resources/json/parse_map.json")
+        config = configparser.ConfigParser()
+        config.read(f"{APP_PATH}/resources/config/config.cfg.template")
+        sheets = plan_synthetic_sheets(N_SHEETS, 0.0, 3, 0)
+        cls.root_path = generate_synthetic_tree(cls.temp_dir.name, cls.parse_map, sheets, 0.1, 0)
+        cls.subdirs_regex = config.get('ummap', 'subdirs_regex')
+        cls.xlsx_regex = config.get('ummap', 'xlsx_regex')
+        cls.nss_logger = logging.getLogger("neuropsych_summary_scrape_test")
+        cls.nss_logger.addHandler(logging.NullHandler())
+        cls.nss_logger.propagate = False
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.temp_dir.cleanup()
+
+    def setUp(self):
+        self.dir_entries_list = extract_regexed_dir_entries(self.root_path, self.subdirs_regex, self.xlsx_regex)
+        self.journal_path = os.path.join(self.temp_dir.name, "scrape_journal_local.jsonl")
+        if os.path.isfile(self.journal_path):
+            os.remove(self.journal_path)
+
+    def open_journal(self, resume, parse_dict=None):
+        return ScrapeJournal(self.journal_path, parse_dict or self.parse_map.parse_dict, self.nss_logger, resume)
+
+    def build_accum_df(self, scrape_journal, row_sink=None):
+        try:
+            return local_build_accum_df(self.dir_entries_list, self.parse_map, FrozenDict(), self.nss_logger,
+                                        row_sink=row_sink, scrape_journal=scrape_journal)
+        finally:
+            scrape_journal.close()
+
+    def crash_run(self):
+        with self.assertRaises(RuntimeError):
+            self.build_accum_df(self.open_journal(resume=False), CrashingRowSink(N_SHEETS_BEFORE_CRASH))
+        # the sheet being journaled when the run was killed is cut short
+        with open(self.journal_path, "a") as journal_file:
+            journal_file.write('{"id": "cut short')
+
+    def get_journal_length(self):
+        scrape_journal = self.open_journal(resume=True)
+        scrape_journal.close()
+        return len(scrape_journal)
+
+    def get_journal_hits(self):
+        return get_run_metrics().counters.get("sheets.journal_hits", 0)
+
+    def test_resume_after_crash(self):
+        expected_df = self.build_accum_df(self.open_journal(resume=False))
+        self.crash_run()
+
+        scrape_journal = self.open_journal(resume=True)
+        # every sheet journaled before the crash, including the one whose row never reached the sink
+        self.assertEqual(len(scrape_journal), N_SHEETS_BEFORE_CRASH + 1)
+        journal_hits = self.get_journal_hits()
+        resumed_df = self.build_accum_df(scrape_journal)
+
+        self.assertEqual(self.get_journal_hits() - journal_hits, N_SHEETS_BEFORE_CRASH + 1)
+        pd.testing.assert_frame_equal(resumed_df, expected_df)
+        self.assertEqual(self.get_journal_length(), N_SHEETS)
+
+    def test_resume_reparses_changed_sheet(self):
+        self.crash_run()
+        changed_dir_entry = self.dir_entries_list[0]
+        changed_stat = os.stat(changed_dir_entry.path)
+        os.utime(changed_dir_entry.path, ns=(changed_stat.st_atime_ns, changed_stat.st_mtime_ns + 10 ** 9))
+        # DirEntry objects cache their stat, so crawl again to see the change
+        self.dir_entries_list = extract_regexed_dir_entries(self.root_path, self.subdirs_regex, self.xlsx_regex)
+
+        journal_hits = self.get_journal_hits()
+        self.build_accum_df(self.open_journal(resume=True))
+
+        self.assertEqual(self.get_journal_hits() - journal_hits, N_SHEETS_BEFORE_CRASH)
+
+    def test_changed_parse_map_starts_over(self):
+        self.crash_run()
+
+        parse_dict = dict(self.parse_map.parse_dict)
+        parse_dict.pop(next(iter(parse_dict)))
+        scrape_journal = self.open_journal(resume=True, parse_dict=parse_dict)
+        scrape_journal.close()
+
+        self.assertEqual(len(scrape_journal), 0)
+
+    def test_finished_run_removes_journal(self):
+        scrape_journal = self.open_journal(resume=False)
+        local_build_accum_df(self.dir_entries_list, self.parse_map, FrozenDict(), self.nss_logger,
+                             scrape_journal=scrape_journal)
+        scrape_journal.remove()
+
+        self.assertFalse(os.path.isfile(self.journal_path))
+        self.assertEqual(self.get_journal_length(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+import openpyxl
+
+from benchmark_scrape import generate_synthetic_tree, plan_synthetic_sheets
+from parse_map import ParseMap, load_parse_map
+from regex_target_dir_entries import extract_regexed_dir_entries
+from summary_sheet_readers import *
+
+
+APP_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def write_workbook(sheet_path, sheet_rows):
+    workbook = openpyxl.Workbook()
+    worksheet = workbook.active
+    for sheet_row in sheet_rows:
+        worksheet.append(sheet_row)
+    workbook.save(sheet_path)
+
+
+class TestOpenpyxlReader(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def assert_readers_agree(self, sheet_path, parse_map):
+        self.assertEqual(openpyxl_read_raw_field_values(sheet_path, parse_map),
+                         pandas_read_raw_field_values(sheet_path, parse_map))
+
+    def test_synthetic_sheets(self):
+        parse_map = load_parse_map(f"{APP_PATH}/resources/json/parse_map.json")
+        root_path = generate_synthetic_tree(self.temp_dir.name, parse_map, plan_synthetic_sheets(4, 0.5, 2, 0), 0.2, 0)
+        for dir_entry in extract_regexed_dir_entries(root_path, r".*", r".*\.xlsx$"):
+            self.assert_readers_agree(dir_entry.path, parse_map)
+
+    def test_fields_above_below_and_beyond_anchor(self):
+        parse_map = ParseMap({
+            'above': {'anchor': r"^Score", 'row_diff': -2, 'col_diff': 1, 'dtype': "str"},
+            'below': {'anchor': r"^Score", 'row_diff': 2, 'col_diff': 0, 'dtype': "str"},
+            'beyond': {'anchor': r"^Score", 'row_diff': 0, 'col_diff': 5, 'dtype': "str"},
+            'before_sheet': {'anchor': r"^Total", 'row_diff': -3, 'col_diff': 0, 'dtype': "str"},
+            'after_sheet': {'anchor': r"^Total", 'row_diff': 2, 'col_diff': 1, 'dtype': "str"},
+        })
+        sheet_path = os.path.join(self.temp_dir.name, "sheet.xlsx")
+        # "Score B" in the first column comes later but matches earlier column by column than "Score A"
+        write_workbook(sheet_path, [
+            [None, "a1", "a2"],
+            ["b0", "b1", "b2"],
+            [None, "Score A", "c2"],
+            ["Score B", "d1", "d2"],
+            ["e0", "e1", "e2"],
+            ["f0", "f1", "f2"],
+            ["Total", 12],
+        ])
+
+        self.assert_readers_agree(sheet_path, parse_map)
+        self.assertEqual(openpyxl_read_raw_field_values(sheet_path, parse_map),
+                         {'above': "b1", 'below': "f0", 'beyond': None, 'before_sheet': "Score B",
+                          'after_sheet': None})
+
+
+if __name__ == "__main__":
+    unittest.main()